@@ -1,6 +1,8 @@
+from bmp import read_image
 from common import IMAGES, QUALITIES, generate_path, DOCS_DIR
-from decoder import decoder
-from encoder import encoder
+from sweep import quality_sweep
+from sweep_runner import load_results, run_sweep
+import argparse
 import matplotlib.pyplot as plt
 import numpy as np
 import os
@@ -16,32 +18,18 @@ def analyze_image_with_parameters(image_path, quality_factors, downsampling_meth
         downsampling_methods (list): Lista de métodos de subamostragem a serem testados
     """
     # Carrega a imagem
-    image = plt.imread(image_path)
+    image = read_image(image_path)
     image_name = os.path.basename(image_path).split('.')[0]
 
     # Cria tabelas para armazenar os resultados
     results = []
 
-    # Processa a imagem com diferentes parâmetros
-    for quality_factor in quality_factors:
-        for downsampling in downsampling_methods:
+    # Processa a imagem com diferentes parâmetros. A transformada é calculada uma
+    # vez por método de subamostragem e reutilizada em todos os fatores de qualidade
+    for downsampling in downsampling_methods:
+        for quality_factor, decoded_img, _ in quality_sweep(image, quality_factors, downsampling=downsampling):
             print(f"\nProcessando {image_name} com QF={quality_factor}, Downsampling={downsampling}")
 
-            # Codifica a imagem
-            encoded_data, _ = encoder(
-                image,
-                quality_factor=quality_factor,
-                downsampling=downsampling,
-                return_intermidiate_values=True
-            )
-
-            # Decodifica a imagem
-            decoded_img = decoder(
-                encoded_data,
-                quality_factor=quality_factor,
-                downsampling=downsampling
-            )
-
             # Calcula a diferença absoluta
             diff = error_analysis.calculate_absolute_difference(image, decoded_img)
 
@@ -86,6 +74,9 @@ def analyze_image_with_parameters(image_path, quality_factors, downsampling_meth
 
             plt.close(fig)  # Fecha a figura para liberar memória
 
+    # Mesma ordem que percorrer os fatores de qualidade e depois os métodos
+    results.sort(key=lambda result: (quality_factors.index(result['quality_factor']), downsampling_methods.index(result['downsampling'])))
+
     return results
 
 def plot_quality_comparison(results, metric='psnr'):
@@ -191,17 +182,40 @@ def plot_downsampling_comparison(results, metric='psnr'):
 
 def main():
     """Função principal para análise de resultados."""
+    parser = argparse.ArgumentParser(description="Análise de resultados")
+    parser.add_argument('--results', default=os.path.join(DOCS_DIR, 'analise-resultados.csv'), help='Ficheiro de resultados (.csv ou .jsonl)')
+    parser.add_argument('--workers', type=int, default=None, help='Número de processos (por omissão: número de CPUs)')
+    parser.add_argument('--no-resume', action='store_true', help='Recalcula os resultados já existentes no ficheiro')
+    parser.add_argument('--difference-figures', action='store_true', help='Guarda também a figura de diferenças de cada combinação')
+    args = parser.parse_args()
+
     # Parâmetros a serem testados
     quality_factors = QUALITIES  # [75, 50, 25]
     downsampling_methods = ['4:2:0', '4:2:2']
 
-    # Lista para armazenar todos os resultados
+    # As métricas são calculadas em paralelo e escritas no ficheiro de resultados à
+    # medida que terminam; as combinações que já lá estão não são recalculadas
+    for result in run_sweep(IMAGES, args.results, quality_factors=quality_factors, downsamplings=downsampling_methods, workers=args.workers, resume=not args.no_resume):
+        print(f"Processado {result['image']} com QF={result['quality_factor']}, Downsampling={result['downsampling']}")
+
+    # As figuras de diferenças são geradas à parte, em série
+    if args.difference_figures:
+        for image_path in IMAGES:
+            analyze_image_with_parameters(image_path, quality_factors, downsampling_methods)
+
+    # Resultados da grelha, pela ordem das imagens, fatores de qualidade e métodos
+    results = {
+        (result['image'], result['quality_factor'], result['downsampling']): result
+        for result in load_results(args.results)
+        if result['error'] is None and result['interpolation'] == 'linear'
+    }
     all_results = []
-
-    # Processa cada imagem
     for image_path in IMAGES:
-        results = analyze_image_with_parameters(image_path, quality_factors, downsampling_methods)
-        all_results.extend(results)
+        for quality_factor in quality_factors:
+            for downsampling in downsampling_methods:
+                result = results.get((image_path, quality_factor, downsampling))
+                if result is not None:
+                    all_results.append(result | {'image': os.path.basename(image_path).split('.')[0]})
 
     # Plota gráficos comparativos
     plot_quality_comparison(all_results, 'psnr')
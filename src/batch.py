@@ -0,0 +1,208 @@
+from bmp import read_image
+from common import DEFAULT_DOWNSAMPLE, VALID_DOWNSAMPLES, VALID_DOWNSAMPLES_TYPE
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from multiprocessing import shared_memory
+from typing import Iterable, Iterator, Literal, NamedTuple
+import argparse
+import container
+import encoder
+import jfif
+import json
+import numpy as np
+import os
+import sys
+import time
+
+OUTPUT_FORMATS = ('container', 'jfif')
+OUTPUT_FORMAT_TYPE = Literal['container', 'jfif']
+OUTPUT_EXTENSIONS = {'container': '.icjp', 'jfif': '.jpeg'}
+
+class EncodeResult(NamedTuple):
+    path: str
+    output_path: str
+    input_size: int
+    output_size: int
+    seconds: float
+    # None when the file was encoded
+    error: str | None
+
+class _SharedImage(NamedTuple):
+    name: str
+    shape: tuple[int, ...]
+    dtype: str
+
+def find_images(root: str, extensions: Iterable[str] = ('.bmp',)) -> list[str]:
+    """
+    Returns the paths of the images under root, sorted.
+
+    Args:
+        root (str): Directory to search.
+        extensions (Iterable[str]): File extensions (lower case) to include.
+
+    Returns:
+        list[str]: Image paths.
+    """
+    extensions = tuple(extensions)
+
+    return sorted(
+        os.path.join(directory, name)
+        for directory, _, names in os.walk(root)
+        for name in names
+        if os.path.splitext(name)[1].lower() in extensions
+    )
+
+def _output_path(path: str, output_dir: str, root: str | None, output_format: OUTPUT_FORMAT_TYPE) -> str:
+    relative_path = os.path.relpath(path, root) if root is not None else os.path.basename(path)
+
+    return os.path.join(output_dir, os.path.splitext(relative_path)[0] + OUTPUT_EXTENSIONS[output_format])
+
+def _encode_shared(
+    shared_image: _SharedImage,
+    path: str,
+    output_path: str,
+    output_format: OUTPUT_FORMAT_TYPE,
+    quality_factor: int,
+    downsampling: VALID_DOWNSAMPLES_TYPE,
+) -> EncodeResult:
+    start = time.perf_counter()
+    shm = shared_memory.SharedMemory(name=shared_image.name)
+
+    try:
+        image = np.ndarray(shared_image.shape, dtype=shared_image.dtype, buffer=shm.buf)
+        # JPEG files are level shifted; doing it before quantization keeps the DC exact
+        level_shift = 128 if output_format == 'jfif' else 0
+        encoded_data = encoder.streaming_encoder(image, quality_factor=quality_factor, downsampling=downsampling, level_shift=level_shift)
+        del image
+
+        os.makedirs(os.path.dirname(output_path) or '.', exist_ok=True)
+        if output_format == 'jfif':
+            output_size = jfif.write_jfif(encoded_data, output_path)
+        else:
+            output_size = container.save(encoded_data, output_path)
+    except Exception as error:
+        return EncodeResult(path, output_path, os.path.getsize(path), 0, time.perf_counter() - start, f'{type(error).__name__}: {error}')
+    finally:
+        shm.close()
+
+    return EncodeResult(path, output_path, os.path.getsize(path), output_size, time.perf_counter() - start, None)
+
+def _share(image: np.ndarray) -> tuple[shared_memory.SharedMemory, _SharedImage]:
+    shm = shared_memory.SharedMemory(create=True, size=max(image.nbytes, 1))
+    np.ndarray(image.shape, dtype=image.dtype, buffer=shm.buf)[...] = image
+
+    return shm, _SharedImage(shm.name, image.shape, image.dtype.str)
+
+def encode_many(
+    paths: Iterable[str],
+    output_dir: str,
+    *,
+    root: str | None = None,
+    output_format: OUTPUT_FORMAT_TYPE = 'container',
+    quality_factor: int = 75,
+    downsampling: VALID_DOWNSAMPLES_TYPE = DEFAULT_DOWNSAMPLE,
+    workers: int | None = None,
+    max_in_flight: int | None = None,
+) -> Iterator[EncodeResult]:
+    """
+    Encodes many images on a process pool, yielding a result per file as they finish.
+
+    Each image is read in this process and copied into a shared memory block
+    that the worker maps, so pixels are never pickled. At most max_in_flight
+    images are loaded (or being encoded) at a time. Errors are reported in the
+    results instead of stopping the batch.
+
+    Args:
+        paths (Iterable[str]): Images to encode.
+        output_dir (str): Directory of the encoded files.
+        root (str): Directory the paths are relative to. The output keeps their
+            directory structure; without root, the files are written flat.
+        output_format (str): 'container' (.icjp) or 'jfif' (.jpeg).
+        quality_factor (int): Quality factor.
+        downsampling (str): Chroma downsampling.
+        workers (int): Number of processes (default: os.cpu_count()).
+        max_in_flight (int): Maximum number of images in shared memory (default: 2 * workers).
+
+    Yields:
+        EncodeResult: Result of each file, in completion order.
+    """
+    assert output_format in OUTPUT_FORMATS, f'Invalid output_format: {output_format}. Needs to be one of the following: {OUTPUT_FORMATS}'
+    assert downsampling in VALID_DOWNSAMPLES, f'Invalid downsampling: {downsampling}. Needs to be one of the following: {VALID_DOWNSAMPLES}'
+
+    workers = workers or os.cpu_count() or 1
+    max_in_flight = max_in_flight or 2 * workers
+
+    in_flight: dict[Future, shared_memory.SharedMemory] = {}
+
+    def finished(futures) -> Iterator[EncodeResult]:
+        for future in futures:
+            shm = in_flight.pop(future)
+            shm.close()
+            shm.unlink()
+            yield future.result()
+
+    with ProcessPoolExecutor(workers) as executor:
+        try:
+            for path in paths:
+                output_path = _output_path(path, output_dir, root, output_format)
+
+                if len(in_flight) >= max_in_flight:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    yield from finished(done)
+
+                start = time.perf_counter()
+                try:
+                    shm, shared_image = _share(read_image(path))
+                except Exception as error:
+                    input_size = os.path.getsize(path) if os.path.exists(path) else 0
+                    yield EncodeResult(path, output_path, input_size, 0, time.perf_counter() - start, f'{type(error).__name__}: {error}')
+                    continue
+
+                future = executor.submit(_encode_shared, shared_image, path, output_path, output_format, quality_factor, downsampling)
+                in_flight[future] = shm
+
+            while in_flight:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                yield from finished(done)
+        finally:
+            for future in in_flight:
+                future.cancel()
+            wait(in_flight)
+            for shm in in_flight.values():
+                shm.close()
+                shm.unlink()
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch image compression")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    encode_parser = subparsers.add_parser('encode', help='Encode every image of a directory tree')
+    encode_parser.add_argument('input_dir', help='Directory with the images')
+    encode_parser.add_argument('output_dir', help='Directory of the encoded files (keeps the directory structure)')
+    encode_parser.add_argument('--format', choices=OUTPUT_FORMATS, default='container', help='Output format')
+    encode_parser.add_argument('--quality', type=int, default=75, help='Quality factor')
+    encode_parser.add_argument('--downsampling', choices=VALID_DOWNSAMPLES, default=DEFAULT_DOWNSAMPLE, help='Chroma downsampling')
+    encode_parser.add_argument('--workers', type=int, default=None, help='Number of processes (default: number of CPUs)')
+    encode_parser.add_argument('--max-in-flight', type=int, default=None, help='Maximum number of images in memory (default: 2 * workers)')
+
+    args = parser.parse_args()
+
+    failed = 0
+    for result in encode_many(
+        find_images(args.input_dir),
+        args.output_dir,
+        root=args.input_dir,
+        output_format=args.format,
+        quality_factor=args.quality,
+        downsampling=args.downsampling,
+        workers=args.workers,
+        max_in_flight=args.max_in_flight,
+    ):
+        failed += result.error is not None
+        print(json.dumps(result._asdict()), flush=True)
+
+    if failed:
+        print(f'{failed} images failed', file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
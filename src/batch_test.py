@@ -0,0 +1,31 @@
+from common import TEST_PARAMETERS
+import batch
+import bmp
+import container
+import encoder
+import numpy as np
+import shutil
+
+def test_encode_many(tmp_path):
+    input_dir = tmp_path / 'input'
+    (input_dir / 'nested').mkdir(parents=True)
+    shutil.copy(TEST_PARAMETERS.image_path, input_dir / 'airport.bmp')
+    shutil.copy(TEST_PARAMETERS.image_path, input_dir / 'nested' / 'airport.bmp')
+    (input_dir / 'nested' / 'invalid.bmp').write_bytes(b'not a bmp')
+
+    paths = batch.find_images(str(input_dir))
+    assert len(paths) == 3
+
+    output_dir = tmp_path / 'output'
+    results = list(batch.encode_many(paths, str(output_dir), root=str(input_dir), workers=2, max_in_flight=1))
+
+    assert sorted(result.path for result in results) == paths
+
+    errors = [result for result in results if result.error is not None]
+    assert [result.path for result in errors] == [str(input_dir / 'nested' / 'invalid.bmp')]
+
+    expected, _ = encoder.encoder(bmp.read_bmp(TEST_PARAMETERS.image_path), quality_factor=75)
+    for name in ('airport.icjp', 'nested/airport.icjp'):
+        loaded = container.load(str(output_dir / name))
+        assert (output_dir / name).stat().st_size == next(r.output_size for r in results if r.output_path == str(output_dir / name))
+        assert np.array_equal(loaded.dpcm_channels()[0], expected.dpcm_channels()[0])
@@ -0,0 +1,86 @@
+from matplotlib import pyplot as plt
+import numpy as np
+import os
+import struct
+
+# magic, file size, reserved, reserved, pixel data offset
+FILE_HEADER = struct.Struct('<2sIHHI')
+# header size, width, height, planes, bits per pixel, compression
+INFO_HEADER = struct.Struct('<IiiHHI')
+# Red, green and blue masks, after the 40 byte BITMAPINFOHEADER
+MASKS = struct.Struct('<III')
+MASKS_OFFSET = FILE_HEADER.size + 40
+
+BI_RGB = 0
+BI_BITFIELDS = 3
+# Channel masks of 32 bit BI_BITFIELDS files laid out as BGRA, the only ones supported
+BGRA_MASKS = (0x00FF0000, 0x0000FF00, 0x000000FF)
+
+def read_bmp(path: str) -> np.ndarray:
+    """
+    Maps an uncompressed 24 or 32 bit BMP file as a read only RGB array.
+
+    Nothing is decoded: the result is a view of a np.memmap of the pixel data,
+    with strides that undo the bottom-up row order, the row padding and the BGR
+    channel order, so pages are only read from disk when they are accessed.
+
+    Args:
+        path (str): BMP file path.
+
+    Returns:
+        np.ndarray: (height, width, 3) uint8 RGB view of the file.
+
+    Raises:
+        ValueError: If the file is not a BMP or is compressed, paletted or has
+            another bit depth.
+    """
+    with open(path, 'rb') as file:
+        header = file.read(MASKS_OFFSET + MASKS.size)
+
+    if len(header) < FILE_HEADER.size + INFO_HEADER.size:
+        raise ValueError(f'{path} is not a BMP file')
+
+    magic, _, _, _, offset = FILE_HEADER.unpack_from(header)
+    if magic != b'BM':
+        raise ValueError(f'{path} is not a BMP file')
+
+    _, width, height, _, bits_per_pixel, compression = INFO_HEADER.unpack_from(header, FILE_HEADER.size)
+    if bits_per_pixel not in (24, 32):
+        raise ValueError(f'Unsupported BMP bit depth: {bits_per_pixel}. Only 24 and 32 bit files are supported')
+    if compression == BI_BITFIELDS and bits_per_pixel == 32:
+        masks = MASKS.unpack_from(header, MASKS_OFFSET) if len(header) == MASKS_OFFSET + MASKS.size else None
+        if masks != BGRA_MASKS:
+            raise ValueError(f'Unsupported BMP channel masks: {masks}')
+    elif compression != BI_RGB:
+        raise ValueError(f'Unsupported BMP compression: {compression}')
+
+    channels = bits_per_pixel // 8
+    # Rows are padded to a multiple of 4 bytes
+    row_size = -(-width * channels // 4) * 4
+    rows = abs(height)
+
+    data = np.memmap(path, dtype=np.uint8, mode='r', offset=offset, shape=(rows, row_size))
+    pixels = data[:, :width * channels].reshape(rows, width, channels)
+
+    # A positive height means the rows are stored bottom-up
+    if height > 0:
+        pixels = pixels[::-1]
+
+    # BGR(A) -> RGB
+    return pixels[:, :, 2::-1]
+
+def read_image(path: str) -> np.ndarray:
+    """
+    Reads an image, memory mapping BMP files (see read_bmp) and decoding any
+    other format with plt.imread.
+
+    Args:
+        path (str): Image file path.
+
+    Returns:
+        np.ndarray: Image.
+    """
+    if os.path.splitext(path)[1].lower() == '.bmp':
+        return read_bmp(path)
+
+    return plt.imread(path)
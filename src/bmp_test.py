@@ -0,0 +1,48 @@
+from common import TEST_PARAMETERS
+from matplotlib import pyplot as plt
+import bmp
+import numpy as np
+import pytest
+import struct
+
+def write_bmp(path, image: np.ndarray, top_down: bool) -> None:
+    height, width, channels = image.shape
+    row_size = -(-width * channels // 4) * 4
+
+    rows = np.zeros((height, row_size), dtype=np.uint8)
+    # Stored as BGR(A)
+    rows[:, :width * channels] = np.concatenate([image[:, :, 2::-1], image[:, :, 3:]], axis=2).reshape(height, -1)
+    if not top_down:
+        rows = rows[::-1]
+
+    offset = bmp.FILE_HEADER.size + 40
+    with open(path, 'wb') as file:
+        file.write(bmp.FILE_HEADER.pack(b'BM', offset + rows.nbytes, 0, 0, offset))
+        file.write(bmp.INFO_HEADER.pack(40, width, -height if top_down else height, 1, 8 * channels, bmp.BI_RGB))
+        file.write(struct.pack('<IiiII', rows.nbytes, 0, 0, 0, 0))
+        file.write(rows.tobytes())
+
+def test_read_bmp_matches_imread():
+    image = bmp.read_bmp(TEST_PARAMETERS.image_path)
+
+    assert np.array_equal(image, plt.imread(TEST_PARAMETERS.image_path))
+    assert isinstance(image.base, np.memmap) or isinstance(image, np.memmap)
+    assert not image.flags.writeable
+
+@pytest.mark.parametrize('top_down', (True, False))
+@pytest.mark.parametrize('channels', (3, 4))
+def test_read_bmp(tmp_path, top_down, channels):
+    # Odd width so the rows are padded
+    image = np.random.default_rng(0).integers(0, 256, size=(7, 5, channels), dtype=np.uint8)
+
+    path = tmp_path / 'image.bmp'
+    write_bmp(path, image, top_down)
+
+    assert np.array_equal(bmp.read_bmp(str(path)), image[:, :, :3])
+
+def test_read_bmp_rejects_other_files(tmp_path):
+    path = tmp_path / 'image.bmp'
+    path.write_bytes(b'\x89PNG' + bytes(64))
+
+    with pytest.raises(ValueError):
+        bmp.read_bmp(str(path))
@@ -0,0 +1,142 @@
+from typing import Mapping
+import hashlib
+import json
+import numpy as np
+import os
+import shutil
+import tempfile
+
+# Directory of the default cache. Caching is disabled when it is not set
+CACHE_DIR_ENV = 'IMAGE_COMPRESSION_CACHE'
+# Size limit of the default cache, in bytes
+CACHE_SIZE_ENV = 'IMAGE_COMPRESSION_CACHE_SIZE'
+DEFAULT_MAX_BYTES = 1 << 30
+
+class ArrayCache:
+    """
+    Content addressed on-disk cache of named arrays.
+
+    Each entry is a directory of .npy files named after a hash of the inputs
+    (see key). Entries are loaded memory mapped. The least recently used
+    entries are deleted when the cache grows over max_bytes.
+    """
+    def __init__(self, directory: str, max_bytes: int = DEFAULT_MAX_BYTES) -> None:
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def key(self, image: np.ndarray, **params) -> str:
+        """
+        Returns the key of an image and the parameters it is processed with.
+
+        Args:
+            image (np.ndarray): Input image. Its contents, shape and dtype are hashed.
+            **params: JSON serializable parameters (including a code version).
+
+        Returns:
+            str: Hex digest.
+        """
+        image = np.ascontiguousarray(image)
+
+        digest = hashlib.sha256()
+        digest.update(json.dumps([image.shape, image.dtype.str, params], sort_keys=True).encode())
+        digest.update(memoryview(image).cast('B'))
+
+        return digest.hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def load(self, key: str) -> dict[str, np.ndarray] | None:
+        """
+        Returns the arrays of an entry (read only, memory mapped), or None.
+        """
+        path = self._path(key)
+        try:
+            names = os.listdir(path)
+            arrays = {name[:-len('.npy')]: np.load(os.path.join(path, name), mmap_mode='r') for name in names if name.endswith('.npy')}
+            # The modification time of the entry is its last use
+            os.utime(path)
+        except (FileNotFoundError, ValueError):
+            return None
+
+        return arrays
+
+    def store(self, key: str, arrays: Mapping[str, np.ndarray]) -> None:
+        """
+        Writes an entry, replacing any previous one, then evicts old entries.
+        """
+        # Written to a temporary directory and renamed, so readers never see partial entries
+        temporary = tempfile.mkdtemp(prefix='.tmp-', dir=self.directory)
+        for name, array in arrays.items():
+            np.save(os.path.join(temporary, f'{name}.npy'), np.asanyarray(array))
+
+        path = self._path(key)
+        shutil.rmtree(path, ignore_errors=True)
+        try:
+            os.rename(temporary, path)
+        except OSError:
+            # Another process stored the same entry first
+            shutil.rmtree(temporary, ignore_errors=True)
+
+        self.evict()
+
+    def entries(self) -> list[tuple[str, float, int]]:
+        """
+        Returns the key, last use time and size in bytes of each entry.
+        """
+        entries = []
+        for key in os.listdir(self.directory):
+            path = self._path(key)
+            if key.startswith('.tmp-'):
+                continue
+            try:
+                size = sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+                entries.append((key, os.path.getmtime(path), size))
+            except FileNotFoundError:
+                continue
+
+        return entries
+
+    def evict(self) -> None:
+        """
+        Deletes the least recently used entries until the cache fits max_bytes.
+        """
+        entries = sorted(self.entries(), key=lambda entry: entry[1])
+        total = sum(size for _, _, size in entries)
+
+        for key, _, size in entries:
+            if total <= self.max_bytes:
+                break
+            shutil.rmtree(self._path(key), ignore_errors=True)
+            total -= size
+
+    def clear(self) -> None:
+        """
+        Deletes every entry.
+        """
+        for key, _, _ in self.entries():
+            shutil.rmtree(self._path(key), ignore_errors=True)
+
+def default_cache() -> ArrayCache | None:
+    """
+    Returns the cache configured by the IMAGE_COMPRESSION_CACHE (directory) and
+    IMAGE_COMPRESSION_CACHE_SIZE (bytes) environment variables, or None if
+    IMAGE_COMPRESSION_CACHE is not set.
+    """
+    directory = os.environ.get(CACHE_DIR_ENV)
+    if not directory:
+        return None
+
+    return ArrayCache(directory, int(os.environ.get(CACHE_SIZE_ENV, DEFAULT_MAX_BYTES)))
+
+def file_version(*paths: str) -> str:
+    """
+    Returns a hash of the contents of source files, to use as a code version in keys.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        with open(path, 'rb') as file:
+            digest.update(file.read())
+
+    return digest.hexdigest()
@@ -0,0 +1,104 @@
+from cache import ArrayCache, CACHE_DIR_ENV, default_cache
+import decoder
+import encoder
+import numpy as np
+import os
+import pytest
+import time
+
+rng = np.random.default_rng(0)
+image = rng.integers(0, 256, size=(40, 56, 3), dtype=np.uint8)
+
+def test_cache_round_trip(tmp_path):
+    cache = ArrayCache(str(tmp_path))
+    key = cache.key(image, quality_factor=50)
+
+    assert cache.load(key) is None
+
+    cache.store(key, {'a': np.arange(10), 'b': image})
+    arrays = cache.load(key)
+
+    assert np.array_equal(arrays['a'], np.arange(10))
+    assert np.array_equal(arrays['b'], image)
+    assert not arrays['b'].flags.writeable
+
+def test_cache_key(tmp_path):
+    cache_key = ArrayCache(str(tmp_path)).key
+    other = image.copy()
+    other[0, 0, 0] ^= 1
+
+    assert cache_key(image, quality_factor=50) == cache_key(image.copy(), quality_factor=50)
+    assert cache_key(image, quality_factor=50) != cache_key(image, quality_factor=51)
+    assert cache_key(image, quality_factor=50) != cache_key(other, quality_factor=50)
+    assert cache_key(image, quality_factor=50) != cache_key(image.astype(np.uint16), quality_factor=50)
+
+def test_cache_eviction(tmp_path):
+    array = np.zeros(1000, dtype=np.uint8)
+    # Room for two entries
+    cache = ArrayCache(str(tmp_path), max_bytes=2 * (array.nbytes + 200))
+
+    cache.store('first', {'array': array})
+    cache.store('second', {'array': array})
+    # The second entry was last used before the first one
+    past = time.time() - 10
+    os.utime(tmp_path / 'second', (past, past))
+    assert cache.load('first') is not None
+
+    cache.store('third', {'array': array})
+
+    assert sorted(key for key, _, _ in cache.entries()) == ['first', 'third']
+
+@pytest.mark.parametrize('rle_and_huffman', [False, True])
+@pytest.mark.parametrize('restart_interval', [0, 3])
+def test_encoder_cache(tmp_path, rle_and_huffman, restart_interval):
+    cache = ArrayCache(str(tmp_path))
+    parameters = dict(quality_factor=75, rle_and_huffman=rle_and_huffman, restart_interval=restart_interval)
+
+    expected, expected_iv = encoder.encoder(image, **parameters, return_intermidiate_values=True, cache=False)
+    encoder.encoder(image, **parameters, return_intermidiate_values=True, cache=cache)
+    assert len(cache.entries()) == 1
+
+    actual, actual_iv = encoder.encoder(image, **parameters, return_intermidiate_values=True, cache=cache)
+
+    for name in ('Y_q', 'Cb_dct8', 'Cr_dpcm'):
+        assert np.array_equal(getattr(actual_iv, name), getattr(expected_iv, name)), name
+    for expected_channel, actual_channel in zip(expected.dpcm_channels(), actual.dpcm_channels()):
+        assert np.array_equal(actual_channel, expected_channel)
+    if rle_and_huffman:
+        assert actual.Y_huffman.data == expected.Y_huffman.data
+        assert np.array_equal(actual.Cr_huffman.ac_table.values, expected.Cr_huffman.ac_table.values)
+
+    expected_image, _ = decoder.decoder(expected)
+    actual_image, _ = decoder.decoder(actual)
+    assert np.array_equal(actual_image, expected_image)
+
+def test_encoder_cache_missing_values(tmp_path):
+    cache = ArrayCache(str(tmp_path))
+
+    # Stored without the intermediate values nor the entropy coding
+    encoder.encoder(image, rle_and_huffman=False, cache=cache)
+
+    encoded, _ = encoder.encoder(image, cache=cache)
+    expected, _ = encoder.encoder(image, cache=False)
+    assert encoded.Y_huffman.data == expected.Y_huffman.data
+
+    _, iv = encoder.encoder(image, return_intermidiate_values=True, cache=cache)
+    assert iv.Y_dct8.shape == (64, 64)
+
+def test_encoder_code_version(monkeypatch):
+    hashed = []
+    monkeypatch.setattr(encoder, 'file_version', lambda *paths: hashed.extend(paths))
+    encoder._code_version.__wrapped__()
+
+    names = {os.path.basename(path) for path in hashed}
+    assert {'encoder.py', 'common.py', 'cache.py', 'step4_quatization.py', 'step6_run_length_huffman_encoding.py'} <= names
+
+def test_default_cache(tmp_path, monkeypatch):
+    monkeypatch.delenv(CACHE_DIR_ENV, raising=False)
+    assert default_cache() is None
+
+    monkeypatch.setenv(CACHE_DIR_ENV, str(tmp_path))
+    encoder.encoder(image)
+
+    assert default_cache().directory == str(tmp_path)
+    assert len(default_cache().entries()) == 1
@@ -85,3 +85,35 @@ def generate_path(
         return f'{output_dir}/{base[-2]}-{suffix}.{base[-1]}'
     else:
         return f'{output_dir}/{base[-2]}-{suffix}.{file_extension}'
+
+def to_blocks(channel: np.ndarray, block_size: int = 8) -> np.ndarray:
+    """
+    Returns a (n_blocks_y, n_blocks_x, block_size, block_size) view of a channel.
+
+    Args:
+        channel (np.ndarray): 2D channel whose sides are multiples of block_size.
+        block_size (int): Size of the block. Default = 8.
+
+    Returns:
+        np.ndarray: Block view of the channel (no copy is made).
+    """
+    h, w = channel.shape[-2:]
+    assert h % block_size == 0 and w % block_size == 0, f'Channel shape {channel.shape} is not a multiple of {block_size}'
+
+    blocks = channel.reshape(*channel.shape[:-2], h // block_size, block_size, w // block_size, block_size)
+
+    return blocks.swapaxes(-3, -2)
+
+def from_blocks(blocks: np.ndarray) -> np.ndarray:
+    """
+    Inverse of to_blocks: stitches a (n_blocks_y, n_blocks_x, B, B) stack back into a channel.
+
+    Args:
+        blocks (np.ndarray): Block stack.
+
+    Returns:
+        np.ndarray: 2D channel of shape (n_blocks_y * B, n_blocks_x * B).
+    """
+    n_y, n_x, b_y, b_x = blocks.shape[-4:]
+
+    return blocks.swapaxes(-3, -2).reshape(*blocks.shape[:-4], n_y * b_y, n_x * b_x)
@@ -1,8 +1,11 @@
+from bmp import read_bmp
 from common import BUILD_DIR, DOCS_DIR, IMAGES, QUALITIES, generate_path
 from matplotlib import pyplot as plt
 from sys import stderr
 import argparse
+import encoder
 import ffmpeg
+import jfif
 import os
 
 def compress_image(image_path: str, build_dir: str, quality: int) -> tuple[str, float]:
@@ -59,15 +62,53 @@ def compress_image(image_path: str, build_dir: str, quality: int) -> tuple[str,
 
     return compressed_image_path, original_size / compressed_size
 
+def compress_image_jfif(image_path: str, build_dir: str, quality: int) -> tuple[str, float]:
+    """
+    Compress bmp image to jpeg in the given build_dir with the given quality,
+    using our encoder instead of ffmpeg
+
+
+    Parameters
+    ----------
+    image_path : str
+        The original bmp file path
+
+    build_dir : str
+        The directory to build compressed image to.
+
+    quality : int [1-100]
+        The quality of jpeg compression.
+
+    Returns
+    -------
+    tuple[str, float]
+        The tuple containing the compressed image path and the compression ratio
+    """
+    assert 0 <= quality <= 100, f'The quality must be between 0 and 100. Provided: {quality}'
+
+    if not os.path.exists(build_dir):
+        os.makedirs(build_dir)
+
+    image_basename, ext = os.path.splitext(os.path.basename(image_path))
+    assert ext == '.bmp', f'The file ({image_path}) provided is not bmp file.'
+
+    compressed_image_path = os.path.join(build_dir, f"{image_basename}-q{quality}-jfif.jpeg")
+
+    encoded_data, _ = encoder.encoder(read_bmp(image_path), quality_factor=quality)
+    compressed_size = jfif.write_jfif(encoded_data, compressed_image_path)
+
+    return compressed_image_path, os.path.getsize(image_path) / compressed_size
 
 def main():
     parser = argparse.ArgumentParser(description="Image Compression using ffmpeg")
 
     parser.add_argument('--hide-figures', action='store_true', help='Disable matplotlib figures')
+    parser.add_argument('--codec', choices=('ffmpeg', 'jfif'), default='ffmpeg', help='Compress with ffmpeg or with our encoder')
 
     args = parser.parse_args()
 
     show_figures: bool = not args.hide_figures
+    compress = compress_image if args.codec == 'ffmpeg' else compress_image_jfif
 
     results: dict[str, list[float]] = {image: [] for image in IMAGES}
 
@@ -76,14 +117,14 @@ def main():
     for image_path in IMAGES:
         fig, axes = plt.subplots(n_qualities + 1, 1, figsize=(3, 12))
 
-        image = plt.imread(image_path)
+        image = read_bmp(image_path)
 
         axes[0].imshow(image)
         axes[0].set_title(f'Original {image_path}')
         axes[0].axis('off')
 
         for i, quality in enumerate(QUALITIES):
-            compressed_path, compression_ratio = compress_image(image_path, BUILD_DIR, quality)
+            compressed_path, compression_ratio = compress(image_path, BUILD_DIR, quality)
             results[image_path].append(compression_ratio)
             print(f'{image_path} -> {compressed_path}: {compression_ratio=:.2f}')
 
@@ -97,7 +138,7 @@ def main():
         if show_figures:
             plt.show()
 
-        image_save_path = generate_path(image_path, 'compression-ffmpeg', output_dir=DOCS_DIR)
+        image_save_path = generate_path(image_path, f'compression-{args.codec}', output_dir=DOCS_DIR)
         fig.savefig(image_save_path,bbox_inches='tight', dpi=150)
         print(f'Saved image: {image_save_path}')
 
@@ -117,7 +158,7 @@ def main():
     if show_figures:
         plt.show()
 
-    image_save_path = f'{DOCS_DIR}/compression-plot.png'
+    image_save_path = f'{DOCS_DIR}/compression-plot.png' if args.codec == 'ffmpeg' else f'{DOCS_DIR}/compression-plot-{args.codec}.png'
     fig.savefig(image_save_path, bbox_inches='tight', dpi=150)
     print(f'Saved image: {image_save_path}')
 
@@ -0,0 +1,231 @@
+from encoder import JpegEncodedData
+import mmap
+import numpy as np
+import os
+import step6_run_length_huffman_encoding as rlh
+import struct
+
+MAGIC = b'ICJP'
+VERSION = 2
+
+FLAG_HUFFMAN = 1 << 0
+# Per channel quantization matrices (uint16, 8x8) follow the header
+FLAG_QUANTIZATION_MATRICES = 1 << 1
+# The DC coefficients are relative to samples shifted by 128 (as in JPEG files)
+FLAG_LEVEL_SHIFT = 1 << 2
+# A restart interval (uint32) follows the quantization matrices and, when entropy
+# coded, each channel's Huffman tables are followed by its segment offsets (uint64)
+FLAG_RESTART_INTERVAL = 1 << 3
+KNOWN_FLAGS = FLAG_HUFFMAN | FLAG_QUANTIZATION_MATRICES | FLAG_LEVEL_SHIFT | FLAG_RESTART_INTERVAL
+# Flags of each version: older files have the same layout, with the fields
+# added since then absent (and read as their defaults)
+VERSION_FLAGS = {1: FLAG_HUFFMAN, 2: KNOWN_FLAGS}
+
+# magic, version, flags, height, width, channels, downsampling, quality_factor, block_size, number of segments
+HEADER = struct.Struct('<4sHHIIHBBHH')
+# height, width, payload offset (from the start of the file), payload length
+SEGMENT_HEADER = struct.Struct('<IIQQ')
+HUFFMAN_TABLE_HEADER = struct.Struct('<16sH')
+QUANTIZATION_MATRIX_DTYPE = np.dtype('<u2')
+RESTART_INTERVAL = struct.Struct('<I')
+SEGMENT_OFFSETS_HEADER = struct.Struct('<I')
+SEGMENT_OFFSET_DTYPE = np.dtype('<u8')
+
+CHANNELS = ('Y', 'Cb', 'Cr')
+# Chroma downsampling of each code in the header. Files store the index, so new
+# downsamplings are only ever appended ('4:4:4' comes from parsed JPEG files)
+DOWNSAMPLINGS = ('4:2:0', '4:2:2', '4:4:4')
+COEFFICIENT_DTYPE = np.dtype('<i2')
+PAYLOAD_ALIGNMENT = 8
+
+def _align(offset: int) -> int:
+    return -(-offset // PAYLOAD_ALIGNMENT) * PAYLOAD_ALIGNMENT
+
+def _pack_huffman_table(table: rlh.HuffmanTable) -> bytes:
+    return HUFFMAN_TABLE_HEADER.pack(table.bits.astype(np.uint8).tobytes(), len(table.values)) + table.values.astype(np.uint8).tobytes()
+
+def _unpack_huffman_table(buffer, offset: int) -> tuple[rlh.HuffmanTable, int]:
+    bits, n_values = HUFFMAN_TABLE_HEADER.unpack_from(buffer, offset)
+    offset += HUFFMAN_TABLE_HEADER.size
+    values = np.frombuffer(buffer, dtype=np.uint8, count=n_values, offset=offset).copy()
+
+    return rlh.HuffmanTable(np.frombuffer(bits, dtype=np.uint8).copy(), values), offset + n_values
+
+def _as_coefficients(channel: np.ndarray, name: str) -> np.ndarray:
+    info = np.iinfo(COEFFICIENT_DTYPE)
+    if channel.size and (channel.min() < info.min or channel.max() > info.max):
+        raise ValueError(f'{name} coefficients do not fit in {COEFFICIENT_DTYPE}')
+
+    return np.ascontiguousarray(channel, dtype=COEFFICIENT_DTYPE)
+
+def save(encoded_data: JpegEncodedData, path: str) -> int:
+    """
+    Writes encoded data to a versioned binary container.
+
+    The file is written next to path and then renamed over it, so overwriting a
+    container that is loaded (memory mapped) does not change the loaded data.
+
+    Entropy coded channels are stored as their Huffman tables and byte buffer,
+    otherwise the DPCM coefficients are stored as little endian int16.
+
+    Args:
+        encoded_data (JpegEncodedData): Encoded image.
+        path (str): Output file path.
+
+    Returns:
+        int: Size of the written file in bytes.
+
+    Raises:
+        ValueError: If raw coefficients do not fit in int16.
+    """
+    assert encoded_data.downsampling in DOWNSAMPLINGS, f'Invalid downsampling: {encoded_data.downsampling}. Needs to be one of the following: {DOWNSAMPLINGS}'
+
+    huffman = encoded_data.Y_huffman is not None
+    height, width, *channels = (int(n) for n in encoded_data.original_image_shape)
+
+    flags = FLAG_HUFFMAN if huffman else 0
+    quant_matrices = b''
+    if encoded_data.quantization_matrices is not None:
+        flags |= FLAG_QUANTIZATION_MATRICES
+        quant_matrices = b''.join(np.ascontiguousarray(m, dtype=QUANTIZATION_MATRIX_DTYPE).tobytes() for m in encoded_data.quantization_matrices)
+    if encoded_data.level_shift:
+        assert encoded_data.level_shift == 128, f'Invalid level_shift: {encoded_data.level_shift}'
+        flags |= FLAG_LEVEL_SHIFT
+    restart_interval = b''
+    if encoded_data.restart_interval:
+        flags |= FLAG_RESTART_INTERVAL
+        restart_interval = RESTART_INTERVAL.pack(encoded_data.restart_interval)
+
+    segments: list[tuple[tuple[int, int], bytes, bytes]] = []
+    for name in CHANNELS:
+        if huffman:
+            channel: rlh.EntropyCodedChannel = getattr(encoded_data, f'{name}_huffman')
+            tables = _pack_huffman_table(channel.dc_table) + _pack_huffman_table(channel.ac_table)
+            if encoded_data.restart_interval:
+                offsets = np.ascontiguousarray(channel.segment_offsets, dtype=SEGMENT_OFFSET_DTYPE)
+                tables += SEGMENT_OFFSETS_HEADER.pack(len(offsets)) + offsets.tobytes()
+            segments.append((channel.shape, tables, channel.data))
+        else:
+            coefficients = _as_coefficients(getattr(encoded_data, f'{name}_dpcm'), name)
+            segments.append((coefficients.shape, b'', coefficients.tobytes()))
+
+    header = HEADER.pack(
+        MAGIC,
+        VERSION,
+        flags,
+        height,
+        width,
+        channels[0] if channels else 1,
+        DOWNSAMPLINGS.index(encoded_data.downsampling),
+        encoded_data.quality_factor,
+        encoded_data.block_size,
+        len(segments),
+    )
+
+    # Segment headers (and Huffman tables) come first, then the aligned payloads
+    offset = len(header) + len(quant_matrices) + len(restart_interval) + sum(SEGMENT_HEADER.size + len(tables) for _, tables, _ in segments)
+    payload_offsets = []
+    for _, _, payload in segments:
+        offset = _align(offset)
+        payload_offsets.append(offset)
+        offset += len(payload)
+
+    # Written to a temporary file and renamed: path may be mapped by load (the
+    # payloads may even come from it), and truncating a mapped file breaks it
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+        with open(temporary, 'wb') as file:
+            file.write(header)
+            file.write(quant_matrices)
+            file.write(restart_interval)
+            for ((h, w), tables, payload), payload_offset in zip(segments, payload_offsets):
+                file.write(SEGMENT_HEADER.pack(h, w, payload_offset, len(payload)))
+                file.write(tables)
+
+            for (_, _, payload), payload_offset in zip(segments, payload_offsets):
+                file.write(b'\0' * (payload_offset - file.tell()))
+                file.write(payload)
+
+            size = file.tell()
+
+        os.replace(temporary, path)
+    except BaseException:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        raise
+
+    return size
+
+def load(path: str) -> JpegEncodedData:
+    """
+    Reads a container written by save.
+
+    The file is memory mapped: raw coefficients are returned as read only arrays
+    backed by the mapping and entropy coded payloads as memoryviews of it, so
+    nothing is read from disk until the decoder touches it. Files of older
+    versions are read with the fields they lack at their defaults.
+
+    Args:
+        path (str): Container file path.
+
+    Returns:
+        JpegEncodedData: Encoded image.
+
+    Raises:
+        ValueError: If the file is not a container or has an unsupported version.
+    """
+    with open(path, 'rb') as file:
+        buffer = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < HEADER.size:
+        raise ValueError(f'{path} is not an image container')
+
+    magic, version, flags, height, width, channels, downsampling, quality_factor, block_size, n_segments = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f'{path} is not an image container')
+    if version not in VERSION_FLAGS:
+        raise ValueError(f'Unsupported container version: {version}. Expected at most {VERSION}')
+    if flags & ~VERSION_FLAGS[version]:
+        raise ValueError(f'Unsupported container flags: {flags:#x}')
+    if downsampling >= len(DOWNSAMPLINGS):
+        raise ValueError(f'Unsupported chroma downsampling code: {downsampling}')
+
+    offset = HEADER.size
+    quant_matrices = None
+    if flags & FLAG_QUANTIZATION_MATRICES:
+        matrices = np.frombuffer(buffer, dtype=QUANTIZATION_MATRIX_DTYPE, count=len(CHANNELS) * block_size ** 2, offset=offset)
+        quant_matrices = tuple(matrices.reshape(len(CHANNELS), block_size, block_size).astype(np.int64))
+        offset += matrices.nbytes
+    restart_interval = 0
+    if flags & FLAG_RESTART_INTERVAL:
+        restart_interval, = RESTART_INTERVAL.unpack_from(buffer, offset)
+        offset += RESTART_INTERVAL.size
+    encoded_channels = {}
+    for name in CHANNELS[:n_segments]:
+        h, w, payload_offset, payload_length = SEGMENT_HEADER.unpack_from(buffer, offset)
+        offset += SEGMENT_HEADER.size
+
+        if flags & FLAG_HUFFMAN:
+            dc_table, offset = _unpack_huffman_table(buffer, offset)
+            ac_table, offset = _unpack_huffman_table(buffer, offset)
+            segment_offsets = None
+            if flags & FLAG_RESTART_INTERVAL:
+                n_offsets, = SEGMENT_OFFSETS_HEADER.unpack_from(buffer, offset)
+                offset += SEGMENT_OFFSETS_HEADER.size
+                segment_offsets = np.frombuffer(buffer, dtype=SEGMENT_OFFSET_DTYPE, count=n_offsets, offset=offset).astype(np.uint64)
+                offset += n_offsets * SEGMENT_OFFSET_DTYPE.itemsize
+            data = memoryview(buffer)[payload_offset:payload_offset + payload_length]
+            encoded_channels[f'{name}_huffman'] = rlh.EntropyCodedChannel((h, w), block_size, dc_table, ac_table, data, restart_interval, segment_offsets)
+        else:
+            encoded_channels[f'{name}_dpcm'] = np.frombuffer(buffer, dtype=COEFFICIENT_DTYPE, count=h * w, offset=payload_offset).reshape(h, w)
+
+    return JpegEncodedData(
+        **encoded_channels,
+        quality_factor=quality_factor,
+        downsampling=DOWNSAMPLINGS[downsampling],
+        block_size=block_size,
+        image_shape=np.array((height, width, channels)),
+        quantization_matrices=quant_matrices,
+        level_shift=128 if flags & FLAG_LEVEL_SHIFT else 0,
+        restart_interval=restart_interval,
+    )
@@ -0,0 +1,155 @@
+from common import TEST_PARAMETERS
+from concurrent.futures import ProcessPoolExecutor
+from matplotlib import pyplot as plt
+import container
+import cv2
+import decoder
+import encoder
+import jfif
+import numpy as np
+import pytest
+
+image = plt.imread(TEST_PARAMETERS.image_path)
+
+@pytest.mark.parametrize('rle_and_huffman', (True, False))
+def test_save_load(tmp_path, rle_and_huffman):
+    encoded_data, iv = encoder.encoder(
+        image,
+        downsampling=TEST_PARAMETERS.downsampling,
+        quality_factor=TEST_PARAMETERS.quality_factor,
+        rle_and_huffman=rle_and_huffman,
+        return_intermidiate_values=True,
+    )
+
+    path = tmp_path / 'airport.icjp'
+    size = container.save(encoded_data, str(path))
+    loaded = container.load(str(path))
+
+    assert size == path.stat().st_size
+    assert loaded.downsampling == encoded_data.downsampling
+    assert loaded.quality_factor == encoded_data.quality_factor
+    assert loaded.block_size == encoded_data.block_size
+    assert np.array_equal(loaded.original_image_shape, image.shape)
+
+    if rle_and_huffman:
+        assert size < iv.Y_dpcm.nbytes
+    else:
+        assert np.array_equal(loaded.Y_dpcm, iv.Y_dpcm)
+
+    expected, _ = decoder.decoder(
+        encoded_data,
+        downsampling=TEST_PARAMETERS.downsampling,
+        quality_factor=TEST_PARAMETERS.quality_factor,
+        rle_and_huffman=rle_and_huffman,
+    )
+    actual, _ = decoder.decoder(
+        loaded,
+        downsampling=TEST_PARAMETERS.downsampling,
+        quality_factor=TEST_PARAMETERS.quality_factor,
+        rle_and_huffman=rle_and_huffman,
+    )
+
+    assert np.array_equal(expected, actual)
+
+def test_load_invalid_file(tmp_path):
+    path = tmp_path / 'invalid.icjp'
+    path.write_bytes(b'BM' + bytes(64))
+
+    with pytest.raises(ValueError):
+        container.load(str(path))
+
+def test_load_version_1(tmp_path):
+    encoded_data, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor)
+
+    path = tmp_path / 'airport.icjp'
+    container.save(encoded_data, str(path))
+
+    # Version 1 had the same layout, without quantization matrices, level shift or restart intervals
+    data = bytearray(path.read_bytes())
+    data[4:6] = (1).to_bytes(2, 'little')
+    path.write_bytes(data)
+
+    loaded = container.load(str(path))
+    assert loaded.quantization_matrices is None and loaded.level_shift == 0 and loaded.restart_interval == 0
+    assert np.array_equal(decoder.decoder(loaded)[0], decoder.decoder(encoded_data)[0])
+
+    # Flags that version 1 did not have
+    data[6:8] = (container.FLAG_HUFFMAN | container.FLAG_RESTART_INTERVAL).to_bytes(2, 'little')
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        container.load(str(path))
+
+    data[4:6] = (container.VERSION + 1).to_bytes(2, 'little')
+    path.write_bytes(data)
+    with pytest.raises(ValueError):
+        container.load(str(path))
+
+def test_save_over_loaded(tmp_path):
+    encoded_data, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor)
+    other, _ = encoder.encoder(image[:64, :64], quality_factor=90)
+
+    path = tmp_path / 'airport.icjp'
+    container.save(encoded_data, str(path))
+    loaded = container.load(str(path))
+    expected, _ = decoder.decoder(encoded_data)
+
+    # The payloads of loaded come from the file being replaced
+    container.save(loaded, str(path))
+    container.save(other, str(path))
+
+    assert np.array_equal(decoder.decoder(loaded)[0], expected)
+    assert np.array_equal(decoder.decoder(container.load(str(path)))[0], decoder.decoder(other)[0])
+    assert [file.name for file in tmp_path.iterdir()] == ['airport.icjp']
+
+def test_save_load_parsed_jpeg(tmp_path):
+    ok, data = cv2.imencode('.jpg', np.ascontiguousarray(image[:, :, ::-1]), (cv2.IMWRITE_JPEG_QUALITY, 80))
+    assert ok
+    encoded_data = jfif.parse_jpeg(data.tobytes())
+
+    path = tmp_path / 'airport.icjp'
+    container.save(encoded_data, str(path))
+    loaded = container.load(str(path))
+
+    assert loaded.level_shift == encoded_data.level_shift
+    for expected, actual in zip(encoded_data.quantization_matrices, loaded.quantization_matrices):
+        assert np.array_equal(expected, actual)
+
+    assert np.array_equal(decoder.decoder(encoded_data)[0], decoder.decoder(loaded)[0])
+
+def test_save_load_parsed_jpeg_444(tmp_path):
+    ok, data = cv2.imencode('.jpg', np.ascontiguousarray(image[:, :, ::-1]), (cv2.IMWRITE_JPEG_QUALITY, 80, cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444))
+    assert ok
+    encoded_data = jfif.parse_jpeg(data.tobytes())
+    assert encoded_data.downsampling == '4:4:4'
+
+    path = tmp_path / 'airport.icjp'
+    container.save(encoded_data, str(path))
+    loaded = container.load(str(path))
+
+    assert loaded.downsampling == '4:4:4'
+    assert np.array_equal(decoder.decoder(encoded_data)[0], decoder.decoder(loaded)[0])
+
+def test_save_load_restart_interval(tmp_path):
+    encoded_data, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor, restart_interval=16)
+
+    path = tmp_path / 'airport.icjp'
+    container.save(encoded_data, str(path))
+    loaded = container.load(str(path))
+
+    assert loaded.restart_interval == 16
+    assert np.array_equal(loaded.Y_huffman.segment_offsets, encoded_data.Y_huffman.segment_offsets)
+
+    expected, _ = decoder.decoder(encoded_data)
+    assert np.array_equal(decoder.parallel_decoder(loaded, workers=2), expected)
+
+@pytest.mark.parametrize('restart_interval', (0, 16))
+def test_parallel_decoder_process_pool(tmp_path, restart_interval):
+    encoded_data, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor, restart_interval=restart_interval)
+
+    path = tmp_path / 'airport.icjp'
+    container.save(encoded_data, str(path))
+    loaded = container.load(str(path))
+
+    expected, _ = decoder.decoder(encoded_data)
+    with ProcessPoolExecutor(2) as executor:
+        assert np.array_equal(decoder.parallel_decoder(loaded, executor=executor, workers=2), expected)
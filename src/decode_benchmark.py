@@ -0,0 +1,58 @@
+from bmp import read_image
+from common import IMAGES
+from typing import Callable
+import argparse
+import decoder
+import encoder
+import os
+import time
+
+def best_time(function: Callable[[], object], repeats: int = 3) -> float:
+    """
+    Returns the shortest of repeats runs of function, in seconds.
+    """
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    return min(times)
+
+def benchmark(image_path: str, quality_factor: int = 90, restart_interval: int = 0, repeats: int = 3) -> dict[str, float]:
+    """
+    Times the full decode of an image against the decodes that skip work: the
+    DC-only thumbnail and the region index.
+
+    Args:
+        image_path (str): Image.
+        quality_factor (int): Quality factor of the encoding.
+        restart_interval (int): Restart interval of the encoding.
+        repeats (int): Runs of each decode (the shortest is kept).
+
+    Returns:
+        dict[str, float]: Seconds of each decode.
+    """
+    encoded_data, _ = encoder.encoder(read_image(image_path), quality_factor=quality_factor, restart_interval=restart_interval, cache=False)
+
+    return {
+        'decoder': best_time(lambda: decoder.decoder(encoded_data), repeats),
+        'decode_thumbnail': best_time(lambda: decoder.decode_thumbnail(encoded_data), repeats),
+        'build_region_index': best_time(lambda: decoder.build_region_index(encoded_data), repeats),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Decoding times of the full and partial decoders")
+    parser.add_argument('--images', nargs='+', default=[path for path in IMAGES if os.path.exists(path)], help='Images')
+    parser.add_argument('--quality', type=int, default=90, help='Quality factor')
+    parser.add_argument('--restart-interval', type=int, default=0, help='Restart interval (0 for none)')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs of each decode (the shortest is kept)')
+
+    args = parser.parse_args()
+
+    for image_path in args.images:
+        times = benchmark(image_path, args.quality, args.restart_interval, args.repeats)
+        print(f'{image_path}: ' + ', '.join(f'{name} {seconds:.3f} s ({seconds / times["decoder"]:.0%})' for name, seconds in times.items()))
+
+if __name__ == '__main__':
+    main()
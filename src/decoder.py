@@ -1,13 +1,20 @@
-from common import VALID_DOWNSAMPLES_TYPE
-from encoder import JpegEncodedData
+from common import VALID_DOWNSAMPLES_TYPE, from_blocks
+from concurrent.futures import Executor, ThreadPoolExecutor
+from encoder import JpegEncodedData, mcu_rows
+from typing import Iterator, NamedTuple
 import cv2
 import numpy as np
+import os
 import step0_preprocessing as prep
 import step1_color_space_conversion as csc
 import step2_chrominance_downsampling as cd
 import step3_discrete_cosine_transform as dct
 import step4_quatization as quant
 import step5_dpcm as dpcm
+import step6_run_length_huffman_encoding as rlh
+
+# Fatores de redução suportados por decoder (divisores do bloco 8x8)
+VALID_SCALES = (1, 2, 4, 8)
 
 class JpegDecodedIntermidiateValues:
     Yb_iDPCM: np.ndarray
@@ -24,38 +31,59 @@ class JpegDecodedIntermidiateValues:
 def decoder(
     encoded_data: JpegEncodedData,
     *,
-    downsampling: VALID_DOWNSAMPLES_TYPE = '4:2:0',
+    downsampling: VALID_DOWNSAMPLES_TYPE | None = None,
     interpolation: int | None = cv2.INTER_LINEAR,
-    quality_factor: int = 100,
-    block_size: int = 8,
-    rle_and_huffman: bool = True,
+    quality_factor: int | None = None,
+    block_size: int | None = None,
+    rle_and_huffman: bool | None = None,
+    scale: int = 1,
     return_intermidiate_values: bool = False,
 ) -> tuple[np.ndarray, JpegDecodedIntermidiateValues]:
     """
     Decodifica uma imagem comprimida.
 
+    Os parâmetros a None são lidos de encoded_data.
+
     Args:
         encoded_data (JpegEncodedData): Dados codificados da imagem
-        quality_factor (int): Fator de qualidade usado na quantização
+        quality_factor (int): Fator de qualidade usado na quantização. Ignorado se
+            encoded_data tiver as suas próprias matrizes de quantização.
         downsampling (str): Método de subamostragem usado
         block_size (int): Tamanho do bloco usado na DCT
         interpolation (int): Método de interpolação para upsampling
+        rle_and_huffman (bool): Se os canais estão codificados com run length e Huffman
+        scale (int): Fator de redução da imagem decodificada (1, 2, 4 ou 8). Com
+            scale > 1 cada bloco é reconstruído só a partir dos seus coeficientes
+            de menor frequência com uma IDCT reduzida (ver dct.scaled_idct_blocks)
 
     Returns:
         np.ndarray: Imagem decodificada em formato RGB
     """
+    assert scale in VALID_SCALES, f'Invalid scale: {scale}. Needs to be one of the following: {VALID_SCALES}'
+
     intermidiate_values = JpegDecodedIntermidiateValues()
 
-    if rle_and_huffman:
-        pass
+    downsampling = encoded_data.downsampling if downsampling is None else downsampling
+    quality_factor = encoded_data.quality_factor if quality_factor is None else quality_factor
+    block_size = encoded_data.block_size if block_size is None else block_size
+    if rle_and_huffman is None:
+        rle_and_huffman = encoded_data.Y_huffman is not None
+
+    Y_quant_matrix, Cb_quant_matrix, Cr_quant_matrix = encoded_data.quantization_matrices or (None, None, None)
 
     # Extrai os canais quantizados e codificados
-    Y_dpcm, Cb_dpcm, Cr_dpcm = encoded_data.Y_dpcm, encoded_data.Cb_dpcm, encoded_data.Cr_dpcm
+    if rle_and_huffman:
+        assert encoded_data.Y_huffman is not None, 'Encoded data has no run length and Huffman encoded channels. Use rle_and_huffman=False'
+        Y_dpcm = rlh.rle_and_huffman_decode(encoded_data.Y_huffman)
+        Cb_dpcm = rlh.rle_and_huffman_decode(encoded_data.Cb_huffman)
+        Cr_dpcm = rlh.rle_and_huffman_decode(encoded_data.Cr_huffman)
+    else:
+        Y_dpcm, Cb_dpcm, Cr_dpcm = encoded_data.Y_dpcm, encoded_data.Cb_dpcm, encoded_data.Cr_dpcm
 
     # Decodifica os coeficientes DC usando DPCM
-    Yb_iDPCM = dpcm.dpcm_decode(Y_dpcm, block_size=block_size)
-    Cbb_iDPCM = dpcm.dpcm_decode(Cb_dpcm, block_size=block_size)
-    Crb_iDPCM = dpcm.dpcm_decode(Cr_dpcm, block_size=block_size)
+    Yb_iDPCM = dpcm.dpcm_decode(Y_dpcm, block_size=block_size, restart_interval=encoded_data.restart_interval)
+    Cbb_iDPCM = dpcm.dpcm_decode(Cb_dpcm, block_size=block_size, restart_interval=encoded_data.restart_interval)
+    Crb_iDPCM = dpcm.dpcm_decode(Cr_dpcm, block_size=block_size, restart_interval=encoded_data.restart_interval)
     if return_intermidiate_values:
         intermidiate_values.Yb_iDPCM = Yb_iDPCM.copy()
         intermidiate_values.Cbb_iDPCM = Cbb_iDPCM.copy()
@@ -63,36 +91,81 @@ def decoder(
 
 
     # Desquantização
-    Yb_iQ = quant.iquantization(Yb_iDPCM, quality_factor=quality_factor, block_size=block_size)
-    Cbb_iQ = quant.iquantization(Cbb_iDPCM, quality_factor=quality_factor, block_size=block_size)
-    Crb_iQ = quant.iquantization(Crb_iDPCM, quality_factor=quality_factor, block_size=block_size)
+    Yb_iQ = quant.iquantization(Yb_iDPCM, quality_factor=quality_factor, block_size=block_size, quant_matrix=Y_quant_matrix)
+    Cbb_iQ = quant.iquantization(Cbb_iDPCM, quality_factor=quality_factor, block_size=block_size, quant_matrix=Cb_quant_matrix)
+    Crb_iQ = quant.iquantization(Crb_iDPCM, quality_factor=quality_factor, block_size=block_size, quant_matrix=Cr_quant_matrix)
     if return_intermidiate_values:
        intermidiate_values.Yb_iQ  = Yb_iQ.copy()
        intermidiate_values.Cbb_iQ = Cbb_iQ.copy()
        intermidiate_values.Crb_iQ = Crb_iQ.copy()
 
     # IDCT
-    Yb_iDCT = dct.idct_blocks(Yb_iQ, block_size=block_size)
-    Cbb_iDCT = dct.idct_blocks(Cbb_iQ, block_size=block_size)
-    Crb_iDCT = dct.idct_blocks(Crb_iQ, block_size=block_size)
+    if scale == 1:
+        Yb_iDCT = dct.idct_blocks(Yb_iQ, block_size=block_size)
+        Cbb_iDCT = dct.idct_blocks(Cbb_iQ, block_size=block_size)
+        Crb_iDCT = dct.idct_blocks(Crb_iQ, block_size=block_size)
+    else:
+        Yb_iDCT = dct.scaled_idct_blocks(Yb_iQ, block_size=block_size, scale=scale)
+        Cbb_iDCT = dct.scaled_idct_blocks(Cbb_iQ, block_size=block_size, scale=scale)
+        Crb_iDCT = dct.scaled_idct_blocks(Crb_iQ, block_size=block_size, scale=scale)
+    if encoded_data.level_shift:
+        Yb_iDCT += encoded_data.level_shift
+        Cbb_iDCT += encoded_data.level_shift
+        Crb_iDCT += encoded_data.level_shift
     if return_intermidiate_values:
         intermidiate_values.Yb_iDCT = Yb_iDCT.copy()
         intermidiate_values.Cbb_iDCT = Cbb_iDCT.copy()
         intermidiate_values.Crb_iDCT = Crb_iDCT.copy()
 
+    h, w, _ = encoded_data.original_image_shape
+    image_reconstructed = reconstruct_rgb(
+        Yb_iDCT,
+        Cbb_iDCT,
+        Crb_iDCT,
+        (-(-h // scale), -(-w // scale)),
+        downsampling=downsampling,
+        interpolation=interpolation,
+    )
+
+    return image_reconstructed, intermidiate_values
+
+def reconstruct_rgb(
+    Y: np.ndarray,
+    Cb: np.ndarray,
+    Cr: np.ndarray,
+    size: tuple[int, int],
+    *,
+    downsampling: str,
+    interpolation: int | None = cv2.INTER_LINEAR,
+) -> np.ndarray:
+    """
+    Últimos passos de decoder: upsampling da crominância, conversão para RGB e
+    remoção do padding.
+
+    Args:
+        Y (np.ndarray): Canal Y reconstruído (depois da IDCT)
+        Cb (np.ndarray): Canal Cb reconstruído
+        Cr (np.ndarray): Canal Cr reconstruído
+        size (tuple[int, int]): Altura e largura da imagem sem padding
+        downsampling (str): Método de subamostragem usado
+        interpolation (int): Método de interpolação para upsampling
+
+    Returns:
+        np.ndarray: Imagem RGB (uint8)
+    """
     # Upsampling (se necessário)
     if downsampling != '4:4:4':
         assert interpolation is not None
         ycbcr_reconstructed = cd.upsample_ycbcr(
-            Yb_iDCT,
-            Cbb_iDCT,
-            Crb_iDCT,
+            Y,
+            Cb,
+            Cr,
             sampling=downsampling,
             interpolation=interpolation
         )
         Y_reconstructed, Cb_reconstructed, Cr_reconstructed = cv2.split(ycbcr_reconstructed)
     else:
-        Y_reconstructed, Cb_reconstructed, Cr_reconstructed = Yb_iDCT, Cbb_iDCT, Crb_iDCT
+        Y_reconstructed, Cb_reconstructed, Cr_reconstructed = Y, Cb, Cr
 
     # Conversão para RGB
     r_reconstructed, g_reconstructed, b_reconstructed = csc.ycbcr_to_rgb(Y_reconstructed, Cb_reconstructed, Cr_reconstructed)
@@ -101,10 +174,479 @@ def decoder(
     image_reconstructed = cv2.merge([r_reconstructed, g_reconstructed, b_reconstructed])
 
     # Recorta para o tamanho original (remove o padding)
-    h, w, _ = encoded_data.original_image_shape
-    image_reconstructed = prep.ipadding(image_reconstructed, (h, w))
+    image_reconstructed = prep.ipadding(image_reconstructed, size)
 
     # Garante que os valores estão no intervalo correto
     image_reconstructed = image_reconstructed.clip(0, 255).astype(np.uint8)
 
-    return image_reconstructed, intermidiate_values
+    return image_reconstructed
+
+# Linhas de crominância acima e abaixo de cada faixa dadas ao upsampling, para que
+# a interpolação veja os mesmos vizinhos que no upsampling da imagem inteira
+BAND_HALO = 4
+
+def _decode_channel_rows(
+    dpcm_rows: Iterator[np.ndarray],
+    quant_matrix: np.ndarray | None,
+    quality_factor: int,
+    block_size: int,
+    level_shift: int,
+    restart_interval: int,
+) -> Iterator[np.ndarray]:
+    """
+    Reconstrói um canal faixa a faixa: DPCM inverso, desquantização e IDCT.
+    """
+    previous_dc = 0
+    first_block = 0
+    for rows in dpcm_rows:
+        # As diferenças DC continuam da faixa anterior
+        quantized = dpcm.dpcm_decode(rows, block_size=block_size, restart_interval=restart_interval, first_block=first_block, previous_dc=previous_dc)
+        previous_dc = quantized[-block_size, -block_size]
+        first_block += rows.size // block_size ** 2
+
+        channel = dct.idct_blocks(quant.iquantization(quantized, quality_factor=quality_factor, block_size=block_size, quant_matrix=quant_matrix), block_size=block_size)
+        if level_shift:
+            channel += level_shift
+
+        yield channel
+
+def _block_rows(channel: np.ndarray, block_size: int) -> Iterator[np.ndarray]:
+    for i in range(0, channel.shape[0], block_size):
+        yield channel[i:i + block_size]
+
+class _ChannelBuffer:
+    """
+    Linhas já reconstruídas de um canal, a partir da linha start.
+    """
+    def __init__(self, rows: Iterator[np.ndarray]) -> None:
+        self.rows = rows
+        self.buffer: np.ndarray | None = None
+        self.start = 0
+
+    def get(self, top: int, bottom: int) -> np.ndarray:
+        """Devolve as linhas [top, bottom) e esquece as anteriores a top."""
+        while self.buffer is None or self.start + self.buffer.shape[0] < bottom:
+            rows = next(self.rows)
+            self.buffer = rows if self.buffer is None else np.concatenate([self.buffer, rows])
+
+        self.buffer = self.buffer[top - self.start:]
+        self.start = top
+
+        return self.buffer[:bottom - top]
+
+def _chroma_rows(top: int, bottom: int, scale: int, chroma_height: int) -> tuple[int, int]:
+    """
+    Linhas de crominância necessárias para as linhas [top, bottom) da imagem, com margem.
+    """
+    return max(top // scale - BAND_HALO, 0), min(-(-bottom // scale) + BAND_HALO, chroma_height)
+
+def _band_to_rgb(
+    Y_band: np.ndarray,
+    Cb_band: np.ndarray,
+    Cr_band: np.ndarray,
+    offset: int,
+    scale: int,
+    downsampling: str,
+    interpolation: int | None,
+    width: int,
+) -> np.ndarray:
+    """
+    Upsampling e conversão para RGB de uma faixa. Cb_band e Cr_band incluem a
+    margem devolvida por _chroma_rows e a linha offset do seu upsampling
+    corresponde à primeira linha de Y_band.
+    """
+    rows = Y_band.shape[0]
+
+    # Upsampling (se necessário) das linhas de crominância com margem, recortadas depois
+    if downsampling != '4:4:4':
+        assert interpolation is not None
+        size = (Y_band.shape[1], Cb_band.shape[0] * scale)
+        Cb_band = cv2.resize(Cb_band, size, interpolation=interpolation)
+        Cr_band = cv2.resize(Cr_band, size, interpolation=interpolation)
+
+    r, g, b = csc.ycbcr_to_rgb(Y_band, Cb_band[offset:offset + rows], Cr_band[offset:offset + rows])
+
+    return cv2.merge([r, g, b])[:, :width]
+
+def decode_bands(
+    encoded_data: JpegEncodedData,
+    *,
+    interpolation: int | None = cv2.INTER_LINEAR,
+    band_rows: int | None = None,
+) -> Iterator[np.ndarray]:
+    """
+    Decodifica uma imagem comprimida por faixas horizontais, de cima para baixo.
+
+    Cada faixa passa por DPCM inverso, desquantização, IDCT, upsampling e conversão
+    para RGB sem reconstruir a imagem inteira, pelo que a memória usada é
+    proporcional à largura da imagem. Juntas, as faixas são iguais ao resultado
+    de decoder.
+
+    Args:
+        encoded_data (JpegEncodedData): Dados codificados da imagem
+        interpolation (int): Método de interpolação para upsampling
+        band_rows (int): Linhas de cada faixa, múltiplo de mcu_rows (padrão: mcu_rows)
+
+    Yields:
+        np.ndarray: Faixa RGB (uint8) da imagem, sem o padding
+    """
+    block_size = encoded_data.block_size
+    downsampling = encoded_data.downsampling
+    band_rows = band_rows or mcu_rows(downsampling, block_size)
+    assert band_rows % mcu_rows(downsampling, block_size) == 0, f'Invalid band_rows: {band_rows}. Needs to be a multiple of {mcu_rows(downsampling, block_size)}'
+
+    quant_matrices = encoded_data.quantization_matrices or (None, None, None)
+
+    if encoded_data.Y_huffman is not None:
+        channels = (encoded_data.Y_huffman, encoded_data.Cb_huffman, encoded_data.Cr_huffman)
+        shapes = [channel.shape for channel in channels]
+        dpcm_rows = [rlh.decode_block_rows(channel) for channel in channels]
+    else:
+        channels = (encoded_data.Y_dpcm, encoded_data.Cb_dpcm, encoded_data.Cr_dpcm)
+        shapes = [channel.shape for channel in channels]
+        dpcm_rows = [_block_rows(channel, block_size) for channel in channels]
+
+    Y, Cb, Cr = (
+        _ChannelBuffer(_decode_channel_rows(rows, quant_matrix, encoded_data.quality_factor, block_size, encoded_data.level_shift, encoded_data.restart_interval))
+        for rows, quant_matrix in zip(dpcm_rows, quant_matrices)
+    )
+
+    h, w, _ = encoded_data.original_image_shape
+    chroma_height = shapes[1][0]
+    scale = shapes[0][0] // chroma_height
+
+    for top in range(0, h, band_rows):
+        bottom = min(top + band_rows, h)
+        chroma_top, chroma_bottom = _chroma_rows(top, bottom, scale, chroma_height)
+
+        yield _band_to_rgb(
+            Y.get(top, bottom),
+            Cb.get(chroma_top, chroma_bottom),
+            Cr.get(chroma_top, chroma_bottom),
+            top - chroma_top * scale,
+            scale,
+            downsampling,
+            interpolation,
+            w,
+        )
+
+class RegionIndex(NamedTuple):
+    # Por canal: posição (em bits) do início de cada linha de blocos, ou None se
+    # o canal não tiver codificação de Huffman
+    row_positions: tuple[np.ndarray | None, ...]
+    # Por canal: coeficiente DC quantizado (sem DPCM) de cada bloco
+    dc: tuple[np.ndarray, ...]
+
+def build_region_index(encoded_data: JpegEncodedData) -> RegionIndex:
+    """
+    Percorre os dados codificados uma vez para que decode_region possa depois
+    descodificar qualquer região sem voltar a ler a imagem inteira.
+
+    Args:
+        encoded_data (JpegEncodedData): Dados codificados da imagem
+
+    Returns:
+        RegionIndex: Início de cada linha de blocos e coeficientes DC de cada canal
+    """
+    block_size = encoded_data.block_size
+    row_positions, dc = [], []
+
+    for name in ('Y', 'Cb', 'Cr'):
+        encoded = getattr(encoded_data, f'{name}_huffman')
+        if encoded is not None:
+            positions, dc_differences = rlh.index_block_rows(encoded)
+        else:
+            positions, dc_differences = None, getattr(encoded_data, f'{name}_dpcm')[::block_size, ::block_size]
+
+        row_positions.append(positions)
+        # Cada DC é um bloco 1x1 para o DPCM inverso
+        dc.append(dpcm.dpcm_decode(dc_differences, block_size=1, restart_interval=encoded_data.restart_interval))
+
+    return RegionIndex(tuple(row_positions), tuple(dc))
+
+def _decode_window(
+    encoded_data: JpegEncodedData,
+    channel: int,
+    index: RegionIndex,
+    rows: tuple[int, int],
+    columns: tuple[int, int],
+) -> np.ndarray:
+    """
+    Reconstrói as amostras de um canal nas linhas e colunas (múltiplos de
+    block_size) dadas, descodificando só as linhas de blocos que as cobrem.
+    """
+    block_size = encoded_data.block_size
+    name = ('Y', 'Cb', 'Cr')[channel]
+    (top, bottom), (left, right) = rows, columns
+
+    positions = index.row_positions[channel]
+    if positions is not None:
+        encoded = getattr(encoded_data, f'{name}_huffman')
+        window = rlh.decode_block_row_range(encoded, top // block_size, (bottom - top) // block_size, positions)[:, left:right]
+    else:
+        window = np.array(getattr(encoded_data, f'{name}_dpcm')[top:bottom, left:right], dtype=np.int32)
+
+    # O DPCM inverso é substituído pelos DC do índice
+    window[::block_size, ::block_size] = index.dc[channel][top // block_size:bottom // block_size, left // block_size:right // block_size]
+
+    quant_matrix = encoded_data.quantization_matrices[channel] if encoded_data.quantization_matrices is not None else None
+
+    return _reconstruct_range(window, quant_matrix, encoded_data.quality_factor, block_size, encoded_data.level_shift)
+
+def _block_range(start: int, stop: int, block_size: int) -> tuple[int, int]:
+    return start // block_size * block_size, -(-stop // block_size) * block_size
+
+def decode_region(
+    encoded_data: JpegEncodedData,
+    x: int,
+    y: int,
+    w: int,
+    h: int,
+    *,
+    interpolation: int | None = cv2.INTER_LINEAR,
+    index: RegionIndex | None = None,
+) -> np.ndarray:
+    """
+    Decodifica só a região [y, y + h) x [x, x + w) de uma imagem comprimida.
+
+    Só os blocos que cobrem a região (e, na crominância, a margem de BAND_HALO
+    amostras de que o upsampling precisa) são desquantizados e passam pela IDCT;
+    a descodificação de Huffman começa na linha de blocos da região, a partir do
+    índice. O resultado é igual ao recorte correspondente de decoder.
+
+    Args:
+        encoded_data (JpegEncodedData): Dados codificados da imagem
+        x (int): Primeira coluna da região
+        y (int): Primeira linha da região
+        w (int): Largura da região
+        h (int): Altura da região
+        interpolation (int): Método de interpolação para upsampling
+        index (RegionIndex): Índice de build_region_index, para reutilizar entre
+            regiões da mesma imagem (padrão: construído nesta chamada)
+
+    Returns:
+        np.ndarray: Região RGB (uint8) da imagem
+    """
+    height, width, _ = encoded_data.original_image_shape
+    assert 0 <= x and 0 <= y and 0 < w and 0 < h and x + w <= width and y + h <= height, f'Invalid region: {(x, y, w, h)} of a {width}x{height} image'
+
+    if index is None:
+        index = build_region_index(encoded_data)
+
+    block_size = encoded_data.block_size
+    luma_shape = index.dc[0].shape
+    chroma_shape = index.dc[1].shape
+    scale_y = luma_shape[0] // chroma_shape[0]
+    scale_x = luma_shape[1] // chroma_shape[1]
+
+    Y_rows, Y_columns = _block_range(y, y + h, block_size), _block_range(x, x + w, block_size)
+    Y = _decode_window(encoded_data, 0, index, Y_rows, Y_columns)
+    Y = Y[y - Y_rows[0]:y - Y_rows[0] + h, x - Y_columns[0]:x - Y_columns[0] + w]
+
+    # Amostras de crominância das quais dependem as da região, com margem
+    chroma_rows = _block_range(*_chroma_rows(y, y + h, scale_y, chroma_shape[0] * block_size), block_size)
+    chroma_columns = _block_range(*_chroma_rows(x, x + w, scale_x, chroma_shape[1] * block_size), block_size)
+    Cb, Cr = (_decode_window(encoded_data, channel, index, chroma_rows, chroma_columns) for channel in (1, 2))
+
+    if encoded_data.downsampling != '4:4:4':
+        assert interpolation is not None
+        size = (Cb.shape[1] * scale_x, Cb.shape[0] * scale_y)
+        Cb = cv2.resize(Cb, size, interpolation=interpolation)
+        Cr = cv2.resize(Cr, size, interpolation=interpolation)
+
+    top, left = y - chroma_rows[0] * scale_y, x - chroma_columns[0] * scale_x
+    r, g, b = csc.ycbcr_to_rgb(Y, Cb[top:top + h, left:left + w], Cr[top:top + h, left:left + w])
+
+    return cv2.merge([r, g, b]).clip(0, 255).astype(np.uint8)
+
+def decode_thumbnail(
+    encoded_data: JpegEncodedData,
+    *,
+    interpolation: int | None = cv2.INTER_LINEAR,
+    index: RegionIndex | None = None,
+) -> np.ndarray:
+    """
+    Decodifica uma miniatura com 1/block_size da resolução só a partir dos
+    coeficientes DC, sem IDCT.
+
+    Com a DCT ortonormal, o coeficiente DC de um bloco é block_size vezes a média
+    das suas amostras, pelo que cada bloco dá um pixel da miniatura. Os planos DC
+    da crominância são ampliados para o tamanho do plano DC da luminância. Os DC
+    vêm de build_region_index, que só descodifica os DC e salta os AC.
+
+    Args:
+        encoded_data (JpegEncodedData): Dados codificados da imagem
+        interpolation (int): Método de interpolação para upsampling
+        index (RegionIndex): Índice de build_region_index, se já existir (os DC
+            vêm dele; padrão: construído nesta chamada)
+
+    Returns:
+        np.ndarray: Miniatura RGB (uint8) com ceil(h / block_size) x ceil(w / block_size) pixels
+    """
+    if index is None:
+        index = build_region_index(encoded_data)
+
+    block_size = encoded_data.block_size
+
+    # Médias dos blocos: DC desquantizado / block_size (mais o level shift)
+    Y, Cb, Cr = (
+        np.multiply(dc, quant_matrix[0, 0] / block_size, dtype=np.float32) + encoded_data.level_shift
+        for dc, quant_matrix in zip(index.dc, encoded_data.get_quantization_matrices())
+    )
+
+    if encoded_data.downsampling != '4:4:4':
+        assert interpolation is not None
+        size = (Y.shape[1], Y.shape[0])
+        Cb = cv2.resize(Cb, size, interpolation=interpolation)
+        Cr = cv2.resize(Cr, size, interpolation=interpolation)
+
+    r, g, b = csc.ycbcr_to_rgb(Y, Cb, Cr)
+
+    h, w, _ = encoded_data.original_image_shape
+    return cv2.merge([r, g, b])[:-(-h // block_size), :-(-w // block_size)].clip(0, 255).astype(np.uint8)
+
+def _reconstruct_range(
+    quantized: np.ndarray,
+    quant_matrix: np.ndarray | None,
+    quality_factor: int,
+    block_size: int,
+    level_shift: int,
+) -> np.ndarray:
+    """
+    Desquantização e IDCT de um intervalo de linhas de blocos (já sem DPCM).
+    """
+    channel = dct.idct_blocks(quant.iquantization(quantized, quality_factor=quality_factor, block_size=block_size, quant_matrix=quant_matrix), block_size=block_size)
+    if level_shift:
+        channel += level_shift
+
+    return channel
+
+def _submit_segments(executor: Executor, encoded: rlh.EntropyCodedChannel, groups: int) -> list:
+    n_segments = len(encoded.segment_offsets)
+    segments_per_group = -(-n_segments // groups) or 1
+
+    futures = []
+    for first in range(0, n_segments, segments_per_group):
+        start, end, first_block, n_blocks = rlh.segment_range(encoded, first, min(segments_per_group, n_segments - first))
+        # Só os bytes do grupo vão para o worker (um memoryview de um container
+        # mapeado não pode ser enviado para uma pool de processos)
+        futures.append(executor.submit(
+            rlh.decode_segment_data,
+            bytes(encoded.data[start:end]),
+            encoded.dc_table,
+            encoded.ac_table,
+            encoded.block_size,
+            encoded.restart_interval,
+            first_block,
+            n_blocks,
+        ))
+
+    return futures
+
+def parallel_decoder(
+    encoded_data: JpegEncodedData,
+    *,
+    interpolation: int | None = cv2.INTER_LINEAR,
+    executor: Executor | None = None,
+    workers: int | None = None,
+    range_rows: int | None = None,
+) -> np.ndarray:
+    """
+    Decodifica uma imagem comprimida numa pool de workers.
+
+    A descodificação de Huffman dos três canais corre em paralelo. O DPCM inverso
+    (uma soma cumulativa) é feito logo de seguida para cada canal inteiro, o que
+    torna independentes os intervalos de range_rows linhas: a desquantização e a
+    IDCT de cada canal e intervalo, e depois o upsampling e a conversão para RGB
+    de cada faixa, são tarefas separadas. O resultado é igual ao de decoder.
+
+    Uma pool de threads funciona bem, porque o NumPy e o OpenCV libertam o GIL,
+    exceto na descodificação de Huffman, que só é paralela com uma pool de processos.
+    Com restart_interval, cada canal é ainda dividido em grupos de segmentos
+    descodificados de forma independente.
+
+    Args:
+        encoded_data (JpegEncodedData): Dados codificados da imagem
+        interpolation (int): Método de interpolação para upsampling
+        executor (Executor): Pool onde correr (padrão: pool de workers threads)
+        workers (int): Número de threads da pool por omissão (padrão: os.cpu_count())
+        range_rows (int): Linhas de cada intervalo, múltiplo de mcu_rows (padrão:
+            4 intervalos por worker)
+
+    Returns:
+        np.ndarray: Imagem decodificada em formato RGB
+    """
+    if executor is None:
+        with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+            return parallel_decoder(encoded_data, interpolation=interpolation, executor=pool, range_rows=range_rows)
+
+    block_size = encoded_data.block_size
+    downsampling = encoded_data.downsampling
+    quant_matrices = encoded_data.quantization_matrices or (None, None, None)
+
+    if encoded_data.Y_huffman is not None:
+        huffman_channels = (encoded_data.Y_huffman, encoded_data.Cb_huffman, encoded_data.Cr_huffman)
+        if encoded_data.restart_interval:
+            # Os segmentos começam em bytes conhecidos: cada canal é dividido em grupos de segmentos
+            groups = 4 * (workers or os.cpu_count() or 1)
+            dpcm_futures = [_submit_segments(executor, channel, groups) for channel in huffman_channels]
+            dpcm_channels = []
+            for channel, futures in zip(huffman_channels, dpcm_futures):
+                blocks = np.concatenate([future.result() for future in futures])
+                dpcm_channels.append(from_blocks(blocks.reshape(channel.shape[0] // block_size, channel.shape[1] // block_size, block_size, block_size)))
+        else:
+            # Com bytes em vez de memoryviews (de um container mapeado), os canais podem ir para uma pool de processos
+            dpcm_futures = [executor.submit(rlh.rle_and_huffman_decode, channel._replace(data=bytes(channel.data))) for channel in huffman_channels]
+            dpcm_channels = [future.result() for future in dpcm_futures]
+    else:
+        dpcm_channels = [encoded_data.Y_dpcm, encoded_data.Cb_dpcm, encoded_data.Cr_dpcm]
+
+    # Com os DC reconstruídos os intervalos deixam de depender uns dos outros
+    quantized_channels = [dpcm.dpcm_decode(channel, block_size=block_size, restart_interval=encoded_data.restart_interval) for channel in dpcm_channels]
+    del dpcm_channels
+
+    h, w, _ = encoded_data.original_image_shape
+    padded_height = quantized_channels[0].shape[0]
+    chroma_height = quantized_channels[1].shape[0]
+    scale = padded_height // chroma_height
+
+    mcu = mcu_rows(downsampling, block_size)
+    if range_rows is None:
+        range_rows = -(-padded_height // (4 * (workers or os.cpu_count() or 1)))
+        range_rows = -(-range_rows // mcu) * mcu
+    assert range_rows % mcu == 0, f'Invalid range_rows: {range_rows}. Needs to be a multiple of {mcu}'
+
+    channel_futures = []
+    for quantized, quant_matrix in zip(quantized_channels, quant_matrices):
+        rows = range_rows * quantized.shape[0] // padded_height
+        channel_futures.append([
+            executor.submit(_reconstruct_range, quantized[top:top + rows], quant_matrix, encoded_data.quality_factor, block_size, encoded_data.level_shift)
+            for top in range(0, quantized.shape[0], rows)
+        ])
+    del quantized_channels
+
+    Y, Cb, Cr = (np.concatenate([future.result() for future in futures]) for futures in channel_futures)
+    del channel_futures
+
+    image_reconstructed = np.empty((h, w, 3), dtype=np.uint8)
+    band_futures = []
+    for top in range(0, h, range_rows):
+        bottom = min(top + range_rows, h)
+        chroma_top, chroma_bottom = _chroma_rows(top, bottom, scale, chroma_height)
+
+        band_futures.append((top, bottom, executor.submit(
+            _band_to_rgb,
+            Y[top:bottom],
+            Cb[chroma_top:chroma_bottom],
+            Cr[chroma_top:chroma_bottom],
+            top - chroma_top * scale,
+            scale,
+            downsampling,
+            interpolation,
+            w,
+        )))
+
+    for top, bottom, future in band_futures:
+        image_reconstructed[top:bottom] = future.result()
+
+    return image_reconstructed
@@ -1,8 +1,13 @@
 from common import TEST_PARAMETERS
 from matplotlib import pyplot as plt
+import cv2
 import decoder
 import encoder
 import numpy as np
+import pytest
+import step3_discrete_cosine_transform as dct
+import step6_run_length_huffman_encoding as rlh
+import tracemalloc
 
 image = plt.imread(TEST_PARAMETERS.image_path)
 jpeg_encoded_data, jpeg_intermidiate_values = encoder.encoder(
@@ -32,3 +37,121 @@ Yb_iDPCM = np.array([
 
 def test_decoder_idpcm():
     assert False
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+@pytest.mark.parametrize('rle_and_huffman', (True, False))
+@pytest.mark.parametrize('interpolation', (cv2.INTER_LINEAR, cv2.INTER_CUBIC))
+def test_decode_bands(downsampling, rle_and_huffman, interpolation):
+    cropped = image[:301, :257]
+    encoded_data, _ = encoder.encoder(cropped, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor, rle_and_huffman=rle_and_huffman)
+
+    expected, _ = decoder.decoder(encoded_data, interpolation=interpolation)
+    bands = list(decoder.decode_bands(encoded_data, interpolation=interpolation))
+
+    assert all(band.shape[0] == encoder.mcu_rows(downsampling) for band in bands[:-1])
+    assert np.array_equal(np.concatenate(bands), expected)
+
+def test_decode_bands_memory():
+    peaks = []
+    for tiles in (2, 8):
+        tall = np.tile(image[:, :128], (tiles, 1, 1))
+        encoded_data, _ = encoder.encoder(tall, quality_factor=TEST_PARAMETERS.quality_factor)
+
+        tracemalloc.start()
+        for band in decoder.decode_bands(encoded_data, band_rows=64):
+            assert band.shape[1] == 128
+        peaks.append(tracemalloc.get_traced_memory()[1])
+        tracemalloc.stop()
+
+    # The Huffman lookup tables take the same memory for any size
+    assert peaks[1] - peaks[0] < tall.nbytes / 20, f'{peaks} bytes used to decode {tall.nbytes // 4} and {tall.nbytes} bytes images'
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+@pytest.mark.parametrize('rle_and_huffman', (True, False))
+def test_parallel_decoder(downsampling, rle_and_huffman):
+    cropped = image[:301, :257]
+    encoded_data, _ = encoder.encoder(cropped, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor, rle_and_huffman=rle_and_huffman)
+
+    expected, _ = decoder.decoder(encoded_data)
+    actual = decoder.parallel_decoder(encoded_data, workers=3, range_rows=32)
+
+    assert np.array_equal(actual, expected)
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+def test_restart_interval(downsampling):
+    cropped = image[:301, :257]
+    expected_data, _ = encoder.encoder(cropped, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor)
+    encoded_data, _ = encoder.encoder(cropped, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor, restart_interval=7)
+
+    expected, _ = decoder.decoder(expected_data)
+    actual, _ = decoder.decoder(encoded_data)
+
+    assert np.array_equal(actual, expected)
+    assert np.array_equal(np.concatenate(list(decoder.decode_bands(encoded_data))), expected)
+    assert np.array_equal(decoder.parallel_decoder(encoded_data, workers=3, range_rows=32), expected)
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+@pytest.mark.parametrize('rle_and_huffman', (True, False))
+@pytest.mark.parametrize('interpolation', (cv2.INTER_LINEAR, cv2.INTER_CUBIC))
+def test_decode_region(downsampling, rle_and_huffman, interpolation):
+    cropped = image[:301, :257]
+    encoded_data, _ = encoder.encoder(cropped, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor, rle_and_huffman=rle_and_huffman, restart_interval=5)
+
+    expected, _ = decoder.decoder(encoded_data, interpolation=interpolation)
+    index = decoder.build_region_index(encoded_data)
+
+    for x, y, w, h in ((0, 0, 257, 301), (13, 37, 100, 51), (200, 250, 57, 51), (256, 300, 1, 1)):
+        actual = decoder.decode_region(encoded_data, x, y, w, h, interpolation=interpolation, index=index)
+        assert np.array_equal(actual, expected[y:y + h, x:x + w]), (x, y, w, h)
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+@pytest.mark.parametrize('rle_and_huffman', (True, False))
+def test_decode_thumbnail(downsampling, rle_and_huffman):
+    encoded_data, _ = encoder.encoder(image, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor, rle_and_huffman=rle_and_huffman)
+
+    thumbnail = decoder.decode_thumbnail(encoded_data)
+    assert thumbnail.shape == (-(-image.shape[0] // 8), -(-image.shape[1] // 8), 3)
+
+    # Cada pixel é a média de um bloco da imagem decodificada (só nos blocos completos)
+    decoded, _ = decoder.decoder(encoded_data)
+    h, w = image.shape[0] // 8, image.shape[1] // 8
+    block_means = decoded[:8 * h, :8 * w].reshape(h, 8, w, 8, 3).mean(axis=(1, 3))
+    assert np.abs(block_means - thumbnail[:h, :w]).mean() < 3
+
+@pytest.mark.parametrize('restart_interval', (0, 7))
+def test_decode_thumbnail_dc_only(monkeypatch, restart_interval):
+    encoded_data, iv = encoder.encoder(image, quality_factor=90, restart_interval=restart_interval, return_intermidiate_values=True)
+    raw_data, _ = encoder.encoder(image, quality_factor=90, restart_interval=restart_interval, rle_and_huffman=False)
+
+    def fail(*args, **kwargs):
+        raise AssertionError('The thumbnail decoded the AC coefficients or ran the IDCT')
+
+    # Só os DC são descodificados: os AC são saltados e não há IDCT
+    decode_segmented_blocks = rlh._decode_segmented_blocks
+    def dc_only(reader, dc_lookup, ac_lookup, coefficients, first_block, restart_interval, decode=None):
+        if decode is not rlh.skip_blocks:
+            fail()
+        decode_segmented_blocks(reader, dc_lookup, ac_lookup, coefficients, first_block, restart_interval, decode)
+
+    monkeypatch.setattr(rlh, '_decode_segmented_blocks', dc_only)
+    monkeypatch.setattr(rlh, 'decode_blocks', fail)
+    monkeypatch.setattr(dct, 'idct_blocks', fail)
+
+    index = decoder.build_region_index(encoded_data)
+    assert np.array_equal(index.dc[0], iv.Y_q[::8, ::8])
+
+    thumbnail = decoder.decode_thumbnail(encoded_data, index=index)
+    assert np.array_equal(thumbnail, decoder.decode_thumbnail(raw_data))
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+@pytest.mark.parametrize('scale', (2, 4, 8))
+def test_decoder_scale(downsampling, scale):
+    cropped = image[:672]
+    encoded_data, _ = encoder.encoder(cropped, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor)
+
+    full, _ = decoder.decoder(encoded_data)
+    scaled, _ = decoder.decoder(encoded_data, scale=scale)
+    assert scaled.shape == (cropped.shape[0] // scale, cropped.shape[1] // scale, 3)
+
+    expected = cv2.resize(full, scaled.shape[1::-1], interpolation=cv2.INTER_AREA)
+    assert np.abs(expected.astype(int) - scaled).mean() < 4
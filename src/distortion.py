@@ -0,0 +1,116 @@
+from common import COLOR_CONVERSION, to_blocks
+from encoder import TransformedImage
+from sweep import MAX_BATCH_BYTES
+from typing import Iterable, Iterator, NamedTuple
+import cv2
+import decoder
+import numpy as np
+import step3_discrete_cosine_transform as dct
+import step4_quatization as quant
+
+PEAK = 255
+# Weight of the error of each of Y, Cb and Cr in the mean squared error of R, G
+# and B, assuming the errors of the channels are uncorrelated
+RGB_WEIGHTS = (COLOR_CONVERSION.YCbCr2RGB_matrix ** 2).mean(axis=0)
+
+class DistortionEstimate(NamedTuple):
+    quality_factor: int
+    # Mean squared quantization error of Y, Cb and Cr (each at its own sampling)
+    channel_mse: tuple[float, float, float]
+    channel_psnr: tuple[float, float, float]
+    # Approximate mean squared error of the decoded RGB image
+    rgb_mse: float
+    rgb_psnr: float
+
+def psnr(mse: float, peak: float = PEAK) -> float:
+    """
+    Returns the PSNR in dB of a mean squared error (inf for 0).
+    """
+    return float(10 * np.log10(peak ** 2 / mse)) if mse > 0 else float('inf')
+
+def _quantization_mse(coefficients: np.ndarray, quality_factors: list[int], block_size: int) -> np.ndarray:
+    # The same quantization as quant.quantization and quant.iquantization, broadcast over the qualities
+    indices = [quality_factor - 1 for quality_factor in quality_factors]
+    matrices = quant.QUANTIZATION_MATRICES[indices][:, None, None]
+
+    blocks = to_blocks(coefficients, block_size)
+    quantized = np.divide(blocks, matrices)
+    np.rint(quantized, out=quantized)
+    error = np.multiply(quantized, matrices, dtype=np.float64)
+    np.subtract(blocks, error, out=error)
+
+    return np.square(error, out=error).mean(axis=(1, 2, 3, 4))
+
+def baseline_mse(
+    image: np.ndarray,
+    transformed: TransformedImage,
+    *,
+    interpolation: int | None = cv2.INTER_LINEAR,
+) -> float:
+    """
+    Measures the error of the decoded image that does not depend on the quality
+    factor (chroma downsampling and rounding to uint8) by decoding the
+    coefficients without quantization. It only needs to run once per image.
+
+    Args:
+        image (np.ndarray): RGB image.
+        transformed (TransformedImage): Output of encoder.transform for image.
+        interpolation (int): Interpolation used for the chroma upsampling.
+
+    Returns:
+        float: Mean squared error of the RGB image.
+    """
+    Y, Cb, Cr = (dct.idct_blocks(channel, block_size=transformed.block_size) for channel in transformed[:3])
+    reconstructed = decoder.reconstruct_rgb(Y, Cb, Cr, tuple(transformed.image_shape[:2]), downsampling=transformed.downsampling, interpolation=interpolation)
+
+    return float(np.mean(np.square(image.astype(np.float64) - reconstructed)))
+
+def estimate_distortion(
+    transformed: TransformedImage,
+    quality_factors: Iterable[int],
+    *,
+    baseline: float = 0.0,
+    max_batch_bytes: int = MAX_BATCH_BYTES,
+) -> Iterator[DistortionEstimate]:
+    """
+    Estimates the error of encoding an image at many quality factors from its
+    DCT coefficients, without decoding.
+
+    The blocked DCT is orthonormal, so the mean squared error of each channel
+    after the IDCT is the mean squared difference between the coefficients and
+    their quantized and dequantized values. The RGB error combines the errors of
+    the channels with RGB_WEIGHTS, plus the error that does not depend on the
+    quality (see baseline_mse). The channel errors include the padding, and the
+    chroma errors are taken as unchanged by the upsampling.
+
+    Args:
+        transformed (TransformedImage): Output of encoder.transform.
+        quality_factors (Iterable[int]): Quality factors, in the order of the results.
+        baseline (float): RGB error that does not depend on the quality factor.
+        max_batch_bytes (int): Memory budget of each batch of quality factors.
+
+    Yields:
+        DistortionEstimate: Estimated error of each quality factor.
+    """
+    quality_factors = [int(quality_factor) for quality_factor in quality_factors]
+    assert all(1 <= quality_factor <= 100 for quality_factor in quality_factors), f'Invalid quality_factors: {quality_factors}'
+
+    channels = transformed[:3]
+
+    # Two float64 temporaries of the luma channel per quality factor
+    batch_size = max(1, max_batch_bytes // (16 * channels[0].size))
+
+    for first in range(0, len(quality_factors), batch_size):
+        batch = quality_factors[first:first + batch_size]
+        channel_mse = np.stack([_quantization_mse(channel, batch, transformed.block_size) for channel in channels], axis=1)
+
+        for quality_factor, mse in zip(batch, channel_mse):
+            rgb_mse = float(RGB_WEIGHTS @ mse) + baseline
+
+            yield DistortionEstimate(
+                quality_factor,
+                tuple(float(value) for value in mse),
+                tuple(psnr(value) for value in mse),
+                rgb_mse,
+                psnr(rgb_mse),
+            )
@@ -0,0 +1,42 @@
+from common import TEST_PARAMETERS
+from matplotlib import pyplot as plt
+import distortion
+import encoder
+import numpy as np
+import pytest
+import step3_discrete_cosine_transform as dct
+import step4_quatization as quant
+import sweep
+
+image = plt.imread(TEST_PARAMETERS.image_path)[:301, :257]
+quality_factors = [90, 75, 50, 25, 10]
+
+def test_estimate_distortion_channels():
+    transformed = encoder.transform(image, downsampling='4:2:0', block_size=8)
+
+    # A small budget, so the qualities are split into batches
+    estimates = list(distortion.estimate_distortion(transformed, quality_factors, max_batch_bytes=1 << 20))
+    assert [estimate.quality_factor for estimate in estimates] == quality_factors
+
+    for estimate in estimates:
+        # The error of the channels after the IDCT, as the decoder computes them
+        for coefficients, mse, psnr in zip(transformed[:3], estimate.channel_mse, estimate.channel_psnr):
+            dequantized = quant.iquantization(quant.quantization(coefficients, quality_factor=estimate.quality_factor), quality_factor=estimate.quality_factor)
+            expected = np.mean(np.square(dct.idct_blocks(dequantized).astype(np.float64) - dct.idct_blocks(coefficients)))
+
+            assert mse == pytest.approx(expected, rel=1e-4)
+            assert psnr == pytest.approx(10 * np.log10(255 ** 2 / expected), rel=1e-4)
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+def test_estimate_distortion_rgb(downsampling):
+    transformed = encoder.transform(image, downsampling=downsampling, block_size=8)
+    baseline = distortion.baseline_mse(image, transformed)
+
+    estimates = distortion.estimate_distortion(transformed, quality_factors, baseline=baseline)
+    results = sweep.quality_sweep(None, quality_factors, transformed=transformed)
+
+    for estimate, result in zip(estimates, results):
+        actual = np.mean(np.square(image.astype(np.float64) - result.image))
+
+        assert estimate.rgb_mse == pytest.approx(actual, rel=0.1), estimate.quality_factor
+        assert estimate.rgb_psnr == pytest.approx(10 * np.log10(255 ** 2 / actual), abs=0.5)
@@ -1,12 +1,20 @@
+from cache import ArrayCache, default_cache, file_version
 from common import VALID_DOWNSAMPLES, VALID_DOWNSAMPLES_TYPE
+from concurrent.futures import Executor, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Iterator, NamedTuple
+import cache as array_cache
+import common
 import cv2
 import numpy as np
+import os
 import step0_preprocessing as prep
 import step1_color_space_conversion as csc
 import step2_chrominance_downsampling as cd
 import step3_discrete_cosine_transform as dct
 import step4_quatization as quant
 import step5_dpcm as dpcm
+import step6_run_length_huffman_encoding as rlh
 
 class JpegEncodedIntermidiateValues:
     original_image: np.ndarray = np.zeros(1)
@@ -43,28 +51,79 @@ class JpegEncodedData:
     quality_factor: int
     block_size: int
 
-    Y_dpcm: np.ndarray
-    Cb_dpcm: np.ndarray
-    Cr_dpcm: np.ndarray
+    # Per channel (Y, Cb, Cr) quantization matrices, when they are not the ones of
+    # quality_factor (e.g. read from a JPEG file)
+    quantization_matrices: tuple[np.ndarray, np.ndarray, np.ndarray] | None
+    # Value added to the samples after the IDCT (128 for JPEG files, which level shift the samples)
+    level_shift: int
+    # Number of blocks after which the DC prediction of each channel restarts from 0
+    # (and, when entropy coded, a new byte aligned segment starts). 0 for none
+    restart_interval: int
+
+    # Only one of the representations is kept: the DPCM coefficients, or their
+    # run length and Huffman encoding when the encoder is called with rle_and_huffman
+    Y_dpcm: np.ndarray | None
+    Cb_dpcm: np.ndarray | None
+    Cr_dpcm: np.ndarray | None
+
+    Y_huffman: rlh.EntropyCodedChannel | None
+    Cb_huffman: rlh.EntropyCodedChannel | None
+    Cr_huffman: rlh.EntropyCodedChannel | None
 
     def __init__(
         self,
         *,
-        Y_dpcm: np.ndarray,
-        Cb_dpcm: np.ndarray,
-        Cr_dpcm: np.ndarray,
+        Y_dpcm: np.ndarray | None = None,
+        Cb_dpcm: np.ndarray | None = None,
+        Cr_dpcm: np.ndarray | None = None,
+        Y_huffman: rlh.EntropyCodedChannel | None = None,
+        Cb_huffman: rlh.EntropyCodedChannel | None = None,
+        Cr_huffman: rlh.EntropyCodedChannel | None = None,
         quality_factor: int,
         downsampling: VALID_DOWNSAMPLES_TYPE,
         block_size: int,
         image_shape: np.ndarray,
+        quantization_matrices: tuple[np.ndarray, np.ndarray, np.ndarray] | None = None,
+        level_shift: int = 0,
+        restart_interval: int = 0,
     ) -> None:
         self.Y_dpcm = Y_dpcm
         self.Cb_dpcm = Cb_dpcm
         self.Cr_dpcm = Cr_dpcm
+        self.Y_huffman = Y_huffman
+        self.Cb_huffman = Cb_huffman
+        self.Cr_huffman = Cr_huffman
         self.quality_factor = quality_factor
         self.downsampling = downsampling
         self.block_size = block_size
         self.original_image_shape = image_shape
+        self.quantization_matrices = quantization_matrices
+        self.level_shift = level_shift
+        self.restart_interval = restart_interval
+
+    def dpcm_channels(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the DPCM coefficients of each channel, undoing the run length and
+        Huffman encoding if the channels are entropy coded.
+        """
+        if self.Y_huffman is not None:
+            return (
+                rlh.rle_and_huffman_decode(self.Y_huffman),
+                rlh.rle_and_huffman_decode(self.Cb_huffman),
+                rlh.rle_and_huffman_decode(self.Cr_huffman),
+            )
+
+        return self.Y_dpcm, self.Cb_dpcm, self.Cr_dpcm
+
+    def get_quantization_matrices(self) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Returns the quantization matrix of each channel (Y, Cb, Cr).
+        """
+        if self.quantization_matrices is not None:
+            return self.quantization_matrices
+
+        quant_matrix = quant.get_quantization_matrix(self.quality_factor)
+        return quant_matrix, quant_matrix, quant_matrix
 
 def encoder(
     image: np.ndarray,
@@ -74,9 +133,55 @@ def encoder(
     quality_factor: int = 100,
     block_size: int = 8,
     rle_and_huffman: bool = True,
+    restart_interval: int = 0,
+    level_shift: int = 0,
     return_intermidiate_values: bool = False,
+    cache: ArrayCache | bool | None = None,
 ) -> tuple[JpegEncodedData, JpegEncodedIntermidiateValues]:
+    """
+    Encodes an RGB image.
+
+    With a cache (by default the one of the IMAGE_COMPRESSION_CACHE environment
+    variable, see cache.default_cache), results are looked up by the image
+    contents, the parameters and the version of the encoder code before
+    encoding, and stored after. Cached arrays are read only.
+
+    Args:
+        image (np.ndarray): RGB image.
+        downsampling (str): Chroma downsampling.
+        interpolation (int): Interpolation used for the downsampling.
+        quality_factor (int): Quality factor.
+        block_size (int): DCT block size.
+        rle_and_huffman (bool): Whether to entropy code the channels.
+        restart_interval (int): Blocks between DC prediction restarts (0 for none).
+        level_shift (int): Value subtracted from the samples before the DCT (0 or
+            128). JPEG files need 128 (see jfif.encode_jfif).
+        return_intermidiate_values (bool): Whether to keep the output of every stage.
+        cache (ArrayCache | bool): Cache to use, or False to disable the default one.
+
+    Returns:
+        tuple[JpegEncodedData, JpegEncodedIntermidiateValues]: Encoded image and,
+            if requested, the intermediate values.
+    """
     assert downsampling in VALID_DOWNSAMPLES, f'Invalid downsampling: {downsampling}. Needs to be one of the following: {VALID_DOWNSAMPLES}'
+    assert level_shift in VALID_LEVEL_SHIFTS, f'Invalid level_shift: {level_shift}. Needs to be one of the following: {VALID_LEVEL_SHIFTS}'
+
+    if cache is None:
+        cache = default_cache()
+    if cache:
+        key = cache.key(
+            image,
+            version=_code_version(),
+            downsampling=downsampling,
+            interpolation=interpolation,
+            quality_factor=quality_factor,
+            block_size=block_size,
+            restart_interval=restart_interval,
+            level_shift=level_shift,
+        )
+        cached = _from_cache(cache.load(key), image.shape, downsampling, quality_factor, block_size, restart_interval, level_shift, rle_and_huffman, return_intermidiate_values)
+        if cached is not None:
+            return cached
 
     intermidiate_values = JpegEncodedIntermidiateValues()
     if return_intermidiate_values:
@@ -122,7 +227,7 @@ def encoder(
         intermidiate_values.Cb_dct = Cb_dct.copy()
         intermidiate_values.Cr_dct = Cr_dct.copy()
 
-    Y_dct8, Cb_dct8, Cr_dct8 = dct.dct_blocks(Y_d), dct.dct_blocks(Cb_d), dct.dct_blocks(Cr_d)
+    Y_dct8, Cb_dct8, Cr_dct8 = (_level_shift_dc(dct.dct_blocks(channel), level_shift, block_size) for channel in (Y_d, Cb_d, Cr_d))
     if return_intermidiate_values:
         intermidiate_values.Y_dct8 = Y_dct8.copy()
         intermidiate_values.Cb_dct8 = Cb_dct8.copy()
@@ -136,25 +241,548 @@ def encoder(
         intermidiate_values.Cb_q = Cb_q.copy()
         intermidiate_values.Cr_q = Cr_q.copy()
 
-    Y_dpcm = dpcm.dpcm_encode(Y_q, block_size=block_size)
-    Cb_dpcm = dpcm.dpcm_encode(Cb_q, block_size=block_size)
-    Cr_dpcm = dpcm.dpcm_encode(Cr_q, block_size=block_size)
+    Y_dpcm = dpcm.dpcm_encode(Y_q, block_size=block_size, restart_interval=restart_interval)
+    Cb_dpcm = dpcm.dpcm_encode(Cb_q, block_size=block_size, restart_interval=restart_interval)
+    Cr_dpcm = dpcm.dpcm_encode(Cr_q, block_size=block_size, restart_interval=restart_interval)
     if return_intermidiate_values:
         intermidiate_values.Y_dpcm = Y_dpcm.copy()
         intermidiate_values.Cb_dpcm = Cb_dpcm.copy()
         intermidiate_values.Cr_dpcm = Cr_dpcm.copy()
 
     if rle_and_huffman:
-        pass
+        encoded_channels = dict(
+            Y_huffman=rlh.rle_and_huffman_encode(Y_dpcm, block_size, restart_interval=restart_interval),
+            Cb_huffman=rlh.rle_and_huffman_encode(Cb_dpcm, block_size, restart_interval=restart_interval),
+            Cr_huffman=rlh.rle_and_huffman_encode(Cr_dpcm, block_size, restart_interval=restart_interval),
+        )
+    else:
+        encoded_channels = dict(Y_dpcm=Y_dpcm, Cb_dpcm=Cb_dpcm, Cr_dpcm=Cr_dpcm)
 
     encoded_data = JpegEncodedData(
-        Y_dpcm=Y_dpcm,
-        Cb_dpcm=Cb_dpcm,
-        Cr_dpcm=Cr_dpcm,
+        **encoded_channels,
         quality_factor=quality_factor,
         downsampling=downsampling,
         block_size=block_size,
         image_shape=np.array(image.shape),
+        level_shift=level_shift,
+        restart_interval=restart_interval,
     )
 
+    if cache:
+        cache.store(key, _cache_arrays((Y_dpcm, Cb_dpcm, Cr_dpcm), encoded_data, intermidiate_values if return_intermidiate_values else None))
+
     return encoded_data, intermidiate_values
+
+# Level shifts of the samples before the DCT: none, or the one of JPEG files
+VALID_LEVEL_SHIFTS = (0, 128)
+
+def _level_shift_dc(coefficients: np.ndarray, level_shift: int, block_size: int) -> np.ndarray:
+    """
+    Subtracts level_shift from the samples of DCT coefficients. The DCT is
+    orthonormal, so only the DC coefficient changes, by level_shift * block_size.
+    """
+    if level_shift:
+        coefficients[::block_size, ::block_size] -= level_shift * block_size
+
+    return coefficients
+
+@lru_cache(maxsize=None)
+def _code_version() -> str:
+    # Cached results are invalidated by any change to the encoder stages, the
+    # helpers they share (common) or the format of the entries (cache)
+    return file_version(__file__, common.__file__, array_cache.__file__, prep.__file__, csc.__file__, cd.__file__, dct.__file__, quant.__file__, dpcm.__file__, rlh.__file__)
+
+CHANNELS = ('Y', 'Cb', 'Cr')
+# Prefix of the intermediate values in cache entries
+INTERMEDIATE_PREFIX = 'iv.'
+
+def _cache_arrays(
+    dpcm_channels: tuple[np.ndarray, np.ndarray, np.ndarray],
+    encoded_data: JpegEncodedData,
+    intermidiate_values: JpegEncodedIntermidiateValues | None,
+) -> dict[str, np.ndarray]:
+    arrays = {f'{name}_dpcm': channel for name, channel in zip(CHANNELS, dpcm_channels)}
+
+    for name in CHANNELS:
+        channel: rlh.EntropyCodedChannel | None = getattr(encoded_data, f'{name}_huffman')
+        if channel is None:
+            continue
+        arrays[f'{name}_huffman.data'] = np.frombuffer(channel.data, dtype=np.uint8)
+        arrays[f'{name}_huffman.dc_table'] = np.concatenate([channel.dc_table.bits, channel.dc_table.values]).astype(np.uint8)
+        arrays[f'{name}_huffman.ac_table'] = np.concatenate([channel.ac_table.bits, channel.ac_table.values]).astype(np.uint8)
+        if channel.segment_offsets is not None:
+            arrays[f'{name}_huffman.segment_offsets'] = channel.segment_offsets
+
+    if intermidiate_values is not None:
+        arrays.update((INTERMEDIATE_PREFIX + name, value) for name, value in vars(intermidiate_values).items())
+
+    return arrays
+
+def _from_cache(
+    arrays: dict[str, np.ndarray] | None,
+    image_shape: tuple[int, ...],
+    downsampling: VALID_DOWNSAMPLES_TYPE,
+    quality_factor: int,
+    block_size: int,
+    restart_interval: int,
+    level_shift: int,
+    rle_and_huffman: bool,
+    return_intermidiate_values: bool,
+) -> tuple[JpegEncodedData, JpegEncodedIntermidiateValues] | None:
+    if arrays is None:
+        return None
+
+    intermidiate_values = JpegEncodedIntermidiateValues()
+    if return_intermidiate_values:
+        names = [name for name in arrays if name.startswith(INTERMEDIATE_PREFIX)]
+        # Entries stored without the intermediate values are encoded again
+        if not names:
+            return None
+        for name in names:
+            setattr(intermidiate_values, name[len(INTERMEDIATE_PREFIX):], arrays[name])
+
+    if not rle_and_huffman:
+        encoded_channels = {f'{name}_dpcm': arrays[f'{name}_dpcm'] for name in CHANNELS}
+    elif f'{CHANNELS[0]}_huffman.data' in arrays:
+        encoded_channels = {}
+        for name in CHANNELS:
+            dc_table, ac_table = (arrays[f'{name}_huffman.{table}'] for table in ('dc_table', 'ac_table'))
+            encoded_channels[f'{name}_huffman'] = rlh.EntropyCodedChannel(
+                arrays[f'{name}_dpcm'].shape,
+                block_size,
+                rlh.HuffmanTable(np.array(dc_table[:16]), np.array(dc_table[16:])),
+                rlh.HuffmanTable(np.array(ac_table[:16]), np.array(ac_table[16:])),
+                arrays[f'{name}_huffman.data'].tobytes(),
+                restart_interval,
+                arrays.get(f'{name}_huffman.segment_offsets'),
+            )
+    else:
+        encoded_channels = {
+            f'{name}_huffman': rlh.rle_and_huffman_encode(arrays[f'{name}_dpcm'], block_size, restart_interval=restart_interval)
+            for name in CHANNELS
+        }
+
+    encoded_data = JpegEncodedData(
+        **encoded_channels,
+        quality_factor=quality_factor,
+        downsampling=downsampling,
+        block_size=block_size,
+        image_shape=np.array(image_shape),
+        level_shift=level_shift,
+        restart_interval=restart_interval,
+    )
+
+    return encoded_data, intermidiate_values
+
+class TransformedImage(NamedTuple):
+    """
+    DCT coefficients of an image, the encoder stages that do not depend on the
+    quality factor.
+    """
+    Y_dct8: np.ndarray
+    Cb_dct8: np.ndarray
+    Cr_dct8: np.ndarray
+    downsampling: VALID_DOWNSAMPLES_TYPE
+    block_size: int
+    image_shape: tuple[int, ...]
+
+def transform(
+    image: np.ndarray,
+    *,
+    downsampling: VALID_DOWNSAMPLES_TYPE = '4:2:0',
+    interpolation: int | None = cv2.INTER_LINEAR,
+    block_size: int = 8,
+) -> TransformedImage:
+    """
+    Runs padding, color conversion, chroma downsampling and the blocked DCT of encoder.
+
+    Together with encode_transformed this is the same as encoder, but the
+    transform can be quantized at several quality factors.
+
+    Args:
+        image (np.ndarray): RGB image.
+        downsampling (str): Chroma downsampling.
+        interpolation (int): Interpolation used for the downsampling.
+        block_size (int): DCT block size.
+
+    Returns:
+        TransformedImage: DCT coefficients of each channel.
+    """
+    assert downsampling in VALID_DOWNSAMPLES, f'Invalid downsampling: {downsampling}. Needs to be one of the following: {VALID_DOWNSAMPLES}'
+
+    r, g, b = (prep.preprocessing(channel) for channel in csc.rgb_from_ndarray(image))
+    y, cb, cr = csc.rgb_to_ycbcr(r, g, b)
+    Y_d, Cb_d, Cr_d = cd.downsample_ycbcr(cv2.merge([y, cb, cr]), sampling=downsampling, interpolation=interpolation)
+
+    return TransformedImage(
+        dct.dct_blocks(Y_d, block_size),
+        dct.dct_blocks(Cb_d, block_size),
+        dct.dct_blocks(Cr_d, block_size),
+        downsampling,
+        block_size,
+        tuple(image.shape),
+    )
+
+def encode_transformed(
+    transformed: TransformedImage,
+    *,
+    quality_factor: int = 100,
+    rle_and_huffman: bool = True,
+    restart_interval: int = 0,
+    level_shift: int = 0,
+) -> JpegEncodedData:
+    """
+    Runs quantization, DPCM and (optionally) run length and Huffman encoding of encoder.
+
+    Args:
+        transformed (TransformedImage): Output of transform.
+        quality_factor (int): Quality factor.
+        rle_and_huffman (bool): Whether to entropy code the channels.
+        restart_interval (int): Blocks between DC prediction restarts (0 for none).
+        level_shift (int): Value subtracted from the samples before quantization (0 or 128).
+
+    Returns:
+        JpegEncodedData: Encoded image, the same as encoder returns.
+    """
+    assert level_shift in VALID_LEVEL_SHIFTS, f'Invalid level_shift: {level_shift}. Needs to be one of the following: {VALID_LEVEL_SHIFTS}'
+
+    block_size = transformed.block_size
+
+    encoded_channels = {}
+    for name, channel in zip(('Y', 'Cb', 'Cr'), transformed[:3]):
+        quantized = quant.quantization(_level_shift_dc(channel.copy(), level_shift, block_size) if level_shift else channel, quality_factor=quality_factor, block_size=block_size)
+        dpcm_channel = dpcm.dpcm_encode(quantized, block_size=block_size, restart_interval=restart_interval)
+
+        if rle_and_huffman:
+            encoded_channels[f'{name}_huffman'] = rlh.rle_and_huffman_encode(dpcm_channel, block_size, restart_interval=restart_interval)
+        else:
+            encoded_channels[f'{name}_dpcm'] = dpcm_channel
+
+    return JpegEncodedData(
+        **encoded_channels,
+        quality_factor=quality_factor,
+        downsampling=transformed.downsampling,
+        block_size=block_size,
+        image_shape=np.array(transformed.image_shape),
+        level_shift=level_shift,
+        restart_interval=restart_interval,
+    )
+
+# The encoder pads the image to a multiple of this size (see step0_preprocessing)
+PADDING = 32
+# Rows above and below each strip given to the chroma resize, so that interpolation
+# kernels wider than 2x2 see the same neighbours as when resizing the whole image
+STRIP_HALO = 8
+
+class EncodedStrip(NamedTuple):
+    """
+    DPCM coefficients of one horizontal strip of every channel. The DC differences
+    continue from the previous strip, so the strips can be stacked as they are.
+    """
+    Y_dpcm: np.ndarray
+    Cb_dpcm: np.ndarray
+    Cr_dpcm: np.ndarray
+
+def padded_shape(shape: tuple[int, ...]) -> tuple[int, int]:
+    """
+    Returns the height and width of an image after step0_preprocessing padding.
+    """
+    return (shape[0] // PADDING + 1) * PADDING, (shape[1] // PADDING + 1) * PADDING
+
+def mcu_rows(downsampling: VALID_DOWNSAMPLES_TYPE, block_size: int = 8) -> int:
+    """
+    Returns the number of image rows covered by one row of blocks of every channel.
+    """
+    return 2 * block_size if downsampling == '4:2:0' else block_size
+
+def _read_strip(image: np.ndarray, top: int, bottom: int) -> tuple[np.ndarray, int]:
+    """
+    Reads rows [top, bottom) of the padded image, with STRIP_HALO rows above and
+    below when the padded image has them. Returns the rows and the index of row top.
+    """
+    height, width = image.shape[:2]
+    padded_height, padded_width = padded_shape(image.shape)
+
+    halo_top = max(top - STRIP_HALO, 0)
+    halo_bottom = min(bottom + STRIP_HALO, padded_height)
+
+    # Edge padding, as in step0_preprocessing
+    rows = np.minimum(np.arange(halo_top, halo_bottom), height - 1)
+    columns = np.minimum(np.arange(padded_width), width - 1)
+
+    return np.asarray(image[rows[0]:rows[-1] + 1])[(rows - rows[0])[:, None], columns], top - halo_top
+
+def _quantize_strip(
+    strip: np.ndarray,
+    offset: int,
+    rows: int,
+    downsampling: VALID_DOWNSAMPLES_TYPE,
+    interpolation: int | None,
+    quality_factor: int,
+    block_size: int,
+    level_shift: int = 0,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Color conversion, downsampling, DCT and quantization of rows [offset, offset + rows)
+    of a strip returned by _read_strip.
+    """
+    chroma_scale = 2 if downsampling == '4:2:0' else 1
+
+    y, cb, cr = csc.rgb_to_ycbcr(*csc.rgb_from_ndarray(strip))
+    Y_d, Cb_d, Cr_d = cd.downsample_ycbcr(cv2.merge([y, cb, cr]), sampling=downsampling, interpolation=interpolation)
+
+    channels = (
+        Y_d[offset:offset + rows],
+        Cb_d[offset // chroma_scale:(offset + rows) // chroma_scale],
+        Cr_d[offset // chroma_scale:(offset + rows) // chroma_scale],
+    )
+
+    return tuple(
+        quant.quantization(_level_shift_dc(dct.dct_blocks(channel, block_size), level_shift, block_size), quality_factor=quality_factor, block_size=block_size)
+        for channel in channels
+    )
+
+def _dpcm_encode_range(quantized: np.ndarray, previous_dc: int, block_size: int, restart_interval: int = 0, first_block: int = 0) -> np.ndarray:
+    """
+    DPCM of a range of block rows, starting at block first_block of the channel,
+    whose first DC difference is to previous_dc (unless a restart falls there).
+    """
+    return dpcm.dpcm_encode(quantized, block_size=block_size, restart_interval=restart_interval, first_block=first_block, previous_dc=previous_dc)
+
+def encode_strips(
+    image: np.ndarray,
+    *,
+    downsampling: VALID_DOWNSAMPLES_TYPE = '4:2:0',
+    interpolation: int | None = cv2.INTER_LINEAR,
+    quality_factor: int = 100,
+    block_size: int = 8,
+    strip_rows: int | None = None,
+    restart_interval: int = 0,
+    level_shift: int = 0,
+) -> Iterator[EncodedStrip]:
+    """
+    Encodes an image in horizontal strips, yielding the coefficients of each strip.
+
+    Only the rows of the current strip are read from image (which can be a
+    np.memmap) and every intermediate array is the size of a strip, so memory is
+    proportional to the image width. The coefficients are the same as encoder's.
+
+    Args:
+        image (np.ndarray): RGB image.
+        downsampling (str): Chroma downsampling.
+        interpolation (int): OpenCV interpolation used to downsample the chroma.
+        quality_factor (int): Quality factor.
+        block_size (int): Block size.
+        strip_rows (int): Image rows per strip, a multiple of mcu_rows. Defaults to mcu_rows.
+        restart_interval (int): Blocks between DC prediction restarts (0 for none).
+        level_shift (int): Value subtracted from the samples before the DCT (0 or 128).
+
+    Yields:
+        EncodedStrip: DPCM coefficients of the next strip.
+    """
+    assert downsampling in VALID_DOWNSAMPLES, f'Invalid downsampling: {downsampling}. Needs to be one of the following: {VALID_DOWNSAMPLES}'
+
+    assert level_shift in VALID_LEVEL_SHIFTS, f'Invalid level_shift: {level_shift}. Needs to be one of the following: {VALID_LEVEL_SHIFTS}'
+
+    strip_rows = strip_rows or mcu_rows(downsampling, block_size)
+    assert strip_rows % mcu_rows(downsampling, block_size) == 0, f'Invalid strip_rows: {strip_rows}. Needs to be a multiple of {mcu_rows(downsampling, block_size)}'
+
+    padded_height, _ = padded_shape(image.shape)
+
+    previous_dc = [0, 0, 0]
+    first_block = [0, 0, 0]
+    for top in range(0, padded_height, strip_rows):
+        strip, offset = _read_strip(image, top, min(top + strip_rows, padded_height))
+        quantized = _quantize_strip(strip, offset, min(strip_rows, padded_height - top), downsampling, interpolation, quality_factor, block_size, level_shift)
+
+        dpcm_channels = []
+        for i, channel in enumerate(quantized):
+            dpcm_channels.append(_dpcm_encode_range(channel, previous_dc[i], block_size, restart_interval, first_block[i]))
+            previous_dc[i] = channel[-block_size, -block_size]
+            first_block[i] += channel.size // block_size ** 2
+
+        yield EncodedStrip(*dpcm_channels)
+
+def streaming_encoder(
+    image: np.ndarray,
+    *,
+    downsampling: VALID_DOWNSAMPLES_TYPE = '4:2:0',
+    interpolation: int | None = cv2.INTER_LINEAR,
+    quality_factor: int = 100,
+    block_size: int = 8,
+    rle_and_huffman: bool = True,
+    strip_rows: int | None = None,
+    restart_interval: int = 0,
+    level_shift: int = 0,
+) -> JpegEncodedData:
+    """
+    Same as encoder, but encodes the image in strips (see encode_strips).
+
+    With rle_and_huffman only the run length symbols of each strip are kept
+    until the Huffman tables are built, otherwise the strips are written into
+    the output coefficient arrays.
+
+    Returns:
+        JpegEncodedData: Encoded image.
+    """
+    strips = encode_strips(
+        image,
+        downsampling=downsampling,
+        interpolation=interpolation,
+        quality_factor=quality_factor,
+        block_size=block_size,
+        strip_rows=strip_rows,
+        restart_interval=restart_interval,
+        level_shift=level_shift,
+    )
+
+    padded_height, padded_width = padded_shape(image.shape)
+    chroma_shape = (padded_height // 2 if downsampling == '4:2:0' else padded_height, padded_width // 2)
+    shapes = ((padded_height, padded_width), chroma_shape, chroma_shape)
+
+    if rle_and_huffman:
+        symbols: tuple[list[rlh.Symbols], ...] = ([], [], [])
+        for strip in strips:
+            for channel_symbols, channel in zip(symbols, strip):
+                channel_symbols.append(rlh.extract_symbols(channel, block_size))
+
+        encoded_channels = {
+            f'{name}_huffman': rlh.encode_channel_symbols(rlh.concatenate_symbols(channel_symbols), shape, block_size, restart_interval=restart_interval)
+            for name, channel_symbols, shape in zip(('Y', 'Cb', 'Cr'), symbols, shapes)
+        }
+    else:
+        outputs = [np.empty(shape, dtype=np.int32) for shape in shapes]
+        offsets = [0, 0, 0]
+        for strip in strips:
+            for i, channel in enumerate(strip):
+                outputs[i][offsets[i]:offsets[i] + channel.shape[0]] = channel
+                offsets[i] += channel.shape[0]
+
+        encoded_channels = dict(zip(('Y_dpcm', 'Cb_dpcm', 'Cr_dpcm'), outputs))
+
+    return JpegEncodedData(
+        **encoded_channels,
+        quality_factor=quality_factor,
+        downsampling=downsampling,
+        block_size=block_size,
+        image_shape=np.array(image.shape),
+        level_shift=level_shift,
+        restart_interval=restart_interval,
+    )
+
+def _encode_range(quantized: np.ndarray, previous_dc: int, block_size: int, rle_and_huffman: bool, restart_interval: int = 0, first_block: int = 0) -> np.ndarray | rlh.Symbols:
+    dpcm_channel = _dpcm_encode_range(quantized, previous_dc, block_size, restart_interval, first_block)
+
+    return rlh.extract_symbols(dpcm_channel, block_size) if rle_and_huffman else dpcm_channel
+
+def parallel_encoder(
+    image: np.ndarray,
+    *,
+    downsampling: VALID_DOWNSAMPLES_TYPE = '4:2:0',
+    interpolation: int | None = cv2.INTER_LINEAR,
+    quality_factor: int = 100,
+    block_size: int = 8,
+    rle_and_huffman: bool = True,
+    executor: Executor | None = None,
+    workers: int | None = None,
+    range_rows: int | None = None,
+    restart_interval: int = 0,
+    level_shift: int = 0,
+) -> JpegEncodedData:
+    """
+    Same as encoder, but encodes ranges of block rows and channels on a pool.
+
+    The image is split in ranges of range_rows rows, which go through color
+    conversion, downsampling, DCT and quantization independently. The last DC
+    of each range is then known, so the DPCM (and run length symbols) of every
+    channel and range run in parallel too, followed by the Huffman coding of the
+    three channels. The result is the same as encoder's.
+
+    A thread pool works well, since NumPy and OpenCV release the GIL; with a
+    process pool the ranges are pickled to the workers.
+
+    Args:
+        executor (Executor): Pool to run on. Defaults to a thread pool of workers threads.
+        workers (int): Number of threads of the default pool (default: os.cpu_count()).
+        range_rows (int): Image rows per range, a multiple of mcu_rows. Defaults to
+            an even split of the image in 4 ranges per worker.
+        restart_interval (int): Blocks between DC prediction restarts (0 for none).
+        level_shift (int): Value subtracted from the samples before the DCT (0 or 128).
+
+    Returns:
+        JpegEncodedData: Encoded image.
+    """
+    assert downsampling in VALID_DOWNSAMPLES, f'Invalid downsampling: {downsampling}. Needs to be one of the following: {VALID_DOWNSAMPLES}'
+
+    assert level_shift in VALID_LEVEL_SHIFTS, f'Invalid level_shift: {level_shift}. Needs to be one of the following: {VALID_LEVEL_SHIFTS}'
+
+    if executor is None:
+        with ThreadPoolExecutor(workers or os.cpu_count()) as pool:
+            return parallel_encoder(
+                image,
+                downsampling=downsampling,
+                interpolation=interpolation,
+                quality_factor=quality_factor,
+                block_size=block_size,
+                rle_and_huffman=rle_and_huffman,
+                executor=pool,
+                range_rows=range_rows,
+                restart_interval=restart_interval,
+                level_shift=level_shift,
+            )
+
+    padded_height, padded_width = padded_shape(image.shape)
+    mcu = mcu_rows(downsampling, block_size)
+    if range_rows is None:
+        range_rows = -(-padded_height // (4 * (workers or os.cpu_count() or 1)))
+        range_rows = -(-range_rows // mcu) * mcu
+    assert range_rows % mcu == 0, f'Invalid range_rows: {range_rows}. Needs to be a multiple of {mcu}'
+
+    tops = range(0, padded_height, range_rows)
+    quantized_futures = []
+    for top in tops:
+        strip, offset = _read_strip(image, top, min(top + range_rows, padded_height))
+        quantized_futures.append(executor.submit(
+            _quantize_strip, strip, offset, min(range_rows, padded_height - top),
+            downsampling, interpolation, quality_factor, block_size, level_shift,
+        ))
+    quantized_ranges = [future.result() for future in quantized_futures]
+
+    # The DPCM of a range continues from the last DC of the previous one
+    encoded_futures = []
+    for i in range(3):
+        previous_dc = [0] + [int(ranges[i][-block_size, -block_size]) for ranges in quantized_ranges[:-1]]
+        first_block = np.cumsum([0] + [ranges[i].size // block_size ** 2 for ranges in quantized_ranges[:-1]]).tolist()
+        encoded_futures.append([
+            executor.submit(_encode_range, ranges[i], dc, block_size, rle_and_huffman, restart_interval, first)
+            for ranges, dc, first in zip(quantized_ranges, previous_dc, first_block)
+        ])
+    del quantized_ranges
+
+    chroma_shape = (padded_height // 2 if downsampling == '4:2:0' else padded_height, padded_width // 2)
+    shapes = ((padded_height, padded_width), chroma_shape, chroma_shape)
+
+    if rle_and_huffman:
+        channel_futures = [
+            executor.submit(rlh.encode_channel_symbols, rlh.concatenate_symbols(future.result() for future in futures), shape, block_size, restart_interval=restart_interval)
+            for futures, shape in zip(encoded_futures, shapes)
+        ]
+        encoded_channels = {
+            f'{name}_huffman': future.result()
+            for name, future in zip(('Y', 'Cb', 'Cr'), channel_futures)
+        }
+    else:
+        encoded_channels = {
+            f'{name}_dpcm': np.concatenate([future.result() for future in futures])
+            for name, futures in zip(('Y', 'Cb', 'Cr'), encoded_futures)
+        }
+
+    return JpegEncodedData(
+        **encoded_channels,
+        quality_factor=quality_factor,
+        downsampling=downsampling,
+        block_size=block_size,
+        image_shape=np.array(image.shape),
+        level_shift=level_shift,
+        restart_interval=restart_interval,
+    )
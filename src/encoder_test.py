@@ -1,7 +1,10 @@
 from common import TEST_PARAMETERS
+from concurrent.futures import ProcessPoolExecutor
 from matplotlib import pyplot as plt
 import encoder
 import numpy as np
+import pytest
+import tracemalloc
 
 image = plt.imread(TEST_PARAMETERS.image_path)
 _, iv = encoder.encoder(
@@ -109,3 +112,68 @@ def test_encoder_dpcm():
     ])
 
     assert np.allclose(Yb_DPCM, expected_Yb_DPCM), f'\n{Yb_DPCM}\n!=\n{expected_Yb_DPCM}'
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+@pytest.mark.parametrize('rle_and_huffman', (True, False))
+@pytest.mark.parametrize('restart_interval', (0, 7))
+def test_streaming_encoder(downsampling, rle_and_huffman, restart_interval):
+    # Odd sizes so the last strip is mostly padding
+    cropped = image[:301, :257]
+    parameters = dict(downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor, rle_and_huffman=rle_and_huffman, restart_interval=restart_interval)
+
+    expected, _ = encoder.encoder(cropped, **parameters)
+    actual = encoder.streaming_encoder(cropped, **parameters)
+
+    assert np.array_equal(actual.original_image_shape, cropped.shape)
+    assert actual.restart_interval == restart_interval
+    for expected_channel, actual_channel in zip(expected.dpcm_channels(), actual.dpcm_channels()):
+        assert np.array_equal(expected_channel, actual_channel)
+    if rle_and_huffman:
+        assert actual.Cb_huffman.data == expected.Cb_huffman.data
+        assert np.array_equal(actual.Cb_huffman.segment_offsets, expected.Cb_huffman.segment_offsets)
+
+def test_encode_strips_memory():
+    tall = np.tile(image[:, :256], (32, 1, 1))
+
+    tracemalloc.start()
+    for strip in encoder.encode_strips(tall, quality_factor=TEST_PARAMETERS.quality_factor):
+        assert strip.Y_dpcm.shape == (16, encoder.padded_shape(tall.shape)[1])
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert peak < tall.nbytes / 10, f'{peak} bytes used to encode a {tall.nbytes} bytes image'
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+@pytest.mark.parametrize('rle_and_huffman', (True, False))
+@pytest.mark.parametrize('restart_interval', (0, 7))
+def test_parallel_encoder(downsampling, rle_and_huffman, restart_interval):
+    cropped = image[:301, :257]
+    parameters = dict(downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor, rle_and_huffman=rle_and_huffman, restart_interval=restart_interval)
+
+    expected, _ = encoder.encoder(cropped, **parameters)
+    actual = encoder.parallel_encoder(cropped, **parameters, workers=3, range_rows=48)
+
+    assert actual.restart_interval == restart_interval
+    for expected_channel, actual_channel in zip(expected.dpcm_channels(), actual.dpcm_channels()):
+        assert np.array_equal(expected_channel, actual_channel)
+    if rle_and_huffman:
+        assert actual.Y_huffman.data == expected.Y_huffman.data
+        assert np.array_equal(actual.Y_huffman.segment_offsets, expected.Y_huffman.segment_offsets)
+
+def test_parallel_encoder_process_pool():
+    cropped = image[:128, :128]
+    expected, _ = encoder.encoder(cropped, quality_factor=TEST_PARAMETERS.quality_factor)
+
+    with ProcessPoolExecutor(2) as executor:
+        actual = encoder.parallel_encoder(cropped, quality_factor=TEST_PARAMETERS.quality_factor, executor=executor, range_rows=32)
+
+    assert actual.Y_huffman.data == expected.Y_huffman.data
+    assert actual.Cr_huffman.data == expected.Cr_huffman.data
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+def test_transform_matches_encoder(downsampling):
+    expected, _ = encoder.encoder(image, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor, rle_and_huffman=False)
+    actual = encoder.encode_transformed(encoder.transform(image, downsampling=downsampling), quality_factor=TEST_PARAMETERS.quality_factor, rle_and_huffman=False)
+
+    for expected_channel, actual_channel in zip(expected.dpcm_channels(), actual.dpcm_channels()):
+        assert np.array_equal(expected_channel, actual_channel)
@@ -0,0 +1,482 @@
+from common import from_blocks
+from encoder import JpegEncodedData
+import numpy as np
+import re
+import step4_quatization as quant
+import step5_dpcm as dpcm
+import step6_run_length_huffman_encoding as rlh
+import struct
+from typing import NamedTuple, Sequence
+
+# Luma (horizontal, vertical) sampling factors; chroma is always 1x1
+SAMPLING_FACTORS = {
+    '4:2:0': (2, 2),
+    '4:2:2': (2, 1),
+    '4:4:4': (1, 1),
+}
+
+# Baseline JPEG limits the DC difference and AC amplitude categories to 11 and 10 bits
+MAX_DC = (1 << 10) - 1
+MAX_AC = (1 << 10) - 1
+
+# The JPEG DCT works on samples shifted to [-128, 127], our encoder on [0, 255].
+# For an 8x8 orthonormal DCT this only changes the DC coefficient, by 8 * 128.
+LEVEL_SHIFT_DC = 8 * 128
+
+def _segment(marker: int, payload: bytes) -> bytes:
+    return struct.pack('>HH', 0xFF00 | marker, len(payload) + 2) + payload
+
+def _app0() -> bytes:
+    # JFIF 1.01, no units, 1:1 pixel density, no thumbnail
+    return _segment(0xE0, b'JFIF\0' + struct.pack('>BBBHHBB', 1, 1, 0, 1, 1, 0, 0))
+
+def _dqt(table_id: int, table: np.ndarray) -> bytes:
+    values = np.asarray(table).ravel()[rlh.zigzag_order(8)]
+
+    # 16 bit precision is only needed for entries above 255
+    if values.max() > 255:
+        return _segment(0xDB, bytes([1 << 4 | table_id]) + values.astype('>u2').tobytes())
+
+    return _segment(0xDB, bytes([table_id]) + values.astype(np.uint8).tobytes())
+
+def _sof(height: int, width: int, components: list[tuple[int, int, int, int]], marker: int = 0xC0) -> bytes:
+    payload = struct.pack('>BHHB', 8, height, width, len(components))
+    for component_id, h, v, table_id in components:
+        payload += struct.pack('>BBB', component_id, h << 4 | v, table_id)
+
+    return _segment(marker, payload)
+
+def _dht(table_class: int, table_id: int, table: rlh.HuffmanTable) -> bytes:
+    return _segment(0xC4, bytes([table_class << 4 | table_id]) + table.bits.astype(np.uint8).tobytes() + table.values.astype(np.uint8).tobytes())
+
+def _sos(component_id: int, dc_table_id: int, ac_table_id: int, spectral_range: tuple[int, int] = (0, 63)) -> bytes:
+    return _segment(0xDA, struct.pack('>BBBBBB', 1, component_id, dc_table_id << 4 | ac_table_id, *spectral_range, 0))
+
+def _dri(restart_interval: int) -> bytes:
+    return _segment(0xDD, struct.pack('>H', restart_interval))
+
+def _stuff(data: bytes) -> bytes:
+    # 0xFF bytes in entropy coded data are followed by 0x00 so they are not read as markers
+    return data.replace(b'\xff', b'\xff\x00')
+
+def jpeg_coefficients(
+    quantized: np.ndarray,
+    quant_matrix: np.ndarray,
+    size: tuple[int, int],
+    level_shift: bool = True,
+    restart_interval: int = 0,
+) -> np.ndarray:
+    """
+    Converts quantized coefficients of one channel to what a baseline JPEG expects.
+
+    The channel is cropped to the blocks covering size, the DC coefficient is
+    level shifted and the amplitudes are clipped to the baseline limits.
+
+    The level shift of quantized coefficients can only be a whole number of
+    quantization steps, so unless the DC quantization step divides 1024 the
+    samples are off by up to half a step (a few gray levels at low qualities).
+    Channels encoded with level_shift=128 need no shift and are exact.
+
+    Args:
+        quantized (np.ndarray): Quantized channel (after inverse DPCM).
+        quant_matrix (np.ndarray): Quantization matrix used for the channel.
+        size (tuple[int, int]): Height and width of the component in the JPEG.
+        level_shift (bool): Whether the DC coefficient still needs the level shift.
+        restart_interval (int): Blocks between restart markers (0 for none).
+
+    Returns:
+        np.ndarray: DPCM coded coefficients in JPEG block order.
+    """
+    h, w = size
+    coefficients = quantized[:-(-h // 8) * 8, :-(-w // 8) * 8].astype(np.int32)
+
+    if level_shift:
+        coefficients[::8, ::8] -= int(np.rint(LEVEL_SHIFT_DC / quant_matrix[0, 0]))
+    coefficients = coefficients.clip(-MAX_AC, MAX_AC)
+    coefficients[::8, ::8] = coefficients[::8, ::8].clip(-MAX_DC, MAX_DC)
+
+    return dpcm.dpcm_encode(coefficients, restart_interval=restart_interval)
+
+def encode_jfif(encoded_data: JpegEncodedData, *, scans: Sequence[tuple[int, int]] | None = None) -> bytes:
+    """
+    Writes encoded data as a baseline JFIF file readable by standard decoders.
+
+    Each channel is written in its own (non interleaved) scan. The Huffman tables
+    are optimized for the image: one pair for luma and one shared by both chroma
+    channels.
+
+    Encode with level_shift=128 (see encoder.encoder) for files that decode to
+    the same image as decoder.decoder; without it the DC level shift is rounded
+    to the quantization step (see jpeg_coefficients).
+
+    A restart interval (in blocks) is kept from encoded_data: every scan then
+    has RST markers and a DRI segment is written.
+
+    With scans, a progressive JPEG (spectral selection only) is written instead:
+    each scan holds a band of zigzag indices of one channel, with its own Huffman
+    tables, so viewers can show the image before the whole file arrives. The
+    restart interval is not kept in progressive files.
+
+    Args:
+        encoded_data (JpegEncodedData): Encoded image (block_size must be 8).
+        scans (Sequence[tuple[int, int]]): First and last zigzag index of each
+            scan of a progressive file (e.g. progressive.DEFAULT_SCANS). The first
+            scan must be (0, 0), the DC coefficients, and they must cover [0, 63]
+            in order.
+
+    Returns:
+        bytes: JFIF file contents.
+    """
+    assert encoded_data.block_size == 8, f'Invalid block_size: {encoded_data.block_size}. Baseline JPEG only supports 8'
+    assert encoded_data.level_shift in (0, 128), f'Invalid level_shift: {encoded_data.level_shift}'
+
+    height, width = (int(n) for n in encoded_data.original_image_shape[:2])
+    restart_interval = encoded_data.restart_interval if scans is None else 0
+    assert 0 <= restart_interval <= 0xFFFF, f'Invalid restart_interval: {restart_interval}'
+    h_max, v_max = SAMPLING_FACTORS[encoded_data.downsampling]
+    quant_matrices = encoded_data.get_quantization_matrices()
+
+    # One DQT table per distinct matrix
+    quant_table_ids = []
+    distinct_matrices: list[np.ndarray] = []
+    for quant_matrix in quant_matrices:
+        for table_id, other in enumerate(distinct_matrices):
+            if np.array_equal(quant_matrix, other):
+                break
+        else:
+            table_id = len(distinct_matrices)
+            distinct_matrices.append(quant_matrix)
+        quant_table_ids.append(table_id)
+
+    sizes = (
+        (height, width),
+        (-(-height // v_max), -(-width // h_max)),
+        (-(-height // v_max), -(-width // h_max)),
+    )
+
+    coefficients = [
+        jpeg_coefficients(
+            dpcm.dpcm_decode(channel, restart_interval=encoded_data.restart_interval),
+            quant_matrix,
+            size,
+            level_shift=encoded_data.level_shift == 0,
+            restart_interval=restart_interval,
+        )
+        for channel, quant_matrix, size in zip(encoded_data.dpcm_channels(), quant_matrices, sizes)
+    ]
+    symbols = [rlh.extract_symbols(channel) for channel in coefficients]
+
+    luma_frequencies = rlh.symbol_frequencies(symbols[0])
+    chroma_frequencies = [a + b for a, b in zip(rlh.symbol_frequencies(symbols[1]), rlh.symbol_frequencies(symbols[2]))]
+    tables = [
+        [rlh.build_huffman_table(frequencies) for frequencies in luma_frequencies],
+        [rlh.build_huffman_table(frequencies) for frequencies in chroma_frequencies],
+    ]
+
+    segments = [
+        b'\xff\xd8',
+        _app0(),
+        *(_dqt(table_id, quant_matrix) for table_id, quant_matrix in enumerate(distinct_matrices)),
+        _sof(height, width, [(1, h_max, v_max, quant_table_ids[0]), (2, 1, 1, quant_table_ids[1]), (3, 1, 1, quant_table_ids[2])], 0xC0 if scans is None else 0xC2),
+    ]
+
+    if scans is not None:
+        segments.extend(_progressive_scans(coefficients, scans))
+        segments.append(b'\xff\xd9')
+
+        return b''.join(segments)
+
+    for table_id, (dc_table, ac_table) in enumerate(tables):
+        segments.append(_dht(0, table_id, dc_table))
+        segments.append(_dht(1, table_id, ac_table))
+    if restart_interval:
+        segments.append(_dri(restart_interval))
+
+    for component_id, component_symbols in enumerate(symbols, start=1):
+        table_id = 0 if component_id == 1 else 1
+        segments.append(_sos(component_id, table_id, table_id))
+        if not restart_interval:
+            segments.append(_stuff(rlh.encode_symbols(component_symbols, *tables[table_id])))
+            continue
+
+        data, offsets = rlh.encode_segments(component_symbols, *tables[table_id], restart_interval)
+        bounds = [*(int(offset) for offset in offsets), len(data)]
+        for k in range(len(offsets)):
+            if k:
+                segments.append(bytes([0xFF, 0xD0 + (k - 1) % 8]))
+            segments.append(_stuff(data[bounds[k]:bounds[k + 1]]))
+
+    segments.append(b'\xff\xd9')
+
+    return b''.join(segments)
+
+def _progressive_scans(coefficients: list[np.ndarray], scans: Sequence[tuple[int, int]]) -> list[bytes]:
+    # One non interleaved scan per channel and band, each preceded by its Huffman tables
+    assert tuple(scans[0]) == (0, 0), f'Invalid scans: {scans}. The first one needs to be (0, 0)'
+    assert [start for start, _ in scans] == [0, *(end + 1 for _, end in scans[:-1])] and scans[-1][1] == 63, f'Invalid scans: {scans}. They need to cover [0, 63] in order'
+
+    segments = []
+    for spectral_range in scans:
+        for component_id, channel in enumerate(coefficients, start=1):
+            symbols = rlh.extract_symbols(channel, spectral_range=tuple(spectral_range))
+            # The tables of the symbols the scan does not have are empty
+            dc_table, ac_table = (rlh.build_huffman_table(frequencies) for frequencies in rlh.symbol_frequencies(symbols))
+            segments.append(_dht(0, 0, dc_table) if spectral_range[0] == 0 else _dht(1, 0, ac_table))
+
+            segments.append(_sos(component_id, 0, 0, tuple(spectral_range)))
+            segments.append(_stuff(rlh.encode_symbols(symbols, dc_table, ac_table)))
+
+    return segments
+
+def write_jfif(encoded_data: JpegEncodedData, path: str) -> int:
+    """
+    Writes encoded data to a .jpeg file. See encode_jfif.
+
+    Args:
+        encoded_data (JpegEncodedData): Encoded image.
+        path (str): Output file path.
+
+    Returns:
+        int: Size of the written file in bytes.
+    """
+    data = encode_jfif(encoded_data)
+
+    with open(path, 'wb') as file:
+        file.write(data)
+
+    return len(data)
+
+# Markers that end the entropy coded data of a scan (anything but stuffing and RSTn)
+END_OF_SCAN = re.compile(rb'\xff[^\x00\xd0-\xd7]')
+RESTART = re.compile(rb'\xff[\xd0-\xd7]')
+
+class _Component(NamedTuple):
+    id: int
+    h: int
+    v: int
+    quant_table_id: int
+    # Coefficients in zigzag order, (blocks_y, blocks_x, 64), over the whole MCU grid
+    coefficients: np.ndarray
+    # Blocks covered by a non interleaved scan (the rest of the grid is padding)
+    blocks: tuple[int, int]
+
+def _decode_scan(
+    data: bytes,
+    components: list[_Component],
+    tables: list[tuple[int, int]],
+    huffman_lookups: dict[tuple[int, int], tuple[list[int], list[int]]],
+    mcus: tuple[int, int],
+    restart_interval: int,
+) -> None:
+    """
+    Decodes the entropy coded data of a baseline scan into the components coefficients.
+    """
+    segments = [segment.replace(b'\xff\x00', b'\xff') for segment in RESTART.split(data)]
+
+    if len(components) == 1:
+        # Non interleaved: each MCU is one block, in raster order over the component
+        component = components[0]
+        blocks_y, blocks_x = component.blocks
+        n_blocks = blocks_y * blocks_x
+        restart_interval = restart_interval or n_blocks
+        dc_lookup, ac_lookup = (huffman_lookups[0, tables[0][0]], huffman_lookups[1, tables[0][1]])
+
+        coefficients = np.zeros((n_blocks, 64), dtype=np.int32)
+        for start, segment in zip(range(0, n_blocks, restart_interval), segments):
+            rlh.decode_blocks(rlh.BitReader(segment), dc_lookup, ac_lookup, coefficients[start:start + restart_interval])
+
+        # DC differences restart from 0 at each restart interval
+        dc = np.cumsum(coefficients[:, 0])
+        interval_start = np.arange(n_blocks) // restart_interval * restart_interval
+        coefficients[:, 0] = dc - np.where(interval_start > 0, dc[interval_start - 1], 0)
+
+        component.coefficients[:blocks_y, :blocks_x] = coefficients.reshape(blocks_y, blocks_x, 64)
+        return
+
+    mcus_y, mcus_x = mcus
+    n_mcus = mcus_y * mcus_x
+    restart_interval = restart_interval or n_mcus
+    lookups = [(huffman_lookups[0, dc_id], huffman_lookups[1, ac_id]) for dc_id, ac_id in tables]
+    flat = [component.coefficients.reshape(-1, 64) for component in components]
+
+    for start, segment in zip(range(0, n_mcus, restart_interval), segments):
+        reader = rlh.BitReader(segment)
+        predictions = [0] * len(components)
+
+        for mcu in range(start, min(start + restart_interval, n_mcus)):
+            mcu_y, mcu_x = divmod(mcu, mcus_x)
+
+            for i, component in enumerate(components):
+                grid_width = mcus_x * component.h
+                for v in range(component.v):
+                    for h in range(component.h):
+                        index = (mcu_y * component.v + v) * grid_width + mcu_x * component.h + h
+                        block = flat[i][index:index + 1]
+                        rlh.decode_blocks(reader, *lookups[i], block)
+
+                        predictions[i] += block[0, 0]
+                        block[0, 0] = predictions[i]
+
+def parse_jpeg(data: bytes) -> JpegEncodedData:
+    """
+    Reads a baseline (sequential, Huffman coded) JPEG into JpegEncodedData.
+
+    The quantized coefficients are kept as they are in the file: the result carries
+    the file's quantization matrices and a level shift of 128, and the quality
+    factor is the one whose matrix is closest to the luma matrix. The result can
+    be passed to decoder.decoder.
+
+    Args:
+        data (bytes): JPEG file contents.
+
+    Returns:
+        JpegEncodedData: Encoded image, with DPCM coefficients over the whole MCU grid.
+
+    Raises:
+        ValueError: If the file is not a JPEG or uses an unsupported feature
+            (progressive, arithmetic coding, 12 bit samples, not 3 components or
+            chroma subsampling other than 4:2:0, 4:2:2 and 4:4:4).
+    """
+    data = bytes(data)
+    if data[:2] != b'\xff\xd8':
+        raise ValueError('Not a JPEG file')
+
+    quant_tables: dict[int, np.ndarray] = {}
+    huffman_lookups: dict[tuple[int, int], tuple[list[int], list[int]]] = {}
+    components: list[_Component] = []
+    restart_interval = 0
+    height = width = 0
+    mcus = (0, 0)
+
+    position = 2
+    while position < len(data):
+        if data[position] != 0xFF:
+            raise ValueError(f'Expected a marker at byte {position}')
+
+        marker = data[position + 1]
+        position += 2
+
+        if marker == 0xFF:
+            # Fill byte
+            position -= 1
+            continue
+        if marker == 0xD9:
+            break
+        if 0xD0 <= marker <= 0xD7 or marker == 0x01:
+            continue
+
+        length, = struct.unpack_from('>H', data, position)
+        segment = data[position + 2:position + length]
+        position += length
+
+        if marker == 0xDB:
+            offset = 0
+            while offset < len(segment):
+                precision, table_id = segment[offset] >> 4, segment[offset] & 0x0F
+                dtype = '>u2' if precision else np.uint8
+                values = np.frombuffer(segment, dtype=dtype, count=64, offset=offset + 1)
+                offset += 1 + 64 * np.dtype(dtype).itemsize
+
+                table = np.empty(64, dtype=np.int64)
+                table[rlh.zigzag_order(8)] = values
+                quant_tables[table_id] = table.reshape(8, 8)
+        elif marker == 0xC4:
+            offset = 0
+            while offset < len(segment):
+                table_class, table_id = segment[offset] >> 4, segment[offset] & 0x0F
+                bits = np.frombuffer(segment, dtype=np.uint8, count=16, offset=offset + 1)
+                values = np.frombuffer(segment, dtype=np.uint8, count=int(bits.sum()), offset=offset + 17)
+                offset += 17 + values.size
+
+                huffman_lookups[table_class, table_id] = rlh.huffman_lookup(rlh.HuffmanTable(bits, values))
+        elif marker in (0xC0, 0xC1):
+            precision, height, width, n_components = struct.unpack_from('>BHHB', segment)
+            if precision != 8:
+                raise ValueError(f'Unsupported sample precision: {precision}')
+            if height == 0:
+                raise ValueError('Unsupported JPEG: the height is defined by a DNL marker')
+            if n_components != 3:
+                raise ValueError(f'Unsupported number of components: {n_components}')
+
+            factors = [struct.unpack_from('>BBB', segment, 6 + 3 * i) for i in range(n_components)]
+            h_max = max(f[1] >> 4 for f in factors)
+            v_max = max(f[1] & 0x0F for f in factors)
+            mcus = (-(-height // (8 * v_max)), -(-width // (8 * h_max)))
+
+            for component_id, sampling, quant_table_id in factors:
+                h, v = sampling >> 4, sampling & 0x0F
+                components.append(_Component(
+                    component_id,
+                    h,
+                    v,
+                    quant_table_id,
+                    np.zeros((mcus[0] * v, mcus[1] * h, 64), dtype=np.int32),
+                    (-(-(-(-height * v // v_max)) // 8), -(-(-(-width * h // h_max)) // 8)),
+                ))
+        elif 0xC2 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+            raise ValueError(f'Unsupported JPEG process (SOF{marker - 0xC0}). Only baseline is supported')
+        elif marker == 0xDD:
+            restart_interval, = struct.unpack_from('>H', segment)
+        elif marker == 0xDA:
+            n_scan_components = segment[0]
+            scan_components, tables = [], []
+            for i in range(n_scan_components):
+                component_id, table_ids = segment[1 + 2 * i], segment[2 + 2 * i]
+                scan_components.append(next(c for c in components if c.id == component_id))
+                tables.append((table_ids >> 4, table_ids & 0x0F))
+
+            end = END_OF_SCAN.search(data, position)
+            end = len(data) if end is None else end.start()
+
+            _decode_scan(data[position:end], scan_components, tables, huffman_lookups, mcus, restart_interval)
+            position = end
+
+    if len(components) != 3:
+        raise ValueError('JPEG file has no frame')
+
+    sampling = (components[0].h, components[0].v)
+    downsampling = next((name for name, factors in SAMPLING_FACTORS.items() if factors == sampling), None)
+    if downsampling is None or any((c.h, c.v) != (1, 1) for c in components[1:]):
+        raise ValueError(f'Unsupported chroma subsampling: {[(c.h, c.v) for c in components]}')
+
+    channels = []
+    for component in components:
+        coefficients = component.coefficients
+
+        # Blocks outside the non interleaved scans repeat the last coded block
+        blocks_y, blocks_x = component.blocks
+        coefficients[:, blocks_x:] = coefficients[:, blocks_x - 1:blocks_x]
+        coefficients[blocks_y:, :] = coefficients[blocks_y - 1:blocks_y, :]
+
+        blocks = np.empty_like(coefficients)
+        blocks[..., rlh.zigzag_order(8)] = coefficients
+        quantized = from_blocks(blocks.reshape(*blocks.shape[:2], 8, 8))
+
+        channels.append(dpcm.dpcm_encode(quantized))
+
+    quant_matrices = tuple(quant_tables[c.quant_table_id] for c in components)
+
+    return JpegEncodedData(
+        Y_dpcm=channels[0],
+        Cb_dpcm=channels[1],
+        Cr_dpcm=channels[2],
+        quality_factor=quant.estimate_quality_factor(quant_matrices[0]),
+        downsampling=downsampling,
+        block_size=8,
+        image_shape=np.array((height, width, 3)),
+        quantization_matrices=quant_matrices,
+        level_shift=128,
+    )
+
+def read_jpeg(path: str) -> JpegEncodedData:
+    """
+    Reads a baseline .jpeg file. See parse_jpeg.
+
+    Args:
+        path (str): JPEG file path.
+
+    Returns:
+        JpegEncodedData: Encoded image.
+    """
+    with open(path, 'rb') as file:
+        return parse_jpeg(file.read())
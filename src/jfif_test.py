@@ -0,0 +1,106 @@
+from common import TEST_PARAMETERS
+from matplotlib import pyplot as plt
+import cv2
+import decoder
+import encoder
+import jfif
+import numpy as np
+import pytest
+
+image = plt.imread(TEST_PARAMETERS.image_path)
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+def test_jfif_readable_by_opencv(tmp_path, downsampling):
+    encoded_data, _ = encoder.encoder(image, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor)
+
+    path = tmp_path / 'airport.jpeg'
+    size = jfif.write_jfif(encoded_data, str(path))
+
+    assert size == path.stat().st_size
+
+    bgr = cv2.imread(str(path), cv2.IMREAD_COLOR)
+    assert bgr is not None, 'OpenCV could not decode the file'
+    rgb = bgr[:, :, ::-1]
+
+    assert rgb.shape == image.shape
+
+    # Only the upsampling filter and the level shift rounding differ from our decoder
+    decoded, _ = decoder.decoder(encoded_data, downsampling=downsampling, quality_factor=TEST_PARAMETERS.quality_factor)
+    assert np.abs(rgb.astype(int) - decoded).mean() < 1
+
+@pytest.mark.parametrize('quality_factor', (1, 5, 10, 17, 75))
+def test_jfif_level_shift(quality_factor):
+    encoded_data, _ = encoder.encoder(image, quality_factor=quality_factor, level_shift=128)
+
+    rgb = cv2.imdecode(np.frombuffer(jfif.encode_jfif(encoded_data), dtype=np.uint8), cv2.IMREAD_COLOR)[:, :, ::-1]
+    decoded, _ = decoder.decoder(encoded_data)
+
+    # Level shifting before quantization leaves no DC bias. Only the upsampling
+    # filter differs, and our decoder truncates to uint8 where OpenCV rounds (+0.5)
+    error = rgb.astype(int) - decoded
+    assert abs(error.mean()) < 1, error.mean()
+    assert np.abs(error).mean() < 1.5, np.abs(error).mean()
+
+def test_encoder_level_shift():
+    shifted, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor, level_shift=128)
+    expected, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor)
+
+    # The level shift only changes the DC coefficients, and the decoded image is the same
+    for shifted_channel, expected_channel in zip(shifted.dpcm_channels(), expected.dpcm_channels()):
+        ac = np.ones(shifted_channel.shape, dtype=bool)
+        ac[::8, ::8] = False
+        assert np.array_equal(shifted_channel[ac], expected_channel[ac])
+    assert np.abs(decoder.decoder(shifted)[0].astype(int) - decoder.decoder(expected)[0]).max() <= 1
+
+@pytest.mark.parametrize('params', (
+    (cv2.IMWRITE_JPEG_QUALITY, 75),
+    (cv2.IMWRITE_JPEG_QUALITY, 90, cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_444, cv2.IMWRITE_JPEG_RST_INTERVAL, 3),
+    (cv2.IMWRITE_JPEG_QUALITY, 50, cv2.IMWRITE_JPEG_SAMPLING_FACTOR, cv2.IMWRITE_JPEG_SAMPLING_FACTOR_422, cv2.IMWRITE_JPEG_RST_INTERVAL, 5),
+))
+def test_parse_opencv_jpeg(params):
+    # Odd sizes so the chroma and MCU grids do not line up with the image
+    bgr = np.ascontiguousarray(image[:301, :257, ::-1])
+    ok, data = cv2.imencode('.jpg', bgr, params)
+    assert ok
+
+    encoded_data = jfif.parse_jpeg(data.tobytes())
+    assert encoded_data.quality_factor == params[1]
+
+    expected = cv2.imdecode(data, cv2.IMREAD_COLOR)[:, :, ::-1]
+    decoded, _ = decoder.decoder(encoded_data)
+
+    assert decoded.shape == expected.shape
+    assert np.abs(expected.astype(int) - decoded).mean() < 1
+
+    # The coefficients are written back unchanged
+    rewritten = cv2.imdecode(np.frombuffer(jfif.encode_jfif(encoded_data), dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert np.array_equal(rewritten, expected[:, :, ::-1])
+
+def test_jfif_restart_interval():
+    encoded_data, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor)
+    restarted, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor, restart_interval=10)
+
+    data = jfif.encode_jfif(restarted)
+    assert b'\xff\xdd' in data and b'\xff\xd7' in data
+
+    expected = cv2.imdecode(np.frombuffer(jfif.encode_jfif(encoded_data), dtype=np.uint8), cv2.IMREAD_COLOR)
+    actual = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    assert np.array_equal(actual, expected)
+
+def test_parse_own_jfif():
+    encoded_data, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor)
+    parsed = jfif.parse_jpeg(jfif.encode_jfif(encoded_data))
+
+    assert parsed.downsampling == encoded_data.downsampling
+    assert parsed.quality_factor == TEST_PARAMETERS.quality_factor
+
+    expected, _ = decoder.decoder(encoded_data)
+    decoded, _ = decoder.decoder(parsed)
+    assert np.abs(expected.astype(int) - decoded).mean() < 1
+
+def test_parse_rejects_progressive():
+    ok, data = cv2.imencode('.jpg', np.ascontiguousarray(image[:64, :64, ::-1]), (cv2.IMWRITE_JPEG_PROGRESSIVE, 1))
+    assert ok
+
+    with pytest.raises(ValueError):
+        jfif.parse_jpeg(data.tobytes())
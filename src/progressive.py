@@ -0,0 +1,129 @@
+from common import from_blocks
+from encoder import JpegEncodedData
+from typing import Iterator, NamedTuple, Sequence
+import cv2
+import decoder
+import numpy as np
+import step6_run_length_huffman_encoding as rlh
+
+# Zigzag ranges of the default scans: the DC coefficients, the 5 lowest frequency
+# AC coefficients and the remaining ones
+DEFAULT_SCANS = ((0, 0), (1, 5), (6, 63))
+
+class ProgressiveScan(NamedTuple):
+    # First and last zigzag index of the coefficients in the scan
+    spectral_range: tuple[int, int]
+    # Entropy coded coefficients of the scan, per channel (Y, Cb, Cr)
+    channels: tuple[rlh.EntropyCodedChannel, ...]
+
+class ProgressiveEncodedData(NamedTuple):
+    # Image parameters (its channels are not used)
+    header: JpegEncodedData
+    scans: tuple[ProgressiveScan, ...]
+
+    def scan_sizes(self) -> list[int]:
+        """
+        Returns the number of bytes of each scan.
+        """
+        return [sum(len(channel.data) for channel in scan.channels) for scan in self.scans]
+
+def _check_scans(scans: Sequence[tuple[int, int]], n_coefficients: int) -> None:
+    # The scans have to cover every zigzag index once, in order
+    expected_start = 0
+    for start, end in scans:
+        assert start == expected_start and start <= end, f'Invalid scans: {scans}. They need to cover [0, {n_coefficients - 1}] in order'
+        expected_start = end + 1
+    assert expected_start == n_coefficients, f'Invalid scans: {scans}. They need to cover [0, {n_coefficients - 1}] in order'
+
+def _with_channels(header: JpegEncodedData, **channels) -> JpegEncodedData:
+    return JpegEncodedData(
+        **channels,
+        quality_factor=header.quality_factor,
+        downsampling=header.downsampling,
+        block_size=header.block_size,
+        image_shape=header.original_image_shape,
+        quantization_matrices=header.quantization_matrices,
+        level_shift=header.level_shift,
+        restart_interval=header.restart_interval,
+    )
+
+def encode_progressive(
+    encoded_data: JpegEncodedData,
+    scans: Sequence[tuple[int, int]] = DEFAULT_SCANS,
+) -> ProgressiveEncodedData:
+    """
+    Splits the coefficients of an encoded image into spectral selection scans.
+
+    Each scan holds a band of zigzag indices of every block, entropy coded with
+    its own Huffman tables, so a decoder can render the image after each scan
+    (see decode_progressive) instead of waiting for all the data.
+
+    Args:
+        encoded_data (JpegEncodedData): Encoded image.
+        scans (Sequence[tuple[int, int]]): First and last zigzag index of each
+            scan. They must cover every index once, in order.
+
+    Returns:
+        ProgressiveEncodedData: Image parameters and scans.
+    """
+    block_size = encoded_data.block_size
+    _check_scans(scans, block_size * block_size)
+
+    dpcm_channels = encoded_data.dpcm_channels()
+
+    progressive_scans = []
+    for spectral_range in scans:
+        channels = tuple(
+            rlh.encode_channel_symbols(rlh.extract_symbols(channel, block_size, spectral_range), channel.shape, block_size)
+            for channel in dpcm_channels
+        )
+        progressive_scans.append(ProgressiveScan(tuple(spectral_range), channels))
+
+    return ProgressiveEncodedData(_with_channels(encoded_data), tuple(progressive_scans))
+
+def decode_progressive(
+    progressive_data: ProgressiveEncodedData,
+    *,
+    interpolation: int | None = cv2.INTER_LINEAR,
+) -> Iterator[np.ndarray]:
+    """
+    Decodes a progressive image scan by scan.
+
+    The coefficients of each scan are added to the ones already received and the
+    image is decoded with the rest set to 0, so the first image only has the DC
+    coefficients and the last one is the same as decoding the original image.
+
+    Args:
+        progressive_data (ProgressiveEncodedData): Output of encode_progressive.
+        interpolation (int): Interpolation used for the chroma upsampling.
+
+    Yields:
+        np.ndarray: RGB image (uint8) after each scan.
+    """
+    block_size = progressive_data.header.block_size
+    n_coefficients = block_size * block_size
+
+    # Zigzag coefficients of every channel received so far
+    coefficients = [
+        np.zeros(((h // block_size) * (w // block_size), n_coefficients), dtype=np.int32)
+        for h, w in (channel.shape for channel in progressive_data.scans[0].channels)
+    ]
+
+    for scan in progressive_data.scans:
+        start, _ = scan.spectral_range
+
+        for channel, channel_coefficients in zip(scan.channels, coefficients):
+            dc_lookup = rlh.huffman_lookup(channel.dc_table) if start == 0 else None
+            ac_lookup = rlh.huffman_lookup(channel.ac_table) if scan.spectral_range[1] > 0 else None
+            rlh.decode_blocks(rlh.BitReader(channel.data), dc_lookup, ac_lookup, channel_coefficients, scan.spectral_range)
+
+        dpcm_channels = []
+        for channel, channel_coefficients in zip(scan.channels, coefficients):
+            blocks = np.empty_like(channel_coefficients)
+            blocks[:, rlh.zigzag_order(block_size)] = channel_coefficients
+            dpcm_channels.append(from_blocks(blocks.reshape(channel.shape[0] // block_size, channel.shape[1] // block_size, block_size, block_size)))
+
+        Y_dpcm, Cb_dpcm, Cr_dpcm = dpcm_channels
+        image, _ = decoder.decoder(_with_channels(progressive_data.header, Y_dpcm=Y_dpcm, Cb_dpcm=Cb_dpcm, Cr_dpcm=Cr_dpcm), interpolation=interpolation)
+
+        yield image
@@ -0,0 +1,42 @@
+from common import TEST_PARAMETERS
+from matplotlib import pyplot as plt
+import cv2
+import decoder
+import encoder
+import jfif
+import numpy as np
+import progressive
+import pytest
+
+image = plt.imread(TEST_PARAMETERS.image_path)
+
+@pytest.mark.parametrize('rle_and_huffman', (True, False))
+def test_decode_progressive(rle_and_huffman):
+    encoded_data, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor, rle_and_huffman=rle_and_huffman, restart_interval=6)
+    expected, _ = decoder.decoder(encoded_data)
+
+    progressive_data = progressive.encode_progressive(encoded_data)
+    images = list(progressive.decode_progressive(progressive_data))
+
+    assert len(images) == len(progressive.DEFAULT_SCANS)
+    assert np.array_equal(images[-1], expected)
+
+    # Each scan brings the image closer to the final one, the first after a fraction of the data
+    errors = [np.abs(expected.astype(int) - decoded).mean() for decoded in images]
+    assert errors[0] > errors[1] > errors[2] == 0
+    assert progressive_data.scan_sizes()[0] < sum(progressive_data.scan_sizes()) / 5
+
+def test_encode_progressive_invalid_scans():
+    encoded_data, _ = encoder.encoder(image[:64, :64], quality_factor=TEST_PARAMETERS.quality_factor)
+
+    with pytest.raises(AssertionError):
+        progressive.encode_progressive(encoded_data, ((0, 0), (2, 63)))
+
+def test_progressive_jfif_readable_by_opencv():
+    encoded_data, _ = encoder.encoder(image, quality_factor=TEST_PARAMETERS.quality_factor)
+
+    baseline = cv2.imdecode(np.frombuffer(jfif.encode_jfif(encoded_data), dtype=np.uint8), cv2.IMREAD_COLOR)
+    data = jfif.encode_jfif(encoded_data, scans=progressive.DEFAULT_SCANS)
+
+    assert b'\xff\xc2' in data
+    assert np.array_equal(cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR), baseline)
@@ -0,0 +1,105 @@
+from common import DEFAULT_DOWNSAMPLE, VALID_DOWNSAMPLES_TYPE
+from encoder import JpegEncodedData, TransformedImage
+from typing import Callable, NamedTuple
+import cv2
+import encoder
+import jfif
+import numpy as np
+
+# Quality 100 uses the quality 50 table (a scale factor of 0 falls back to the
+# standard matrix), so the size stops growing with the quality factor after 99
+MAX_QUALITY_FACTOR = 99
+
+class RateControlResult(NamedTuple):
+    encoded_data: JpegEncodedData
+    # Size of encoded_data, as measured by the size function
+    size: int
+    # Whether size is within the budget (False when even quality 1 is too large)
+    within_budget: bool
+    # Number of quality factors tried
+    iterations: int
+
+def payload_size(encoded_data: JpegEncodedData) -> int:
+    """
+    Returns the number of bytes of the entropy coded channels, without headers.
+    """
+    return sum(len(channel.data) for channel in (encoded_data.Y_huffman, encoded_data.Cb_huffman, encoded_data.Cr_huffman))
+
+def jfif_size(encoded_data: JpegEncodedData) -> int:
+    """
+    Returns the size of the JFIF file of encoded_data (see jfif.encode_jfif).
+    """
+    return len(jfif.encode_jfif(encoded_data))
+
+def encode_to_size(
+    image: np.ndarray | None = None,
+    max_bytes: int | None = None,
+    *,
+    max_bits_per_pixel: float | None = None,
+    downsampling: VALID_DOWNSAMPLES_TYPE = DEFAULT_DOWNSAMPLE,
+    interpolation: int | None = cv2.INTER_LINEAR,
+    block_size: int = 8,
+    restart_interval: int = 0,
+    size: Callable[[JpegEncodedData], int] = payload_size,
+    transformed: TransformedImage | None = None,
+) -> RateControlResult:
+    """
+    Encodes an image at the highest quality factor whose size fits a budget.
+
+    The quality factor is found by binary search over [1, MAX_QUALITY_FACTOR]. Color conversion,
+    downsampling and the DCT run once (encoder.transform); each step of the
+    search only quantizes and entropy codes the cached coefficients.
+
+    Args:
+        image (np.ndarray): RGB image. Not needed if transformed is given.
+        max_bytes (int): Budget in bytes.
+        max_bits_per_pixel (float): Budget in bits per pixel of the image,
+            instead of max_bytes.
+        downsampling (str): Chroma downsampling.
+        interpolation (int): Interpolation used for the downsampling.
+        block_size (int): DCT block size.
+        restart_interval (int): Blocks between DC prediction restarts (0 for none).
+        size (Callable[[JpegEncodedData], int]): Measures an encoded image in
+            bytes. payload_size counts only the entropy coded data; use
+            jfif_size to budget the .jpeg file.
+        transformed (TransformedImage): Output of encoder.transform, to reuse it.
+
+    Returns:
+        RateControlResult: Encoded image, its size and whether it fits the budget.
+    """
+    assert (max_bytes is None) != (max_bits_per_pixel is None), 'Give either max_bytes or max_bits_per_pixel'
+
+    if transformed is None:
+        assert image is not None, 'Give either image or transformed'
+        transformed = encoder.transform(image, downsampling=downsampling, interpolation=interpolation, block_size=block_size)
+
+    if max_bytes is None:
+        height, width = transformed.image_shape[:2]
+        max_bytes = int(max_bits_per_pixel * height * width // 8)
+
+    def encode(quality_factor: int) -> tuple[JpegEncodedData, int]:
+        encoded_data = encoder.encode_transformed(transformed, quality_factor=quality_factor, restart_interval=restart_interval)
+
+        return encoded_data, size(encoded_data)
+
+    iterations = 0
+    best: tuple[JpegEncodedData, int] | None = None
+
+    # The size grows with the quality factor: keep the largest quality that fits
+    low, high = 1, MAX_QUALITY_FACTOR
+    while low <= high:
+        quality_factor = (low + high) // 2
+        encoded_data, encoded_size = encode(quality_factor)
+        iterations += 1
+
+        if encoded_size <= max_bytes:
+            best = encoded_data, encoded_size
+            low = quality_factor + 1
+        else:
+            high = quality_factor - 1
+
+    if best is None:
+        # Not even quality 1 fits (the last one tried): return it, the smallest we can do
+        return RateControlResult(encoded_data, encoded_size, False, iterations)
+
+    return RateControlResult(*best, True, iterations)
@@ -0,0 +1,42 @@
+from common import TEST_PARAMETERS
+from matplotlib import pyplot as plt
+import encoder
+import pytest
+import rate_control
+
+image = plt.imread(TEST_PARAMETERS.image_path)
+transformed = encoder.transform(image)
+
+@pytest.mark.parametrize('max_bytes', (20_000, 50_000, 150_000))
+def test_encode_to_size(max_bytes):
+    result = rate_control.encode_to_size(max_bytes=max_bytes, transformed=transformed)
+    quality_factor = result.encoded_data.quality_factor
+
+    assert result.within_budget
+    assert result.size == rate_control.payload_size(result.encoded_data) <= max_bytes
+    assert result.iterations <= 7
+
+    # The next quality factor does not fit
+    if quality_factor < rate_control.MAX_QUALITY_FACTOR:
+        larger = encoder.encode_transformed(transformed, quality_factor=quality_factor + 1)
+        assert rate_control.payload_size(larger) > max_bytes
+
+def test_encode_to_size_bits_per_pixel():
+    result = rate_control.encode_to_size(image, max_bits_per_pixel=1, size=rate_control.jfif_size)
+
+    assert result.within_budget
+    assert 8 * result.size <= image.shape[0] * image.shape[1]
+
+def test_encode_to_size_unlimited():
+    result = rate_control.encode_to_size(max_bytes=image.nbytes * 10, transformed=transformed)
+    best = encoder.encode_transformed(transformed, quality_factor=rate_control.MAX_QUALITY_FACTOR)
+
+    assert result.within_budget
+    assert result.encoded_data.quality_factor == rate_control.MAX_QUALITY_FACTOR
+    assert result.size == rate_control.payload_size(best)
+
+def test_encode_to_size_over_budget():
+    result = rate_control.encode_to_size(max_bytes=100, transformed=transformed)
+
+    assert not result.within_budget
+    assert result.encoded_data.quality_factor == 1
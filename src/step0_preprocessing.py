@@ -1,3 +1,4 @@
+from bmp import read_image
 from common import DOCS_DIR, IMAGES, generate_path
 from matplotlib import pyplot as plt
 import argparse
@@ -61,7 +62,7 @@ def main():
     for image_path in IMAGES:
         print(f'{image_path=}')
 
-        image = plt.imread(image_path)
+        image = read_image(image_path)
 
         _, intermidiate_values = encoder.encoder(image, return_intermidiate_values=True)
         r, g, b = intermidiate_values.red, intermidiate_values.green, intermidiate_values.blue
@@ -1,4 +1,6 @@
-from common import DOCS_DIR, VALID_DOWNSAMPLES_TYPE, generate_path, TEST_PARAMETERS
+from bmp import read_image
+from common import COLOR_CONVERSION, DOCS_DIR, VALID_DOWNSAMPLES_TYPE, generate_path, TEST_PARAMETERS
+from typing import Callable
 import argparse
 import cv2
 import encoder
@@ -9,6 +11,19 @@ import step2_chrominance_downsampling as cd
 import step3_discrete_cosine_transform as dct
 import step4_quatization as quant
 
+# Bytes de cada bloco de linhas processado de uma vez no cálculo das métricas
+METRICS_CHUNK_BYTES = 4 << 20
+
+# Parâmetros do SSIM (Wang et al., 2004): janela gaussiana de 11x11 com desvio
+# padrão 1.5 e as constantes de estabilização K1 e K2
+SSIM_WINDOW = 11
+SSIM_SIGMA = 1.5
+SSIM_K = (0.01, 0.03)
+# Pesos de cada escala do MS-SSIM (Wang et al., 2003)
+MS_SSIM_WEIGHTS = (0.0448, 0.2856, 0.3001, 0.2363, 0.1333)
+# Menor lado de uma imagem para o MS-SSIM com MS_SSIM_WEIGHTS
+MS_SSIM_MIN_SIZE = SSIM_WINDOW * 2 ** (len(MS_SSIM_WEIGHTS) - 1)
+
 def calculate_absolute_difference(original: np.ndarray, reconstructed: np.ndarray) -> np.ndarray:
     """
     Calcula a diferença absoluta entre a imagem original e reconstruída.
@@ -20,12 +35,91 @@ def calculate_absolute_difference(original: np.ndarray, reconstructed: np.ndarra
     Returns:
         np.ndarray: Diferença absoluta entre as imagens
     """
-    return np.abs(original.astype(float) - reconstructed.astype(float))
+    diff = np.subtract(original, reconstructed, dtype=float)
+
+    return np.abs(diff, out=diff)
+
+def _error_sums(original: np.ndarray, reconstructed: np.ndarray, per_channel: bool) -> dict:
+    """
+    Acumula, numa única passagem por blocos de linhas, as somas necessárias às
+    métricas de erro. Com per_channel, as somas são feitas por canal (último eixo).
+
+    Para imagens inteiras de 8 ou 16 bits as somas são inteiras, e portanto exatas.
+    """
+    assert original.shape == reconstructed.shape, f'Different shapes: {original.shape} != {reconstructed.shape}'
+
+    integer = all(np.issubdtype(image.dtype, np.integer) and image.dtype.itemsize <= 2 for image in (original, reconstructed))
+    if integer:
+        # As diferenças e os quadrados de valores de 8 bits cabem em int32
+        work_dtype = np.int32 if max(original.dtype.itemsize, reconstructed.dtype.itemsize) == 1 else np.int64
+        sum_dtype = np.int64
+    else:
+        work_dtype = sum_dtype = np.float64
+
+    axis = tuple(range(original.ndim - 1)) if per_channel else None
+    row_bytes = max(1, original[:1].size * np.dtype(work_dtype).itemsize)
+    rows = max(1, METRICS_CHUNK_BYTES // row_bytes)
+
+    sums = None
+    for first in range(0, max(len(original), 1), rows):
+        original_chunk = original[first:first + rows].astype(work_dtype)
+        diff = np.subtract(original_chunk, reconstructed[first:first + rows], dtype=work_dtype)
+        # As operações são feitas no lugar, para não criar mais temporários
+        absolute_diff = np.abs(diff, out=diff)
+
+        chunk_sums = {
+            'max_diff': absolute_diff.max(axis=axis),
+            'min_diff': absolute_diff.min(axis=axis),
+            'sum_abs': absolute_diff.sum(axis=axis, dtype=sum_dtype),
+            'sum_squared': np.square(absolute_diff, out=absolute_diff).sum(axis=axis, dtype=sum_dtype),
+            'sum_signal': np.square(original_chunk, out=original_chunk).sum(axis=axis, dtype=sum_dtype),
+            'max_signal': original[first:first + rows].max(axis=axis),
+        }
+
+        if sums is None:
+            sums = chunk_sums
+            continue
+        for name in ('max_diff', 'max_signal'):
+            sums[name] = np.maximum(sums[name], chunk_sums[name])
+        sums['min_diff'] = np.minimum(sums['min_diff'], chunk_sums['min_diff'])
+        for name in ('sum_abs', 'sum_squared', 'sum_signal'):
+            sums[name] = sums[name] + chunk_sums[name]
+
+    sums['count'] = original.size // original.shape[-1] if per_channel else original.size
+
+    return sums
+
+def _metrics_from_sums(sums: dict) -> dict:
+    count = sums['count']
+
+    # Erro Médio ao Quadrado (MSE) e potência do sinal original
+    mse = np.float64(sums['sum_squared']) / count
+    signal_power = np.float64(sums['sum_signal']) / count
+    # Valor máximo do sinal original
+    max_signal = np.float64(sums['max_signal']) ** 2
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # Rácio Sinal-Ruído (SNR) e Rácio Sinal-Ruído do Pico (PSNR) em dB
+        snr = np.where(mse > 0, 10 * np.log10(signal_power / mse), np.inf)
+        psnr = np.where(mse > 0, 10 * np.log10(max_signal / mse), np.inf)
+
+    return {
+        'max_diff': np.float64(sums['max_diff']),
+        'min_diff': np.float64(sums['min_diff']),
+        'avg_diff': np.float64(sums['sum_abs']) / count,
+        'mse': mse,
+        'rmse': np.sqrt(mse),
+        'snr': snr,
+        'psnr': psnr,
+    }
 
 def calculate_error_metrics(original: np.ndarray, reconstructed: np.ndarray) -> dict:
     """
     Calcula várias métricas de erro entre a imagem original e reconstruída.
 
+    As métricas são calculadas numa única passagem por blocos de linhas, sem
+    converter as imagens inteiras para float (ver METRICS_CHUNK_BYTES).
+
     Args:
         original (np.ndarray): Imagem original
         reconstructed (np.ndarray): Imagem reconstruída
@@ -33,47 +127,28 @@ def calculate_error_metrics(original: np.ndarray, reconstructed: np.ndarray) ->
     Returns:
         dict: Dicionário com as métricas de erro calculadas
     """
-    # Converte para float para evitar overflow em cálculos
-    original = original.astype(float)
-    reconstructed = reconstructed.astype(float)
-
-    # Calcula a diferença absoluta
-    diff = np.abs(original - reconstructed)
-
-    # Diferença máxima e mínima
-    max_diff = np.max(diff)
-    min_diff = np.min(diff)
-    avg_diff = np.mean(diff)
+    metrics = _metrics_from_sums(_error_sums(original, reconstructed, per_channel=False))
 
-    # Erro Médio ao Quadrado (MSE)
-    mse = np.mean((original - reconstructed) ** 2)
+    return {name: np.float64(value) for name, value in metrics.items()}
 
-    # Raiz Quadrada do MSE (RMSE)
-    rmse = np.sqrt(mse)
-
-    # Potência do sinal original
-    signal_power = np.mean(original ** 2)
-
-    # Rácio Sinal-Ruído (SNR) em dB
-    snr = 10 * np.log10(signal_power / mse) if mse > 0 else float('inf')
-
-    # Valor máximo do sinal original
-    max_signal = np.max(original) ** 2
+def calculate_error_metrics_per_channel(original: np.ndarray, reconstructed: np.ndarray) -> list[dict]:
+    """
+    Calcula as métricas de erro de cada canal (último eixo) de uma imagem,
+    sem separar os canais.
 
-    # Rácio Sinal-Ruído do Pico (PSNR) em dB
-    psnr = 10 * np.log10(max_signal / mse) if mse > 0 else float('inf')
+    Args:
+        original (np.ndarray): Imagem original (H, W, C)
+        reconstructed (np.ndarray): Imagem reconstruída (H, W, C)
 
-    metrics = {
-        'max_diff': max_diff,
-        'min_diff': min_diff,
-        'avg_diff': avg_diff,
-        'mse': mse,
-        'rmse': rmse,
-        'snr': snr,
-        'psnr': psnr
-    }
+    Returns:
+        list[dict]: Dicionário com as métricas de erro de cada canal
+    """
+    metrics = _metrics_from_sums(_error_sums(original, reconstructed, per_channel=True))
 
-    return metrics
+    return [
+        {name: np.float64(value[channel]) for name, value in metrics.items()}
+        for channel in range(original.shape[-1])
+    ]
 
 def calculate_channel_error_metrics(
     Y_original: np.ndarray,
@@ -101,6 +176,181 @@ def calculate_channel_error_metrics(
 
     return metrics
 
+def _data_range(image: np.ndarray, data_range: float | None) -> float:
+    # Por omissão, o maior valor do tipo para imagens inteiras e 1 para imagens float
+    if data_range is not None:
+        return data_range
+
+    return float(np.iinfo(image.dtype).max) if np.issubdtype(image.dtype, np.integer) else 1.0
+
+def _ssim_input(data_range: float, luma: bool) -> Callable[[np.ndarray], np.ndarray]:
+    """
+    Devolve a conversão de (um bloco de) uma imagem para float32 no intervalo
+    [0, 1], opcionalmente reduzida à luminância (Y).
+    """
+    luma_weights = COLOR_CONVERSION.RGB2YCbCr_matrix[0].astype(np.float32) / np.float32(data_range)
+
+    def prepare(image: np.ndarray) -> np.ndarray:
+        if luma:
+            return image.astype(np.float32) @ luma_weights
+
+        return image.astype(np.float32) / np.float32(data_range)
+
+    return prepare
+
+def _ssim_maps(x: np.ndarray, y: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calcula os mapas de SSIM e de contraste-estrutura de duas imagens float32 em
+    [0, 1]. Os filtros gaussianos do OpenCV são separáveis e aplicados a todos os
+    canais de uma vez.
+    """
+    def blur(image: np.ndarray) -> np.ndarray:
+        return cv2.GaussianBlur(image, (SSIM_WINDOW, SSIM_WINDOW), SSIM_SIGMA, borderType=cv2.BORDER_REFLECT)
+
+    c1, c2 = (k * k for k in SSIM_K)
+
+    mu_x, mu_y = blur(x), blur(y)
+    mu_xx, mu_yy, mu_xy = mu_x * mu_x, mu_y * mu_y, mu_x * mu_y
+
+    sigma_xx = blur(x * x) - mu_xx
+    sigma_yy = blur(y * y) - mu_yy
+    sigma_xy = blur(x * y) - mu_xy
+
+    cs_map = (2 * sigma_xy + c2) / (sigma_xx + sigma_yy + c2)
+    ssim_map = (2 * mu_xy + c1) / (mu_xx + mu_yy + c1) * cs_map
+
+    return ssim_map, cs_map
+
+def _ssim_means(
+    original: np.ndarray,
+    reconstructed: np.ndarray,
+    prepare: Callable[[np.ndarray], np.ndarray],
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Calcula a média do SSIM e do contraste-estrutura de cada canal, por blocos de
+    linhas. Cada bloco inclui as linhas vizinhas de que a janela precisa, e os
+    píxeis a menos de meia janela das margens da imagem são ignorados, por isso o
+    resultado não depende do tamanho dos blocos.
+    """
+    assert original.shape == reconstructed.shape, f'Different shapes: {original.shape} != {reconstructed.shape}'
+
+    radius = SSIM_WINDOW // 2
+    h, w = original.shape[:2]
+    assert h >= SSIM_WINDOW and w >= SSIM_WINDOW, f'Image too small for SSIM: {original.shape}. Needs at least {SSIM_WINDOW}x{SSIM_WINDOW}'
+
+    # Cerca de 10 temporários float32 do tamanho de cada bloco
+    rows = max(1, METRICS_CHUNK_BYTES // (10 * 4 * original[:1].size))
+
+    ssim_sum = cs_sum = 0
+    for first in range(radius, h - radius, rows):
+        last = min(first + rows, h - radius)
+        ssim_map, cs_map = _ssim_maps(
+            prepare(original[first - radius:last + radius]),
+            prepare(reconstructed[first - radius:last + radius]),
+        )
+
+        valid = (slice(radius, -radius), slice(radius, -radius))
+        ssim_sum = ssim_sum + ssim_map[valid].sum(axis=(0, 1), dtype=np.float64)
+        cs_sum = cs_sum + cs_map[valid].sum(axis=(0, 1), dtype=np.float64)
+
+    count = (h - 2 * radius) * (w - 2 * radius)
+
+    return np.atleast_1d(ssim_sum / count), np.atleast_1d(cs_sum / count)
+
+def calculate_ssim_per_channel(
+    original: np.ndarray,
+    reconstructed: np.ndarray,
+    *,
+    data_range: float | None = None,
+    luma: bool = False,
+) -> list[float]:
+    """
+    Calcula o SSIM (Structural Similarity Index) de cada canal de uma imagem.
+
+    Usa uma janela gaussiana de 11x11 (SSIM_WINDOW, SSIM_SIGMA) aplicada com os
+    filtros separáveis do OpenCV sobre float32, por blocos de linhas.
+
+    Args:
+        original (np.ndarray): Imagem original (H, W) ou (H, W, C)
+        reconstructed (np.ndarray): Imagem reconstruída
+        data_range (float): Amplitude dos valores (por omissão, 255 para uint8 e 1 para float)
+        luma (bool): Calcula o SSIM apenas da luminância (Y) de uma imagem RGB
+
+    Returns:
+        list[float]: SSIM de cada canal (um só com luma)
+    """
+    prepare = _ssim_input(_data_range(original, data_range), luma)
+    ssim, _ = _ssim_means(original, reconstructed, prepare)
+
+    return [float(value) for value in ssim]
+
+def calculate_ssim(
+    original: np.ndarray,
+    reconstructed: np.ndarray,
+    *,
+    data_range: float | None = None,
+    luma: bool = False,
+) -> float:
+    """
+    Calcula o SSIM de uma imagem, como a média do SSIM dos seus canais (ver
+    calculate_ssim_per_channel).
+
+    Args:
+        original (np.ndarray): Imagem original (H, W) ou (H, W, C)
+        reconstructed (np.ndarray): Imagem reconstruída
+        data_range (float): Amplitude dos valores (por omissão, 255 para uint8 e 1 para float)
+        luma (bool): Calcula o SSIM apenas da luminância (Y) de uma imagem RGB
+
+    Returns:
+        float: SSIM, entre -1 e 1 (1 para imagens iguais)
+    """
+    return float(np.mean(calculate_ssim_per_channel(original, reconstructed, data_range=data_range, luma=luma)))
+
+def calculate_ms_ssim(
+    original: np.ndarray,
+    reconstructed: np.ndarray,
+    *,
+    data_range: float | None = None,
+    luma: bool = False,
+    weights: tuple[float, ...] = MS_SSIM_WEIGHTS,
+) -> float:
+    """
+    Calcula o MS-SSIM (Multi-Scale SSIM) de uma imagem.
+
+    O contraste-estrutura é medido em cada escala e a luminância apenas na última;
+    entre escalas, as imagens são reduzidas a metade pela média de cada 2x2 píxeis.
+    Com várias cores, o resultado é a média do MS-SSIM dos canais.
+
+    Args:
+        original (np.ndarray): Imagem original (H, W) ou (H, W, C)
+        reconstructed (np.ndarray): Imagem reconstruída
+        data_range (float): Amplitude dos valores (por omissão, 255 para uint8 e 1 para float)
+        luma (bool): Calcula o MS-SSIM apenas da luminância (Y) de uma imagem RGB
+        weights (tuple[float, ...]): Peso de cada escala
+
+    Returns:
+        float: MS-SSIM, entre 0 e 1 (1 para imagens iguais)
+    """
+    min_size = SSIM_WINDOW * 2 ** (len(weights) - 1)
+    assert min(original.shape[:2]) >= min_size, f'Image too small for MS-SSIM with {len(weights)} scales: {original.shape}. Needs at least {min_size}x{min_size}'
+
+    prepare = _ssim_input(_data_range(original, data_range), luma)
+    x, y = prepare(original), prepare(reconstructed)
+
+    ms_ssim = 1
+    for scale, weight in enumerate(weights):
+        ssim, cs = _ssim_means(x, y, lambda image: image)
+
+        # Valores negativos são truncados, para as potências estarem definidas
+        last = scale == len(weights) - 1
+        ms_ssim = ms_ssim * np.maximum(ssim if last else cs, 0) ** weight
+
+        if not last:
+            h, w = x.shape[:2]
+            x, y = (cv2.resize(image[:h - h % 2, :w - w % 2], (w // 2, h // 2), interpolation=cv2.INTER_AREA) for image in (x, y))
+
+    return float(np.mean(ms_ssim))
+
 def visualize_difference(
     original: np.ndarray,
     reconstructed: np.ndarray,
@@ -172,7 +422,7 @@ def reconstruct_image(image_path, quality_factor=75, downsampling: VALID_DOWNSAM
         tuple: (imagem original, imagem reconstruída, valores intermediários)
     """
     # Carrega a imagem
-    image = plt.imread(image_path)
+    image = read_image(image_path)
 
     # Processa a imagem usando o encoder
     _, iv = encoder.encoder(
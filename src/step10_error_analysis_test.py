@@ -0,0 +1,109 @@
+from common import COLOR_CONVERSION
+import cv2
+import numpy as np
+import pytest
+import step10_error_analysis as error_analysis
+
+rng = np.random.default_rng(0)
+original = rng.integers(0, 256, size=(67, 45, 3), dtype=np.uint8)
+reconstructed = np.clip(original + rng.integers(-20, 21, size=original.shape), 0, 255).astype(np.uint8)
+
+def reference_metrics(original: np.ndarray, reconstructed: np.ndarray) -> dict:
+    original = original.astype(float)
+    reconstructed = reconstructed.astype(float)
+    diff = np.abs(original - reconstructed)
+    mse = np.mean(diff ** 2)
+
+    return {
+        'max_diff': diff.max(),
+        'min_diff': diff.min(),
+        'avg_diff': diff.mean(),
+        'mse': mse,
+        'rmse': np.sqrt(mse),
+        'snr': 10 * np.log10(np.mean(original ** 2) / mse),
+        'psnr': 10 * np.log10(original.max() ** 2 / mse),
+    }
+
+@pytest.mark.parametrize('dtype', (np.uint8, np.float32))
+@pytest.mark.parametrize('chunk_bytes', (1, 1000, error_analysis.METRICS_CHUNK_BYTES))
+def test_calculate_error_metrics(monkeypatch, dtype, chunk_bytes):
+    monkeypatch.setattr(error_analysis, 'METRICS_CHUNK_BYTES', chunk_bytes)
+
+    expected = reference_metrics(original, reconstructed)
+    actual = error_analysis.calculate_error_metrics(original.astype(dtype), reconstructed.astype(dtype))
+
+    assert actual.keys() == expected.keys()
+    for name in expected:
+        assert actual[name] == pytest.approx(expected[name], rel=1e-12), name
+
+def test_calculate_error_metrics_per_channel(monkeypatch):
+    monkeypatch.setattr(error_analysis, 'METRICS_CHUNK_BYTES', 1000)
+
+    actual = error_analysis.calculate_error_metrics_per_channel(original, reconstructed)
+
+    assert len(actual) == 3
+    for channel, channel_metrics in enumerate(actual):
+        expected = reference_metrics(original[..., channel], reconstructed[..., channel])
+        for name in expected:
+            assert channel_metrics[name] == pytest.approx(expected[name], rel=1e-12), (channel, name)
+
+def test_calculate_error_metrics_identical():
+    metrics = error_analysis.calculate_error_metrics(original, original)
+
+    assert metrics['mse'] == 0 and metrics['max_diff'] == 0
+    assert metrics['psnr'] == float('inf') and metrics['snr'] == float('inf')
+
+def test_calculate_absolute_difference():
+    actual = error_analysis.calculate_absolute_difference(original, reconstructed)
+
+    assert actual.dtype == np.float64
+    assert np.array_equal(actual, np.abs(original.astype(float) - reconstructed.astype(float)))
+
+def reference_ssim(original: np.ndarray, reconstructed: np.ndarray) -> list[float]:
+    # The same window on float64, on the whole image
+    radius = error_analysis.SSIM_WINDOW // 2
+    c1, c2 = (k * k for k in error_analysis.SSIM_K)
+    blur = lambda image: cv2.GaussianBlur(image, (error_analysis.SSIM_WINDOW,) * 2, error_analysis.SSIM_SIGMA, borderType=cv2.BORDER_REFLECT)
+
+    ssim = []
+    for channel in range(original.shape[-1]):
+        x, y = original[..., channel] / 255, reconstructed[..., channel] / 255
+        mu_x, mu_y = blur(x), blur(y)
+        sigma_xx, sigma_yy, sigma_xy = blur(x * x) - mu_x ** 2, blur(y * y) - mu_y ** 2, blur(x * y) - mu_x * mu_y
+        ssim_map = (2 * mu_x * mu_y + c1) * (2 * sigma_xy + c2) / ((mu_x ** 2 + mu_y ** 2 + c1) * (sigma_xx + sigma_yy + c2))
+        ssim.append(ssim_map[radius:-radius, radius:-radius].mean())
+
+    return ssim
+
+@pytest.mark.parametrize('chunk_bytes', (1, 20000, error_analysis.METRICS_CHUNK_BYTES))
+def test_calculate_ssim(monkeypatch, chunk_bytes):
+    monkeypatch.setattr(error_analysis, 'METRICS_CHUNK_BYTES', chunk_bytes)
+
+    expected = reference_ssim(original, reconstructed)
+    actual = error_analysis.calculate_ssim_per_channel(original, reconstructed)
+
+    assert actual == pytest.approx(expected, abs=1e-5)
+    assert error_analysis.calculate_ssim(original, reconstructed) == pytest.approx(np.mean(expected), abs=1e-5)
+    assert error_analysis.calculate_ssim(original.astype(np.float32) / 255, reconstructed.astype(np.float32) / 255) == pytest.approx(np.mean(expected), abs=1e-5)
+    assert error_analysis.calculate_ssim(original, original) == pytest.approx(1)
+
+def test_calculate_ssim_luma():
+    luma = lambda image: (image @ COLOR_CONVERSION.RGB2YCbCr_matrix[0])[..., None]
+
+    expected = reference_ssim(luma(original), luma(reconstructed))
+    actual = error_analysis.calculate_ssim_per_channel(original, reconstructed, luma=True)
+
+    assert actual == pytest.approx(expected, abs=1e-5)
+
+def test_calculate_ms_ssim():
+    size = error_analysis.MS_SSIM_MIN_SIZE
+    image = cv2.resize(original, (size + 5, size), interpolation=cv2.INTER_CUBIC)
+    noisy = [np.clip(image + rng.normal(0, sigma, image.shape), 0, 255).astype(np.uint8) for sigma in (2, 10, 30)]
+
+    ms_ssim = [error_analysis.calculate_ms_ssim(image, other) for other in noisy]
+
+    assert error_analysis.calculate_ms_ssim(image, image) == pytest.approx(1)
+    assert 1 > ms_ssim[0] > ms_ssim[1] > ms_ssim[2] > 0
+
+    with pytest.raises(AssertionError):
+        error_analysis.calculate_ms_ssim(original, reconstructed)
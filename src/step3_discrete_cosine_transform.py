@@ -1,10 +1,10 @@
-from common import DOCS_DIR, IMAGES, generate_path, custom_cmap
+from common import DOCS_DIR, IMAGES, generate_path, custom_cmap, from_blocks, to_blocks
 from itertools import product
 from matplotlib import pyplot as plt
+from functools import lru_cache
 from scipy.fftpack import dct, idct
 import argparse
 import encoder
-import itertools
 import numpy as np
 
 def dct_channel(channel: np.ndarray, norm: str = "ortho") -> np.ndarray:
@@ -135,10 +135,81 @@ def recover_channels(
 
     return Y, Cb, Cr
 
+@lru_cache(maxsize=None)
+def dct_matrix(size: int) -> np.ndarray:
+    """
+    Matriz da DCT-II ortonormada de dimensão size x size.
+
+    Para um vetor x, dct(x, type=2, norm="ortho") == dct_matrix(len(x)) @ x, logo a
+    DCT-2D de um bloco X é C @ X @ C.T e a IDCT-2D é C.T @ X @ C.
+
+    Args:
+        size (int): Dimensão da matriz.
+
+    Returns:
+        np.ndarray: Matriz da DCT (só de leitura, guardada em cache).
+    """
+    n = np.arange(size)
+    k = n.reshape(-1, 1)
+
+    matrix = np.sqrt(2 / size) * np.cos(np.pi * (2 * n + 1) * k / (2 * size))
+    matrix[0, :] = np.sqrt(1 / size)
+    matrix.setflags(write=False)
+
+    return matrix
+
+def _transform_blocks(region: np.ndarray, block_shape: tuple[int, int], inverse: bool) -> np.ndarray:
+    """
+    Aplica a DCT (ou IDCT) a todos os blocos de uma região numa única operação.
+
+    Args:
+        region (np.ndarray): Região cujas dimensões são múltiplas de block_shape.
+        block_shape (tuple[int, int]): Dimensões (altura, largura) de cada bloco.
+        inverse (bool): Aplica a IDCT em vez da DCT.
+
+    Returns:
+        np.ndarray: Região transformada (float64).
+    """
+    h, w = region.shape
+    bh, bw = block_shape
+    rows, cols = dct_matrix(bh), dct_matrix(bw)
+    if inverse:
+        rows, cols = rows.T, cols.T
+
+    # (n_blocks_y, bh, n_blocks_x, bw)
+    blocks = region.reshape(h // bh, bh, w // bw, bw)
+
+    # Transforma as linhas de todos os blocos e depois as colunas
+    blocks = np.tensordot(blocks, cols, axes=([3], [1]))
+    blocks = np.tensordot(rows, blocks, axes=([1], [1]))
+
+    return blocks.transpose(1, 0, 2, 3).reshape(h, w)
+
+def _apply_blocks(image: np.ndarray, block_size: int, inverse: bool) -> np.ndarray:
+    h, w = image.shape
+    transformed = np.empty_like(image)
+
+    h_full, w_full = h - h % block_size, w - w % block_size
+
+    # Os blocos incompletos das margens são transformados com a DCT do seu tamanho
+    for rows in (slice(0, h_full), slice(h_full, h)):
+        for cols in (slice(0, w_full), slice(w_full, w)):
+            region = image[rows, cols]
+            if region.size == 0:
+                continue
+
+            block_shape = (min(block_size, region.shape[0]), min(block_size, region.shape[1]))
+            transformed[rows, cols] = _transform_blocks(region, block_shape, inverse)
+
+    return transformed
+
 def dct_blocks(image: np.ndarray, block_size: int = 8) -> np.ndarray:
     """
     Aplica a DCT em blocos de tamanho block_size x block_size.
 
+    Todos os blocos são transformados de uma só vez com a matriz da DCT, o que
+    equivale a aplicar dct_channel a cada bloco.
+
     Args:
         image (np.ndarray): Imagem de entrada.
         block_size (int): Tamanho do bloco.
@@ -146,15 +217,7 @@ def dct_blocks(image: np.ndarray, block_size: int = 8) -> np.ndarray:
     Returns:
         np.ndarray: Imagem transformada pela DCT.
     """
-    h, w = image.shape
-    dct_image = np.zeros_like(image)
-
-    for i in range(0, h, block_size):
-        for j in range(0, w, block_size):
-            block = image[i:i + block_size, j:j + block_size]
-            dct_image[i:i + block_size, j:j + block_size] = dct_channel(block)
-
-    return dct_image
+    return _apply_blocks(image, block_size, inverse=False)
 
 def idct_blocks(image: np.ndarray, block_size: int = 8) -> np.ndarray:
     """
@@ -167,14 +230,33 @@ def idct_blocks(image: np.ndarray, block_size: int = 8) -> np.ndarray:
     Returns:
         np.ndarray: Imagem recuperada pela IDCT.
     """
-    h, w = image.shape
-    idct_image = np.zeros_like(image)
+    return _apply_blocks(image, block_size, inverse=True)
+
+def scaled_idct_blocks(image: np.ndarray, block_size: int = 8, scale: int = 1) -> np.ndarray:
+    """
+    Aplica uma IDCT reduzida que reconstrói cada bloco com 1/scale do tamanho.
+
+    Só o canto de (block_size / scale)^2 coeficientes de menor frequência de cada
+    bloco é usado, com a IDCT desse tamanho. Os coeficientes são multiplicados por
+    1/scale para que a média de cada bloco se mantenha (com a DCT ortonormal, o DC
+    é o tamanho do bloco vezes a média).
+
+    Args:
+        image (np.ndarray): Imagem transformada pela DCT, com dimensões múltiplas de block_size.
+        block_size (int): Tamanho do bloco.
+        scale (int): Fator de redução, divisor de block_size.
+
+    Returns:
+        np.ndarray: Imagem recuperada com 1/scale da altura e da largura.
+    """
+    assert block_size % scale == 0, f'Invalid scale: {scale}. Needs to divide block_size ({block_size})'
+
+    size = block_size // scale
+    matrix = dct_matrix(size)
 
-    for i, j in itertools.product(range(0, h, block_size), range(0, w, block_size)):
-        block = image[i:i + block_size, j:j + block_size]
-        idct_image[i:i + block_size, j:j + block_size] = idct_channel(block)
+    corners = to_blocks(image, block_size)[..., :size, :size] / scale
 
-    return idct_image
+    return from_blocks(matrix.T @ corners @ matrix)
 
 def main():
     parser = argparse.ArgumentParser(description="Discrete Cosine Transform")
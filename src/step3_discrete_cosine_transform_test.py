@@ -1,7 +1,7 @@
 from common import TEST_PARAMETERS
 from matplotlib import pyplot as plt
 from step1_color_space_conversion import rgb_to_ycbcr
-from step3_discrete_cosine_transform import dct_channel, idct_channel, apply_dct_to_channels, recover_channels, dct_blocks, idct_blocks
+from step3_discrete_cosine_transform import dct_channel, idct_channel, apply_dct_to_channels, recover_channels, dct_blocks, idct_blocks, scaled_idct_blocks
 import numpy as np
 
 image = plt.imread(TEST_PARAMETERS.image_path)
@@ -83,3 +83,26 @@ def test_block_8x8_dct_idct():
     assert np.allclose(Y, Y_rec8, atol=1e-10), "Canal Y não foi recuperado corretamente (8x8)."
     assert np.allclose(Cb, Cb_rec8, atol=1e-10), "Canal Cb não foi recuperado corretamente (8x8)."
     assert np.allclose(Cr, Cr_rec8, atol=1e-10), "Canal Cr não foi recuperado corretamente (8x8)."
+
+def test_dct_blocks_matches_dct_channel():
+    # Inclui blocos incompletos nas margens (70x101 não é múltiplo de 8)
+    channel = np.random.default_rng(0).random((70, 101)) * 255
+
+    Y_dct8 = dct_blocks(channel)
+    Y_rec8 = idct_blocks(Y_dct8)
+
+    for i in range(0, 70, 8):
+        for j in range(0, 101, 8):
+            block = channel[i:i + 8, j:j + 8]
+            assert np.allclose(Y_dct8[i:i + 8, j:j + 8], dct_channel(block), atol=1e-9), f"Bloco ({i}, {j}) diferente"
+            assert np.allclose(Y_rec8[i:i + 8, j:j + 8], block, atol=1e-9), f"Bloco ({i}, {j}) não recuperado"
+
+def test_scaled_idct_blocks():
+    assert np.allclose(scaled_idct_blocks(Y_dct8[:640, :1200]), idct_blocks(Y_dct8[:640, :1200]))
+
+    # Blocos constantes mantêm o valor a qualquer escala
+    channel = np.kron(np.arange(12, dtype=np.float64).reshape(3, 4), np.ones((8, 8)))
+    for scale in (2, 4, 8):
+        expected = np.kron(np.arange(12, dtype=np.float64).reshape(3, 4), np.ones((8 // scale, 8 // scale)))
+        actual = scaled_idct_blocks(dct_blocks(channel), scale=scale)
+        assert np.allclose(actual, expected), f'\n{actual}\n!=\n{expected}'
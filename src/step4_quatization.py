@@ -1,52 +1,61 @@
-from common import DOCS_DIR, IMAGES, custom_cmap, generate_path
-from itertools import product
+from common import DOCS_DIR, IMAGES, custom_cmap, from_blocks, generate_path, to_blocks
 from matplotlib import pyplot as plt
 import argparse
 import encoder
 import numpy as np
 
+# Standard JPEG quantization matrix for luminance
+JPEG_QUANTIZATION_MATRIX = np.array([
+    [16, 11, 10, 16, 24,  40,  51,  61],
+    [12, 12, 14, 19, 26,  58,  60,  55],
+    [14, 13, 16, 24, 40,  57,  69,  56],
+    [14, 17, 22, 29, 51,  87,  80,  62],
+    [18, 22, 37, 56, 68,  109, 103, 77],
+    [24, 35, 55, 64, 81,  104, 113, 92],
+    [49, 64, 78, 87, 103, 121, 120, 101],
+    [72, 92, 95, 98, 112, 100, 103, 99]
+])
+
+def _build_quantization_matrix(quality_factor: int) -> np.ndarray:
+    if quality_factor < 50:
+        scale_factor = 50 / quality_factor
+    else:
+        scale_factor = (100 - quality_factor) / 50
+
+    if scale_factor == 0:
+        return JPEG_QUANTIZATION_MATRIX.astype(np.uint8)
+
+    # Entries that round to 0 are clamped to 1, otherwise quantization divides by zero
+    return (JPEG_QUANTIZATION_MATRIX * scale_factor).round().clip(1, 255).astype(np.uint8)
+
+# Every quality factor table, indexed by quality_factor - 1
+QUANTIZATION_MATRICES = np.stack([_build_quantization_matrix(quality_factor) for quality_factor in range(1, 101)])
+QUANTIZATION_MATRICES.setflags(write=False)
+
+def _table_index(quality_factor: int) -> int:
+    return int(np.clip(quality_factor, 1, 100)) - 1
+
 def get_quantization_matrix(quality_factor: int) -> np.ndarray:
     """
     Generates a quantization matrix based on the quality factor.
     The default quality factor is 50, which is typically used as a baseline.
 
+    The matrices are precomputed once for every quality factor, so this is a lookup.
+
     Args:
         quality_factor (int): Quality factor. quality_factor ϵ [1-100].
 
     Returns:
-        ndarray: Quantization matrix.
+        ndarray: Quantization matrix (read only).
     """
-
-    # Standard JPEG quantization matrix for luminance
-    jpeg_quantization_matrix = np.array([
-        [16, 11, 10, 16, 24,  40,  51,  61],
-        [12, 12, 14, 19, 26,  58,  60,  55],
-        [14, 13, 16, 24, 40,  57,  69,  56],
-        [14, 17, 22, 29, 51,  87,  80,  62],
-        [18, 22, 37, 56, 68,  109, 103, 77],
-        [24, 35, 55, 64, 81,  104, 113, 92],
-        [49, 64, 78, 87, 103, 121, 120, 101],
-        [72, 92, 95, 98, 112, 100, 103, 99]
-    ])
-
-    quality_factor = np.clip(quality_factor, 1, 100)
-
-    if quality_factor < 50:
-        scale_factor = 50 / quality_factor
-    else:
-        scale_factor = (100 - quality_factor) / 50
-
-    if scale_factor == 0:
-        return jpeg_quantization_matrix
-
-    quantization_matrix = (jpeg_quantization_matrix * scale_factor).round().clip(0, 255).astype(np.uint8)
-
-    return quantization_matrix
+    return QUANTIZATION_MATRICES[_table_index(quality_factor)]
 
 def quantization(
     dct_image: np.ndarray,
     quality_factor: int = 100,
     block_size: int = 8,
+    *,
+    quant_matrix: np.ndarray | None = None,
 ) -> np.ndarray:
     """
     This function quantizes the DCT coeficients for each block.
@@ -55,28 +64,29 @@ def quantization(
         image (ndarray): DCT-applied image.
         quality_factor (int): Quality factor. quality_factor ϵ [1-100].
         block_size (int): Size of the block. Default = 8.
+        quant_matrix (ndarray) [Optional]: Quantization matrix to use instead of
+            the one of quality_factor.
 
     Returns:
         ndarray: Quantized image.
     """
+    assert block_size == JPEG_QUANTIZATION_MATRIX.shape[0], f'Invalid block_size: {block_size}. The quantization matrices are {JPEG_QUANTIZATION_MATRIX.shape}'
 
-    h, w = dct_image.shape
-    quantized_image = np.zeros_like(dct_image)
-
-    quant_matrix = get_quantization_matrix(quality_factor)
-
-    for i, j in product(range(0, h, block_size), range(0, w, block_size)):
-        block = dct_image[i : i + block_size, j : j + block_size]
-        quantized_image[i : i + block_size, j : j + block_size] = np.round(block / quant_matrix)
+    if quant_matrix is None:
+        quant_matrix = get_quantization_matrix(quality_factor)
 
-    quantized_image = quantized_image.astype(np.int32)
+    # Dividing (not multiplying by the reciprocal) so that halves round the same as x / q
+    quantized_blocks = np.divide(to_blocks(dct_image, block_size), quant_matrix)
+    np.rint(quantized_blocks, out=quantized_blocks)
 
-    return quantized_image
+    return from_blocks(quantized_blocks).astype(np.int32)
 
 def iquantization(
     quantized_image: np.ndarray,
     quality_factor: int = 100,
-    block_size: int = 8
+    block_size: int = 8,
+    *,
+    quant_matrix: np.ndarray | None = None,
 ) -> np.ndarray:
     """
     This function dequantizes the quantized image back to DCT coefficients.
@@ -85,22 +95,34 @@ def iquantization(
         quantized_image (ndarray): Quantized image.
         quality_factor (int): Quality factor. quality_factor ϵ [1-100].
         block_size (int): Size of the block. Default = 8.
+        quant_matrix (ndarray) [Optional]: Quantization matrix to use instead of
+            the one of quality_factor.
 
     Returns:
         ndarray: Dequantized image (approximate DCT coefficients).
     """
-    h, w = quantized_image.shape
-    dct_image = np.zeros_like(quantized_image)
+    assert block_size == JPEG_QUANTIZATION_MATRIX.shape[0], f'Invalid block_size: {block_size}. The quantization matrices are {JPEG_QUANTIZATION_MATRIX.shape}'
+
+    if quant_matrix is None:
+        quant_matrix = get_quantization_matrix(quality_factor)
+
+    dct_blocks = np.multiply(to_blocks(quantized_image, block_size), quant_matrix, dtype=np.float32)
+
+    return from_blocks(dct_blocks)
 
-    quant_matrix = get_quantization_matrix(quality_factor)
+def estimate_quality_factor(quant_matrix: np.ndarray) -> int:
+    """
+    Finds the quality factor whose quantization matrix is closest to quant_matrix.
 
-    for i, j in product(range(0, h, block_size), range(0, w, block_size)):
-        block = quantized_image[i : i + block_size, j : j + block_size]
-        dct_image[i : i + block_size, j : j + block_size] = block * quant_matrix
+    Args:
+        quant_matrix (ndarray): Quantization matrix, e.g. read from a JPEG file.
 
-    dct_image = dct_image.astype(np.float32)
+    Returns:
+        int: Quality factor. quality_factor ϵ [1-100].
+    """
+    distances = np.abs(QUANTIZATION_MATRICES.astype(np.int64) - np.asarray(quant_matrix, dtype=np.int64)).sum(axis=(1, 2))
 
-    return dct_image
+    return int(np.argmin(distances)) + 1
 
 def main():
     parser = argparse.ArgumentParser(description="Quantization")
@@ -74,3 +74,33 @@ def test_inverse_quantization():
     print(delta)
 
     assert np.allclose(Yb_DCT8x8, Yb_DCT8x8_actual, rtol=1e-5), f'\n{Yb_DCT8x8}\n!=\n{Yb_DCT8x8_actual}'
+
+def test_quantization_whole_channel():
+    channel = np.random.default_rng(0).normal(scale=100, size=(32, 48))
+
+    quant_matrix = np.tile(get_quantization_matrix(TEST_PARAMETERS.quality_factor), (4, 6))
+
+    expected_Q = np.round(channel / quant_matrix).astype(np.int32)
+    actual_Q = quantization(channel, quality_factor=TEST_PARAMETERS.quality_factor)
+
+    assert np.array_equal(expected_Q, actual_Q), f'\n{expected_Q}\n!=\n{actual_Q}'
+
+    actual_iQ = iquantization(actual_Q, quality_factor=TEST_PARAMETERS.quality_factor)
+
+    assert np.array_equal(expected_Q * quant_matrix, actual_iQ), f'\n{expected_Q * quant_matrix}\n!=\n{actual_iQ}'
+
+def test_quantization_matrix_has_no_zeros():
+    for quality_factor in range(1, 101):
+        assert get_quantization_matrix(quality_factor).min() >= 1, f'Quality factor {quality_factor} has a zero entry'
+
+def test_quantization_rounds_halves():
+    # Integer coefficients make exact halves (x / q = n + 0.5), which rint rounds to even
+    channel = np.arange(-2048, 2048, dtype=np.float64).reshape(64, 64)
+
+    for quality_factor in range(1, 101):
+        quant_matrix = np.tile(get_quantization_matrix(quality_factor), (8, 8))
+
+        expected_Q = np.rint(channel / quant_matrix).astype(np.int32)
+        actual_Q = quantization(channel, quality_factor=quality_factor)
+
+        assert np.array_equal(expected_Q, actual_Q), f'Quality factor {quality_factor}: {np.count_nonzero(expected_Q != actual_Q)} coefficients differ'
@@ -1,74 +1,63 @@
-from common import DOCS_DIR, IMAGES, TEST_PARAMETERS, generate_path, custom_cmap
+from common import DOCS_DIR, IMAGES, TEST_PARAMETERS, generate_path, custom_cmap, to_blocks
 from matplotlib import pyplot as plt
 import argparse
 import encoder
-import itertools
 import numpy as np
 
-def dpcm_encode(quantized_dct_blocks: np.ndarray, block_size: int = 8) -> np.ndarray:
+def _restarts(n_blocks: int, restart_interval: int, first_block: int) -> np.ndarray:
+    # Blocos (de um intervalo que começa em first_block) onde a previsão DC recomeça
+    if not restart_interval:
+        return np.zeros(n_blocks, dtype=bool)
+
+    return (first_block + np.arange(n_blocks)) % restart_interval == 0
+
+def dpcm_encode(
+    quantized_dct_blocks: np.ndarray,
+    block_size: int = 8,
+    restart_interval: int = 0,
+    *,
+    first_block: int = 0,
+    previous_dc: int = 0,
+) -> np.ndarray:
     """
     Realiza a codificação DPCM (Differential Pulse-Code Modulation) dos coeficientes DC.
     Substitui o valor DC pelo valor da diferença em cada bloco.
 
+    Os blocos são percorridos por ordem raster (linha a linha) e o primeiro bloco
+    é previsto a partir de 0. Com restart_interval, a previsão volta a 0 a cada
+    restart_interval blocos, que podem assim ser descodificados sem os anteriores.
+
     Args:
         quantized_dct_blocks (np.ndarray): Blocos DCT quantizados
         block_size (int): Tamanho do bloco (padrão: 8)
+        restart_interval (int): Número de blocos entre reinícios (0: sem reinícios)
+        first_block (int): Índice do primeiro bloco, se os blocos forem parte de um canal
+        previous_dc (int): Valor DC do bloco anterior a first_block
 
     Returns:
         np.ndarray: Blocos com codificação DPCM aplicada
     """
-    # Get the number of blocks
-    num_blocks = quantized_dct_blocks.shape[0]
-
-    # Ensure output array is the same shape as the input
-    dpcm_blocks = np.zeros_like(quantized_dct_blocks)
-
-    # Initialize the previous DC value
-    previous_dc = 0
-
-    for i in range(num_blocks):
-        # Extract the DC coefficient (top-left corner for a standard DCT block)
-        current_dc = quantized_dct_blocks[i, 0]
-
-        # Calculate the difference (DPCM)
-        dpcm_dc = current_dc - previous_dc
-
-        # Store the encoded DC value
-        dpcm_blocks[i, 0] = dpcm_dc
-
-        # Update the previous DC for the next iteration
-        previous_dc = current_dc
-
-    # Copy the rest of the coefficients (AC coefficients) unchanged
-    dpcm_blocks[:, 1:] = quantized_dct_blocks[:, 1:]
-
-    return dpcm_blocks
-    # Cria uma cópia dos blocos para não modificar o original
     dpcm_blocks = quantized_dct_blocks.copy()
 
-    # Obtém as dimensões da imagem em blocos
-    h, w = dpcm_blocks.shape[:2]
-
-    # Valor DC anterior (inicialmente 0)
-    prev_dc = 0
+    # Coeficientes DC (canto superior esquerdo de cada bloco) por ordem raster
+    dc = to_blocks(quantized_dct_blocks, block_size)[..., 0, 0].ravel()
 
-    # Percorre todos os blocos
-    for i, j in itertools.product(range(h), range(w)):
-        # Obtém o valor DC atual (posição 0,0 do bloco)
-        current_dc = dpcm_blocks[i, j, 0, 0]
+    differences = np.diff(dc, prepend=previous_dc)
+    restarts = _restarts(dc.size, restart_interval, first_block)
+    differences[restarts] = dc[restarts]
 
-        # Calcula a diferença
-        diff = current_dc - prev_dc
-
-        # Substitui o valor DC pela diferença
-        dpcm_blocks[i, j, 0, 0] = diff
-
-        # Atualiza o valor DC anterior
-        prev_dc = current_dc
+    to_blocks(dpcm_blocks, block_size)[..., 0, 0] = differences.reshape(to_blocks(dpcm_blocks, block_size).shape[:-2])
 
     return dpcm_blocks
 
-def dpcm_decode(dpcm_blocks: np.ndarray, block_size: int = 8) -> np.ndarray:
+def dpcm_decode(
+    dpcm_blocks: np.ndarray,
+    block_size: int = 8,
+    restart_interval: int = 0,
+    *,
+    first_block: int = 0,
+    previous_dc: int = 0,
+) -> np.ndarray:
     """
     Realiza a decodificação DPCM (Differential Pulse-Code Modulation) dos coeficientes DC.
     Recupera os valores DC originais a partir das diferenças.
@@ -76,60 +65,30 @@ def dpcm_decode(dpcm_blocks: np.ndarray, block_size: int = 8) -> np.ndarray:
     Args:
         dpcm_blocks (np.ndarray): Blocos com codificação DPCM aplicada
         block_size (int): Tamanho do bloco (padrão: 8)
+        restart_interval (int): Número de blocos entre reinícios (0: sem reinícios)
+        first_block (int): Índice do primeiro bloco, se os blocos forem parte de um canal
+        previous_dc (int): Valor DC do bloco anterior a first_block
 
     Returns:
         np.ndarray: Blocos com os valores DC originais recuperados
     """
-    # Get the number of blocks
-    num_blocks = dpcm_blocks.shape[0]
-
-    # Ensure output array has the same shape as the input
-    decoded_blocks = np.zeros_like(dpcm_blocks)
-
-    # Initialize the previous DC value
-    previous_dc = 0
-
-    for i in range(num_blocks):
-        # Retrieve the DPCM value (the difference)
-        dpcm_dc = dpcm_blocks[i, 0]
-
-        # Calculate the original DC value
-        current_dc = previous_dc + dpcm_dc
+    decoded_blocks = np.array(dpcm_blocks, copy=True)
 
-        # Store the reconstructed DC value
-        decoded_blocks[i, 0] = current_dc
+    # A soma acumulada das diferenças recupera os valores DC
+    differences = to_blocks(dpcm_blocks, block_size)[..., 0, 0].ravel()
+    dc = np.cumsum(differences) + previous_dc
 
-        # Update the previous DC for the next iteration
-        previous_dc = current_dc
+    # Depois de cada reinício a soma recomeça
+    restarts = _restarts(differences.size, restart_interval, first_block)
+    restart_blocks = np.flatnonzero(restarts)
+    if restart_blocks.size:
+        before_restart = np.where(restart_blocks > 0, dc[restart_blocks - 1], previous_dc)
+        segment = np.cumsum(restarts) - 1
+        dc -= np.where(segment >= 0, before_restart[segment], 0)
 
-    # Copy the rest of the coefficients (AC coefficients) unchanged
-    decoded_blocks[:, 1:] = dpcm_blocks[:, 1:]
+    to_blocks(decoded_blocks, block_size)[..., 0, 0] = dc.reshape(to_blocks(decoded_blocks, block_size).shape[:-2])
 
     return decoded_blocks
-    # Cria uma cópia dos blocos para não modificar o original
-    idpcm_blocks = dpcm_blocks.copy()
-
-    # Obtém as dimensões da imagem em blocos
-    h, w = idpcm_blocks.shape[:2]
-
-    # Valor DC acumulado (inicialmente 0)
-    accumulated_dc = 0
-
-    # Percorre todos os blocos
-    for i, j in itertools.product(range(h), range(w)):
-        # Obtém a diferença atual
-        diff = idpcm_blocks[i, j, 0, 0]
-
-        # Calcula o valor DC original
-        original_dc = accumulated_dc + diff
-
-        # Substitui a diferença pelo valor DC original
-        idpcm_blocks[i, j, 0, 0] = original_dc
-
-        # Atualiza o valor DC acumulado
-        accumulated_dc = original_dc
-
-    return idpcm_blocks
 
 def apply_dpcm_to_channels(
     Y_blocks: np.ndarray,
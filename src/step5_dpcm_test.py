@@ -1 +1,31 @@
-# TODO: dpcm unit tests
+from step5_dpcm import dpcm_decode, dpcm_encode
+import numpy as np
+
+def test_dpcm():
+    quantized = np.zeros((16, 24), dtype=np.int32)
+    quantized[::8, ::8] = [[10, 12, 9], [9, 20, 20]]
+    quantized[1, 1] = 5
+
+    expected = quantized.copy()
+    expected[::8, ::8] = [[10, 2, -3], [0, 11, 0]]
+
+    actual = dpcm_encode(quantized)
+
+    assert np.array_equal(actual, expected), f'\n{actual}\n!=\n{expected}'
+    assert np.array_equal(dpcm_decode(actual), quantized)
+
+def test_dpcm_restart_interval():
+    rng = np.random.default_rng(0)
+    quantized = np.zeros((24, 40), dtype=np.int32)
+    quantized[::8, ::8] = rng.integers(-50, 50, size=(3, 5))
+
+    # Os DC dos blocos 0, 4, 8, 12 (ordem raster) são codificados sem previsão
+    encoded = dpcm_encode(quantized, restart_interval=4)
+    dc = quantized[::8, ::8].ravel()
+    assert np.array_equal(encoded[::8, ::8].ravel()[::4], dc[::4])
+    assert np.array_equal(dpcm_decode(encoded, restart_interval=4), quantized)
+
+    # Uma faixa a meio continua a contagem dos blocos e o DC anterior
+    rows = dpcm_encode(quantized[8:16], restart_interval=4, first_block=5, previous_dc=dc[4])
+    assert np.array_equal(rows, encoded[8:16])
+    assert np.array_equal(dpcm_decode(rows, restart_interval=4, first_block=5, previous_dc=dc[4]), quantized[8:16])
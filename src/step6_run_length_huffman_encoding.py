@@ -1,5 +1,981 @@
+from common import IMAGES, TEST_PARAMETERS, from_blocks, to_blocks
+from functools import lru_cache
+from matplotlib import pyplot as plt
+from typing import Callable, Iterable, Iterator, NamedTuple
+import argparse
+import encoder
+import numpy as np
+import os
+
+# Símbolos especiais dos coeficientes AC: fim de bloco e 16 zeros seguidos
+EOB = 0x00
+ZRL = 0xF0
+
+class HuffmanTable(NamedTuple):
+    """
+    Tabela de Huffman canónica no formato do JPEG (BITS e HUFFVAL).
+
+    bits[i] é o número de códigos com comprimento i + 1 e values são os símbolos
+    ordenados pelo comprimento do seu código.
+    """
+    bits: np.ndarray
+    values: np.ndarray
+
+class Symbols(NamedTuple):
+    """
+    Sequência de símbolos de um canal, pela ordem em que são escritos.
+
+    Cada símbolo de Huffman é seguido de amplitude_sizes bits de amplitude
+    (0 para EOB e ZRL).
+    """
+    symbols: np.ndarray
+    amplitudes: np.ndarray
+    amplitude_sizes: np.ndarray
+    is_dc: np.ndarray
+
+class EntropyCodedChannel(NamedTuple):
+    shape: tuple[int, int]
+    block_size: int
+    dc_table: HuffmanTable
+    ac_table: HuffmanTable
+    data: bytes
+    # Com restart_interval, cada grupo de restart_interval blocos começa num byte,
+    # com a previsão DC a 0, em segment_offsets[i] (bytes desde o início de data)
+    restart_interval: int = 0
+    segment_offsets: np.ndarray | None = None
+
+@lru_cache(maxsize=None)
+def zigzag_order(block_size: int = 8) -> np.ndarray:
+    """
+    Índices (no bloco achatado) dos coeficientes pela ordem zigzag.
+
+    Args:
+        block_size (int): Tamanho do bloco (padrão: 8)
+
+    Returns:
+        np.ndarray: Permutação de range(block_size ** 2)
+    """
+    i, j = np.divmod(np.arange(block_size * block_size), block_size)
+    diagonal = i + j
+
+    # Nas diagonais pares sobe-se (i decrescente), nas ímpares desce-se
+    order = np.lexsort((np.where(diagonal % 2 == 0, -i, i), diagonal))
+    order.setflags(write=False)
+
+    return order
+
+def value_categories(values: np.ndarray) -> np.ndarray:
+    """
+    Categoria (número de bits da amplitude) de cada valor, como no JPEG.
+
+    Args:
+        values (np.ndarray): Valores inteiros
+
+    Returns:
+        np.ndarray: Número de bits de |value| (0 para 0)
+    """
+    _, exponent = np.frexp(np.abs(values).astype(np.float64))
+    return exponent.astype(np.uint8)
+
+def amplitude_bits(values: np.ndarray, sizes: np.ndarray) -> np.ndarray:
+    """
+    Bits de amplitude de cada valor: valores negativos são guardados em complemento para um.
+
+    Args:
+        values (np.ndarray): Valores inteiros
+        sizes (np.ndarray): Categoria de cada valor
+
+    Returns:
+        np.ndarray: Bits a escrever (sizes bits menos significativos)
+    """
+    values = values.astype(np.int64)
+    return np.where(values < 0, values + (np.int64(1) << sizes) - 1, values).astype(np.uint32)
+
+def extract_symbols(
+    dpcm_image: np.ndarray,
+    block_size: int = 8,
+    spectral_range: tuple[int, int] | None = None,
+) -> Symbols:
+    """
+    Converte os blocos de um canal em símbolos de run-length, sem ciclos por bloco.
+
+    Para cada bloco (por ordem raster) é gerado o símbolo DC (categoria da diferença
+    DPCM) e, para cada coeficiente AC não nulo em ordem zigzag, os ZRL necessários e o
+    símbolo (run << 4) | categoria. O bloco termina em EOB se o último coeficiente for 0.
+
+    Args:
+        dpcm_image (np.ndarray): Canal quantizado com DPCM aplicado
+        block_size (int): Tamanho do bloco (padrão: 8)
+        spectral_range (tuple[int, int] | None): Primeiro e último índice zigzag a
+            codificar. Por omissão todos os coeficientes.
+
+    Returns:
+        Symbols: Símbolos pela ordem de escrita
+    """
+    n_coefficients = block_size * block_size
+    start, end = (0, n_coefficients - 1) if spectral_range is None else spectral_range
+
+    coefficients = to_blocks(dpcm_image, block_size).reshape(-1, n_coefficients)[:, zigzag_order(block_size)]
+    n_blocks = coefficients.shape[0]
+
+    symbols, amplitudes, keys, is_dc = [], [], [], []
+
+    # Chave de ordenação: bloco e posição (2 * k, os ZRL ficam em 2 * k - 1)
+    key_stride = 2 * n_coefficients + 1
+    block_keys = np.arange(n_blocks, dtype=np.int64) * key_stride
+
+    if start == 0:
+        dc = coefficients[:, 0]
+        symbols.append(value_categories(dc))
+        amplitudes.append(dc)
+        keys.append(block_keys)
+        is_dc.append(np.ones(n_blocks, dtype=bool))
+        start = 1
+
+    if start <= end:
+        ac = coefficients[:, start:end + 1]
+        block, position = np.nonzero(ac)
+        values = ac[block, position]
+        position = position + start
+
+        # Posição do coeficiente não nulo anterior dentro do mesmo bloco
+        first_in_block = np.ones(block.size, dtype=bool)
+        first_in_block[1:] = block[1:] != block[:-1]
+        previous = np.empty_like(position)
+        previous[1:] = position[:-1]
+        previous[first_in_block] = start - 1
+
+        run = position - previous - 1
+        n_zrl = run // 16
+
+        zrl_block = np.repeat(block, n_zrl)
+        symbols.append(np.full(zrl_block.size, ZRL, dtype=np.uint8))
+        amplitudes.append(np.zeros(zrl_block.size, dtype=values.dtype))
+        keys.append(block_keys[zrl_block] + 2 * np.repeat(position, n_zrl) - 1)
+
+        symbols.append(((run % 16) << 4 | value_categories(values)).astype(np.uint8))
+        amplitudes.append(values)
+        keys.append(block_keys[block] + 2 * position)
+
+        # EOB quando o último coeficiente da banda é nulo
+        last_position = np.full(n_blocks, start - 1)
+        last_in_block = np.ones(block.size, dtype=bool)
+        last_in_block[:-1] = block[:-1] != block[1:]
+        last_position[block[last_in_block]] = position[last_in_block]
+
+        eob_block = np.flatnonzero(last_position < end)
+        symbols.append(np.full(eob_block.size, EOB, dtype=np.uint8))
+        amplitudes.append(np.zeros(eob_block.size, dtype=values.dtype))
+        keys.append(block_keys[eob_block] + key_stride - 1)
+
+        is_dc.append(np.zeros(sum(s.size for s in symbols[-3:]), dtype=bool))
+
+    order = np.argsort(np.concatenate(keys), kind='stable')
+
+    symbols = np.concatenate(symbols)[order]
+    amplitudes = np.concatenate(amplitudes)[order]
+    is_dc = np.concatenate(is_dc)[order]
+
+    return Symbols(symbols, amplitudes, np.where(is_dc, symbols, symbols & 0x0F).astype(np.uint8), is_dc)
+
+def build_huffman_table(frequencies: np.ndarray) -> HuffmanTable:
+    """
+    Constrói uma tabela de Huffman ótima com códigos de até 16 bits (JPEG, anexo K.2).
+
+    Args:
+        frequencies (np.ndarray): Número de ocorrências de cada um dos 256 símbolos
+
+    Returns:
+        HuffmanTable: Tabela canónica
+    """
+    if not np.any(frequencies):
+        return HuffmanTable(np.zeros(16, dtype=np.uint8), np.zeros(0, dtype=np.uint8))
+
+    # O símbolo 256 reserva o código só com uns, que o JPEG não permite
+    frequency = [int(f) for f in frequencies] + [1]
+    code_size = [0] * 257
+    others = [-1] * 257
+
+    while True:
+        used = [(f, -symbol) for symbol, f in enumerate(frequency) if f > 0]
+        if len(used) < 2:
+            break
+
+        used.sort()
+        v1, v2 = -used[0][1], -used[1][1]
+
+        frequency[v1] += frequency[v2]
+        frequency[v2] = 0
+
+        for v in (v1, v2):
+            code_size[v] += 1
+            while others[v] != -1:
+                v = others[v]
+                code_size[v] += 1
+
+        v = v1
+        while others[v] != -1:
+            v = others[v]
+        others[v] = v2
+
+    bits = np.bincount(code_size, minlength=33)[:33]
+    bits[0] = 0
+
+    # Limita o comprimento dos códigos a 16 bits (anexo K.3)
+    for i in range(32, 16, -1):
+        while bits[i] > 0:
+            j = i - 2
+            while bits[j] == 0:
+                j -= 1
+            bits[i] -= 2
+            bits[i - 1] += 1
+            bits[j + 1] += 2
+            bits[j] -= 1
+
+    # Remove o código reservado (o mais longo)
+    i = 16
+    while bits[i] == 0:
+        i -= 1
+    bits[i] -= 1
+
+    values = sorted((size, symbol) for symbol, size in enumerate(code_size[:256]) if size > 0)
+
+    return HuffmanTable(bits[1:17].astype(np.uint8), np.array([symbol for _, symbol in values], dtype=np.uint8))
+
+def huffman_codes(table: HuffmanTable) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Códigos canónicos de uma tabela de Huffman (JPEG, anexo C).
+
+    Args:
+        table (HuffmanTable): Tabela de Huffman
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Código e comprimento de cada um dos 256 símbolos
+    """
+    codes = np.zeros(256, dtype=np.uint32)
+    lengths = np.zeros(256, dtype=np.uint8)
+
+    code, k = 0, 0
+    for length, count in enumerate(table.bits, start=1):
+        for symbol in table.values[k:k + count]:
+            codes[symbol] = code
+            lengths[symbol] = length
+            code += 1
+        k += count
+        code <<= 1
+
+    return codes, lengths
+
+def huffman_lookup(table: HuffmanTable) -> tuple[list[int], list[int]]:
+    """
+    Tabela de descodificação indexada pelos próximos 16 bits do fluxo.
+
+    Args:
+        table (HuffmanTable): Tabela de Huffman
+
+    Returns:
+        tuple[list[int], list[int]]: Símbolo e comprimento do código para cada prefixo de 16 bits
+    """
+    symbols = np.zeros(1 << 16, dtype=np.int64)
+    lengths = np.zeros(1 << 16, dtype=np.int64)
+
+    codes, code_lengths = huffman_codes(table)
+    for symbol in table.values:
+        length = int(code_lengths[symbol])
+        first = int(codes[symbol]) << (16 - length)
+        symbols[first:first + (1 << (16 - length))] = symbol
+        lengths[first:first + (1 << (16 - length))] = length
+
+    return symbols.tolist(), lengths.tolist()
+
+def pack_bits(values: np.ndarray, lengths: np.ndarray, chunk_size: int = 1 << 14) -> bytes:
+    """
+    Concatena os lengths[i] bits menos significativos de cada values[i] num fluxo de bytes.
+
+    O último byte é completado com uns, como no JPEG.
+
+    Args:
+        values (np.ndarray): Valores a escrever
+        lengths (np.ndarray): Número de bits de cada valor
+        chunk_size (int): Número de valores processados de cada vez
+
+    Returns:
+        bytes: Fluxo de bits
+    """
+    chunks = []
+    carry = np.zeros(0, dtype=np.uint8)
+
+    for start in range(0, len(values), chunk_size):
+        chunk_values = values[start:start + chunk_size].astype(np.int64)
+        chunk_lengths = lengths[start:start + chunk_size].astype(np.int64)
+
+        ends = np.cumsum(chunk_lengths)
+        total = int(ends[-1]) if ends.size else 0
+
+        # Índice (a partir do bit menos significativo) de cada bit a escrever
+        shift = np.repeat(ends, chunk_lengths) - 1 - np.arange(total)
+        bits = (np.repeat(chunk_values, chunk_lengths) >> shift) & 1
+
+        bits = np.concatenate([carry, bits.astype(np.uint8)])
+        n_full = bits.size - bits.size % 8
+        chunks.append(np.packbits(bits[:n_full]).tobytes())
+        carry = bits[n_full:]
+
+    if carry.size:
+        chunks.append(np.packbits(np.concatenate([carry, np.ones(8 - carry.size, dtype=np.uint8)])).tobytes())
+
+    return b''.join(chunks)
+
+def encode_symbols(symbols: Symbols, dc_table: HuffmanTable, ac_table: HuffmanTable) -> bytes:
+    """
+    Escreve uma sequência de símbolos com as tabelas de Huffman dadas.
+
+    Args:
+        symbols (Symbols): Símbolos a escrever
+        dc_table (HuffmanTable): Tabela dos símbolos DC
+        ac_table (HuffmanTable): Tabela dos símbolos AC
+
+    Returns:
+        bytes: Fluxo de bits
+    """
+    return pack_bits(*_symbol_bits(symbols, dc_table, ac_table))
+
+def encode_segments(
+    symbols: Symbols,
+    dc_table: HuffmanTable,
+    ac_table: HuffmanTable,
+    restart_interval: int,
+) -> tuple[bytes, np.ndarray]:
+    """
+    Escreve uma sequência de símbolos em segmentos de restart_interval blocos,
+    cada um completado com uns até ao byte seguinte.
+
+    Os símbolos têm de incluir o DC de cada bloco (que marca o início do bloco).
+
+    Args:
+        symbols (Symbols): Símbolos a escrever
+        dc_table (HuffmanTable): Tabela dos símbolos DC
+        ac_table (HuffmanTable): Tabela dos símbolos AC
+        restart_interval (int): Número de blocos de cada segmento
+
+    Returns:
+        tuple[bytes, np.ndarray]: Fluxo de bits e posição (em bytes) de cada segmento
+    """
+    values, lengths = _symbol_bits(symbols, dc_table, ac_table)
+
+    # Índice (em values) do primeiro valor de cada segmento
+    segment_starts = 2 * np.flatnonzero(symbols.is_dc)[::restart_interval]
+
+    ends = np.cumsum(lengths, dtype=np.int64)
+    start_bits = np.concatenate([[0], ends[segment_starts[1:] - 1]])
+    segment_bits = np.diff(np.append(start_bits, ends[-1] if ends.size else 0))
+    padding = -segment_bits % 8
+
+    values = np.insert(values, segment_starts[1:], (1 << padding[:-1]) - 1)
+    lengths = np.insert(lengths, segment_starts[1:], padding[:-1])
+
+    offsets = np.concatenate([[0], np.cumsum(segment_bits + padding)[:-1] // 8]).astype(np.uint64)
+
+    return pack_bits(values, lengths), offsets
+
+def _symbol_bits(symbols: Symbols, dc_table: HuffmanTable, ac_table: HuffmanTable) -> tuple[np.ndarray, np.ndarray]:
+    # Código de Huffman de cada símbolo seguido dos bits de amplitude
+    dc_codes, dc_lengths = huffman_codes(dc_table)
+    ac_codes, ac_lengths = huffman_codes(ac_table)
+
+    n = symbols.symbols.size
+    values = np.empty(2 * n, dtype=np.uint32)
+    lengths = np.empty(2 * n, dtype=np.uint8)
+
+    values[0::2] = np.where(symbols.is_dc, dc_codes[symbols.symbols], ac_codes[symbols.symbols])
+    lengths[0::2] = np.where(symbols.is_dc, dc_lengths[symbols.symbols], ac_lengths[symbols.symbols])
+    values[1::2] = amplitude_bits(symbols.amplitudes, symbols.amplitude_sizes)
+    lengths[1::2] = symbols.amplitude_sizes
+
+    assert np.all(lengths[0::2] > 0), 'Symbol missing from the Huffman table'
+
+    return values, lengths
+
+def symbol_frequencies(symbols: Symbols) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Frequência dos símbolos DC e AC, para construir as tabelas de Huffman.
+
+    Args:
+        symbols (Symbols): Símbolos de um ou mais canais
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Frequências DC e AC
+    """
+    dc_frequencies = np.bincount(symbols.symbols[symbols.is_dc], minlength=256)
+    ac_frequencies = np.bincount(symbols.symbols[~symbols.is_dc], minlength=256)
+
+    return dc_frequencies, ac_frequencies
+
+def rle_and_huffman_encode(
+    dpcm_image: np.ndarray,
+    block_size: int = 8,
+    *,
+    dc_table: HuffmanTable | None = None,
+    ac_table: HuffmanTable | None = None,
+    restart_interval: int = 0,
+) -> EntropyCodedChannel:
+    """
+    Codifica um canal com run-length e Huffman.
+
+    Se as tabelas não forem dadas, são construídas a partir das frequências do canal.
+
+    Args:
+        dpcm_image (np.ndarray): Canal quantizado com DPCM aplicado
+        block_size (int): Tamanho do bloco (padrão: 8)
+        dc_table (HuffmanTable | None): Tabela de Huffman dos símbolos DC
+        ac_table (HuffmanTable | None): Tabela de Huffman dos símbolos AC
+        restart_interval (int): Número de blocos de cada segmento (0: um só segmento).
+            O DPCM do canal tem de ter sido feito com o mesmo restart_interval.
+
+    Returns:
+        EntropyCodedChannel: Canal codificado
+    """
+    return encode_channel_symbols(extract_symbols(dpcm_image, block_size), dpcm_image.shape, block_size, dc_table=dc_table, ac_table=ac_table, restart_interval=restart_interval)
+
+def concatenate_symbols(symbols: Iterable[Symbols]) -> Symbols:
+    """
+    Junta as sequências de símbolos de várias faixas de blocos de um canal, por ordem.
+
+    Args:
+        symbols (Iterable[Symbols]): Símbolos de cada faixa
+
+    Returns:
+        Symbols: Símbolos do canal
+    """
+    return Symbols(*(np.concatenate(field) for field in zip(*symbols)))
+
+def encode_channel_symbols(
+    symbols: Symbols,
+    shape: tuple[int, int],
+    block_size: int = 8,
+    *,
+    dc_table: HuffmanTable | None = None,
+    ac_table: HuffmanTable | None = None,
+    restart_interval: int = 0,
+) -> EntropyCodedChannel:
+    """
+    Codifica com Huffman os símbolos de um canal.
+
+    Se as tabelas não forem dadas, são construídas a partir das frequências dos símbolos.
+
+    Args:
+        symbols (Symbols): Símbolos do canal
+        shape (tuple[int, int]): Dimensões do canal
+        block_size (int): Tamanho do bloco (padrão: 8)
+        dc_table (HuffmanTable | None): Tabela de Huffman dos símbolos DC
+        ac_table (HuffmanTable | None): Tabela de Huffman dos símbolos AC
+        restart_interval (int): Número de blocos de cada segmento (0: um só segmento)
+
+    Returns:
+        EntropyCodedChannel: Canal codificado
+    """
+    dc_frequencies, ac_frequencies = symbol_frequencies(symbols)
+
+    if dc_table is None:
+        dc_table = build_huffman_table(dc_frequencies)
+    if ac_table is None:
+        ac_table = build_huffman_table(ac_frequencies)
+
+    if restart_interval:
+        data, segment_offsets = encode_segments(symbols, dc_table, ac_table, restart_interval)
+        return EntropyCodedChannel(tuple(shape), block_size, dc_table, ac_table, data, restart_interval, segment_offsets)
+
+    data = encode_symbols(symbols, dc_table, ac_table)
+
+    return EntropyCodedChannel(tuple(shape), block_size, dc_table, ac_table, data)
+
+# Número de palavras de 32 bits convertidas de cada vez para o buffer, para a
+# memória usada não depender do tamanho do fluxo
+CHUNK_WORDS = 4096
+
+class BitReader:
+    """
+    Leitor de um fluxo de bits, do bit mais significativo para o menos significativo.
+
+    Os bits são lidos 32 de cada vez para um buffer, de onde os símbolos são extraídos.
+    As palavras são convertidas em blocos de CHUNK_WORDS à medida que são lidas,
+    por isso de um ficheiro mapeado só são tocadas as páginas descodificadas.
+    """
+    def __init__(self, data: bytes) -> None:
+        self.data = memoryview(data).cast('B')
+        # Índice no fluxo da primeira palavra de words
+        self.first_word = 0
+        self.words: list[int] = []
+        # Índice em words da próxima palavra
+        self.next_word = 0
+        self.buffer = 0
+        self.bits = 0
+
+        self.load(0)
+
+    def load(self, first_word: int) -> list[int]:
+        """
+        Converte as CHUNK_WORDS palavras a partir de first_word. Além do fim do
+        fluxo as palavras são 0xFFFFFFFF, para poder espreitar além dele.
+        """
+        chunk = bytes(self.data[4 * first_word:4 * (first_word + CHUNK_WORDS)])
+        chunk += b'\xff' * (4 * CHUNK_WORDS - len(chunk))
+
+        self.first_word = first_word
+        self.words = np.frombuffer(chunk, dtype='>u4').tolist()
+
+        return self.words
+
+    @property
+    def position(self) -> int:
+        """Número de bits já consumidos."""
+        return 32 * (self.first_word + self.next_word) - self.bits
+
+    def byte_align(self) -> None:
+        """Descarta os bits até ao próximo byte."""
+        self.bits -= self.bits % 8
+
+    def seek(self, position: int) -> None:
+        """Passa a ler a partir do bit position."""
+        word, offset = divmod(position, 32)
+        if not self.first_word <= word < self.first_word + CHUNK_WORDS:
+            self.load(word)
+
+        self.next_word = word - self.first_word
+        self.buffer = 0
+        self.bits = 0
+
+        if offset:
+            self.buffer = self.words[self.next_word]
+            self.next_word += 1
+            self.bits = 32 - offset
+
+def decode_blocks(
+    reader: BitReader,
+    dc_lookup: tuple[list[int], list[int]] | None,
+    ac_lookup: tuple[list[int], list[int]] | None,
+    coefficients: np.ndarray,
+    spectral_range: tuple[int, int] | None = None,
+) -> None:
+    """
+    Lê os coeficientes de blocos consecutivos (em ordem zigzag) para coefficients.
+
+    Args:
+        reader (BitReader): Fluxo de bits
+        dc_lookup: Tabela de descodificação DC (ver huffman_lookup)
+        ac_lookup: Tabela de descodificação AC (ver huffman_lookup)
+        coefficients (np.ndarray): Array contíguo (n_blocks, block_size ** 2) onde
+            escrever os coeficientes. Os coeficientes não lidos não são alterados.
+        spectral_range (tuple[int, int] | None): Primeiro e último índice zigzag codificados
+    """
+    n_blocks, n_coefficients = coefficients.shape
+    start, end = (0, n_coefficients - 1) if spectral_range is None else spectral_range
+
+    dc_symbols, dc_lengths = dc_lookup if dc_lookup is not None else ([], [])
+    ac_symbols, ac_lengths = ac_lookup if ac_lookup is not None else ([], [])
+
+    # Variáveis locais: este ciclo é executado uma vez por símbolo
+    words, next_word, buffer, bits = reader.words, reader.next_word, reader.buffer, reader.bits
+    indices, values = [], []
+
+    for base in range(0, n_blocks * n_coefficients, n_coefficients):
+        k = start
+
+        if k == 0:
+            if bits < 32:
+                if next_word == CHUNK_WORDS:
+                    words, next_word = reader.load(reader.first_word + CHUNK_WORDS), 0
+                buffer = ((buffer & ((1 << bits) - 1)) << 32) | words[next_word]
+                next_word += 1
+                bits += 32
+
+            peek = (buffer >> (bits - 16)) & 0xFFFF
+            bits -= dc_lengths[peek]
+            size = dc_symbols[peek]
+
+            if size:
+                value = (buffer >> (bits - size)) & ((1 << size) - 1)
+                bits -= size
+                # Valores negativos estão em complemento para um
+                if value < 1 << (size - 1):
+                    value -= (1 << size) - 1
+                indices.append(base)
+                values.append(value)
+
+            k = 1
+
+        while k <= end:
+            if bits < 32:
+                if next_word == CHUNK_WORDS:
+                    words, next_word = reader.load(reader.first_word + CHUNK_WORDS), 0
+                buffer = ((buffer & ((1 << bits) - 1)) << 32) | words[next_word]
+                next_word += 1
+                bits += 32
+
+            peek = (buffer >> (bits - 16)) & 0xFFFF
+            bits -= ac_lengths[peek]
+            symbol = ac_symbols[peek]
+            size = symbol & 0x0F
+
+            if size == 0:
+                if symbol != ZRL:
+                    break
+                k += 16
+                continue
+
+            k += symbol >> 4
+            value = (buffer >> (bits - size)) & ((1 << size) - 1)
+            bits -= size
+            if value < 1 << (size - 1):
+                value -= (1 << size) - 1
+            indices.append(base + k)
+            values.append(value)
+            k += 1
+
+    reader.next_word, reader.buffer, reader.bits = next_word, buffer & ((1 << bits) - 1), bits
+
+    if indices:
+        np.put(coefficients, indices, values)
+
+def ac_skip_lookup(ac_lookup: tuple[list[int], list[int]], block_size: int = 8) -> tuple[list[int], list[int]]:
+    """
+    Tabela para saltar os AC sem os descodificar, indexada pelos próximos 16 bits.
+
+    Args:
+        ac_lookup (tuple[list[int], list[int]]): Tabela de huffman_lookup dos AC
+        block_size (int): Tamanho dos blocos
+
+    Returns:
+        tuple[list[int], list[int]]: Bits do código mais a amplitude e quantos
+            coeficientes avança, para cada prefixo de 16 bits (o EOB avança até ao
+            fim do bloco)
+    """
+    symbols, lengths = np.array(ac_lookup[0]), np.array(ac_lookup[1])
+    sizes = symbols & 0x0F
+
+    skip = lengths + sizes
+    advance = np.where(sizes, (symbols >> 4) + 1, np.where(symbols == ZRL, 16, block_size * block_size))
+
+    return skip.tolist(), advance.tolist()
+
+def skip_blocks(
+    reader: BitReader,
+    dc_lookup: tuple[list[int], list[int]],
+    ac_skip: tuple[list[int], list[int]],
+    dc: np.ndarray,
+) -> None:
+    """
+    Como decode_blocks, mas só descodifica os DC: os símbolos AC e as suas
+    amplitudes são saltados com a tabela de ac_skip_lookup.
+
+    Args:
+        reader (BitReader): Leitor posicionado no primeiro bloco
+        dc_lookup (tuple[list[int], list[int]]): Tabela de huffman_lookup dos DC
+        ac_skip (tuple[list[int], list[int]]): Tabela de ac_skip_lookup
+        dc (np.ndarray): Diferenças DC (DPCM) dos blocos, preenchidas aqui
+    """
+    dc_symbols, dc_lengths = dc_lookup
+    skip_bits, advance = ac_skip
+    # Nenhum código é só uns (ver huffman_codes), por isso esse prefixo avança até ao fim do bloco
+    n_coefficients = advance[0xFFFF]
+
+    words, next_word, buffer, bits = reader.words, reader.next_word, reader.buffer, reader.bits
+    values = []
+
+    for _ in range(len(dc)):
+        if bits < 32:
+            if next_word == CHUNK_WORDS:
+                words, next_word = reader.load(reader.first_word + CHUNK_WORDS), 0
+            buffer = ((buffer & ((1 << bits) - 1)) << 32) | words[next_word]
+            next_word += 1
+            bits += 32
+
+        peek = (buffer >> (bits - 16)) & 0xFFFF
+        bits -= dc_lengths[peek]
+        size = dc_symbols[peek]
+
+        value = 0
+        if size:
+            value = (buffer >> (bits - size)) & ((1 << size) - 1)
+            bits -= size
+            if value < 1 << (size - 1):
+                value -= (1 << size) - 1
+        values.append(value)
+
+        k = 1
+        while k < n_coefficients:
+            if bits < 32:
+                if next_word == CHUNK_WORDS:
+                    words, next_word = reader.load(reader.first_word + CHUNK_WORDS), 0
+                buffer = ((buffer & ((1 << bits) - 1)) << 32) | words[next_word]
+                next_word += 1
+                bits += 32
+
+            peek = (buffer >> (bits - 16)) & 0xFFFF
+            bits -= skip_bits[peek]
+            k += advance[peek]
+
+    reader.next_word, reader.buffer, reader.bits = next_word, buffer & ((1 << bits) - 1), bits
+
+    dc[:] = values
+
+def rle_and_huffman_decode(encoded: EntropyCodedChannel) -> np.ndarray:
+    """
+    Descodifica um canal codificado com rle_and_huffman_encode.
+
+    Args:
+        encoded (EntropyCodedChannel): Canal codificado
+
+    Returns:
+        np.ndarray: Canal quantizado com DPCM aplicado
+    """
+    h, w = encoded.shape
+    block_size = encoded.block_size
+    n_blocks = (h // block_size) * (w // block_size)
+
+    dc_lookup = huffman_lookup(encoded.dc_table)
+    ac_lookup = huffman_lookup(encoded.ac_table)
+
+    coefficients = np.zeros((n_blocks, block_size * block_size), dtype=np.int32)
+    _decode_segmented_blocks(BitReader(encoded.data), dc_lookup, ac_lookup, coefficients, 0, encoded.restart_interval)
+
+    return _from_zigzag_blocks(coefficients, w // block_size, block_size)
+
+def segment_range(encoded: EntropyCodedChannel, first_segment: int, n_segments: int) -> tuple[int, int, int, int]:
+    """
+    Devolve onde estão os segmentos [first_segment, first_segment + n_segments)
+    de um canal codificado com restart_interval.
+
+    Args:
+        encoded (EntropyCodedChannel): Canal codificado
+        first_segment (int): Primeiro segmento
+        n_segments (int): Número de segmentos
+
+    Returns:
+        tuple[int, int, int, int]: Primeiro e último byte (exclusivo) em data,
+            primeiro bloco e número de blocos dos segmentos
+    """
+    assert encoded.restart_interval, 'The channel has no restart intervals'
+
+    h, w = encoded.shape
+    block_size = encoded.block_size
+    n_blocks = (h // block_size) * (w // block_size)
+    offsets = encoded.segment_offsets
+
+    first_block = first_segment * encoded.restart_interval
+    last_block = min((first_segment + n_segments) * encoded.restart_interval, n_blocks)
+    end = int(offsets[first_segment + n_segments]) if first_segment + n_segments < len(offsets) else len(encoded.data)
+
+    return int(offsets[first_segment]), end, first_block, last_block - first_block
+
+def decode_segment_data(
+    data: bytes,
+    dc_table: HuffmanTable,
+    ac_table: HuffmanTable,
+    block_size: int,
+    restart_interval: int,
+    first_block: int,
+    n_blocks: int,
+) -> np.ndarray:
+    """
+    Descodifica os bytes de segmentos consecutivos (ver segment_range). Só recebe
+    os bytes dos segmentos, para poder correr num processo sem copiar o canal.
+
+    Args:
+        data (bytes): Bytes dos segmentos
+        dc_table (HuffmanTable): Tabela de Huffman dos DC
+        ac_table (HuffmanTable): Tabela de Huffman dos AC
+        block_size (int): Tamanho dos blocos
+        restart_interval (int): Número de blocos de cada segmento
+        first_block (int): Índice do primeiro bloco
+        n_blocks (int): Número de blocos
+
+    Returns:
+        np.ndarray: Coeficientes (n_blocks, block_size, block_size) dos blocos, com
+            DPCM aplicado (que recomeça em cada segmento)
+    """
+    coefficients = np.zeros((n_blocks, block_size * block_size), dtype=np.int32)
+    _decode_segmented_blocks(BitReader(data), huffman_lookup(dc_table), huffman_lookup(ac_table), coefficients, first_block, restart_interval)
+
+    blocks = np.empty_like(coefficients)
+    blocks[:, zigzag_order(block_size)] = coefficients
+
+    return blocks.reshape(-1, block_size, block_size)
+
+def decode_segments(encoded: EntropyCodedChannel, first_segment: int, n_segments: int) -> np.ndarray:
+    """
+    Descodifica só os segmentos [first_segment, first_segment + n_segments) de um
+    canal codificado com restart_interval, a partir de segment_offsets.
+
+    Args:
+        encoded (EntropyCodedChannel): Canal codificado
+        first_segment (int): Primeiro segmento
+        n_segments (int): Número de segmentos
+
+    Returns:
+        np.ndarray: Coeficientes (n_blocos, block_size, block_size) dos blocos dos
+            segmentos, com DPCM aplicado (que recomeça em cada segmento)
+    """
+    start, end, first_block, n_blocks = segment_range(encoded, first_segment, n_segments)
+
+    return decode_segment_data(
+        memoryview(encoded.data)[start:end],
+        encoded.dc_table,
+        encoded.ac_table,
+        encoded.block_size,
+        encoded.restart_interval,
+        first_block,
+        n_blocks,
+    )
+
+def _decode_segmented_blocks(
+    reader: BitReader,
+    dc_lookup: tuple[list[int], list[int]],
+    ac_lookup: tuple[list[int], list[int]],
+    coefficients: np.ndarray,
+    first_block: int,
+    restart_interval: int,
+    decode: Callable[..., None] = decode_blocks,
+) -> None:
+    # Como decode (decode_blocks ou skip_blocks), alinhando o leitor ao byte no fim de cada segmento
+    if not restart_interval:
+        decode(reader, dc_lookup, ac_lookup, coefficients)
+        return
+
+    start = 0
+    while start < len(coefficients):
+        end = min(len(coefficients), start + restart_interval - (first_block + start) % restart_interval)
+        decode(reader, dc_lookup, ac_lookup, coefficients[start:end])
+
+        if (first_block + end) % restart_interval == 0:
+            reader.byte_align()
+        start = end
+
+def decode_block_rows(encoded: EntropyCodedChannel, block_rows: int = 1) -> Iterator[np.ndarray]:
+    """
+    Descodifica um canal codificado com rle_and_huffman_encode por faixas de
+    block_rows linhas de blocos, de cima para baixo.
+
+    Args:
+        encoded (EntropyCodedChannel): Canal codificado
+        block_rows (int): Número de linhas de blocos de cada faixa
+
+    Yields:
+        np.ndarray: Faixa do canal quantizado com DPCM aplicado
+    """
+    h, w = encoded.shape
+    block_size = encoded.block_size
+    blocks_x = w // block_size
+
+    dc_lookup = huffman_lookup(encoded.dc_table)
+    ac_lookup = huffman_lookup(encoded.ac_table)
+    reader = BitReader(encoded.data)
+
+    for row in range(0, h // block_size, block_rows):
+        rows = min(block_rows, h // block_size - row)
+        coefficients = np.zeros((rows * blocks_x, block_size * block_size), dtype=np.int32)
+        _decode_segmented_blocks(reader, dc_lookup, ac_lookup, coefficients, row * blocks_x, encoded.restart_interval)
+
+        yield _from_zigzag_blocks(coefficients, blocks_x, block_size)
+
+def index_block_rows(encoded: EntropyCodedChannel) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Percorre um canal codificado uma vez e regista onde começa cada linha de
+    blocos, para que decode_block_row_range possa descodificar só algumas.
+
+    Args:
+        encoded (EntropyCodedChannel): Canal codificado
+
+    Returns:
+        tuple[np.ndarray, np.ndarray]: Posição (em bits) do início de cada linha de
+            blocos, mais a do fim do canal, e diferenças DC (DPCM) de cada bloco
+    """
+    h, w = encoded.shape
+    block_size = encoded.block_size
+    blocks_y, blocks_x = h // block_size, w // block_size
+
+    # Só os DC são descodificados: os AC são saltados
+    dc_lookup = huffman_lookup(encoded.dc_table)
+    ac_skip = ac_skip_lookup(huffman_lookup(encoded.ac_table), block_size)
+    reader = BitReader(encoded.data)
+
+    positions = np.empty(blocks_y + 1, dtype=np.int64)
+    dc_differences = np.empty((blocks_y, blocks_x), dtype=np.int32)
+
+    for row in range(blocks_y):
+        positions[row] = reader.position
+        _decode_segmented_blocks(reader, dc_lookup, ac_skip, dc_differences[row], row * blocks_x, encoded.restart_interval, skip_blocks)
+    positions[blocks_y] = reader.position
+
+    return positions, dc_differences
+
+def decode_block_row_range(encoded: EntropyCodedChannel, first_row: int, n_rows: int, positions: np.ndarray) -> np.ndarray:
+    """
+    Descodifica só as linhas de blocos [first_row, first_row + n_rows) de um canal,
+    a partir das posições devolvidas por index_block_rows.
+
+    Args:
+        encoded (EntropyCodedChannel): Canal codificado
+        first_row (int): Primeira linha de blocos
+        n_rows (int): Número de linhas de blocos
+        positions (np.ndarray): Posição (em bits) do início de cada linha de blocos
+
+    Returns:
+        np.ndarray: Linhas do canal quantizado com DPCM aplicado
+    """
+    block_size = encoded.block_size
+    blocks_x = encoded.shape[1] // block_size
+    start, end = int(positions[first_row]), int(positions[first_row + n_rows])
+
+    # Só os bytes das linhas pedidas são lidos
+    reader = BitReader(memoryview(encoded.data)[start // 8:-(-end // 8)])
+    reader.seek(start % 8)
+
+    coefficients = np.zeros((n_rows * blocks_x, block_size * block_size), dtype=np.int32)
+    _decode_segmented_blocks(reader, huffman_lookup(encoded.dc_table), huffman_lookup(encoded.ac_table), coefficients, first_row * blocks_x, encoded.restart_interval)
+
+    return _from_zigzag_blocks(coefficients, blocks_x, block_size)
+
+def _from_zigzag_blocks(coefficients: np.ndarray, blocks_x: int, block_size: int) -> np.ndarray:
+    # Desfaz a ordem zigzag
+    blocks = np.empty_like(coefficients)
+    blocks[:, zigzag_order(block_size)] = coefficients
+
+    return from_blocks(blocks.reshape(-1, blocks_x, block_size, block_size))
+
 def main():
-    pass
+    parser = argparse.ArgumentParser(description="Run Length and Huffman Encoding")
+
+    parser.add_argument('--hide-figures', action='store_true', help='Disable matplotlib figures')
+
+    parser.parse_args()
+
+    for image_path in IMAGES:
+        print(f'{image_path=}')
+
+        image = plt.imread(image_path)
+
+        encoded_data, iv = encoder.encoder(
+            image,
+            downsampling=TEST_PARAMETERS.downsampling,
+            interpolation=TEST_PARAMETERS.interpolation,
+            quality_factor=TEST_PARAMETERS.quality_factor,
+            return_intermidiate_values=True,
+        )
+
+        compressed_size = sum(len(channel.data) for channel in (encoded_data.Y_huffman, encoded_data.Cb_huffman, encoded_data.Cr_huffman))
+        original_size = os.path.getsize(image_path)
+
+        print(f'{image_path} original size   = {original_size} bytes')
+        print(f'{image_path} compressed size = {compressed_size} bytes')
+        print(f'{image_path} compression ratio = {original_size / compressed_size:.2f}')
+
+        for name, dpcm, channel in (
+            ('Y', iv.Y_dpcm, encoded_data.Y_huffman),
+            ('Cb', iv.Cb_dpcm, encoded_data.Cb_huffman),
+            ('Cr', iv.Cr_dpcm, encoded_data.Cr_huffman),
+        ):
+            assert np.array_equal(dpcm, rle_and_huffman_decode(channel)), f'{name} channel was not recovered'
 
 if __name__ == "__main__":
     main()
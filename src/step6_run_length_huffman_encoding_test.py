@@ -0,0 +1,77 @@
+from step6_run_length_huffman_encoding import build_huffman_table, decode_block_row_range, decode_block_rows, decode_segments, huffman_codes, index_block_rows, pack_bits, rle_and_huffman_decode, rle_and_huffman_encode, zigzag_order
+import numpy as np
+
+def test_zigzag_order():
+    expected = np.array([0, 1, 8, 16, 9, 2, 3, 10, 17, 24, 32, 25, 18, 11, 4, 5])
+    actual = zigzag_order(8)
+
+    assert np.array_equal(actual[:16], expected), f'\n{actual[:16]}\n!=\n{expected}'
+    assert actual[-1] == 63
+
+def test_pack_bits():
+    data = pack_bits(np.array([0b101, 0, 0b1]), np.array([3, 2, 1]))
+
+    # 101 00 1 + 11 de enchimento
+    assert data == bytes([0b10100111]), f'{data!r}'
+
+def test_huffman_table_length_limit():
+    # Frequências de Fibonacci levam a códigos com mais de 16 bits sem limite
+    frequencies = np.zeros(256, dtype=np.int64)
+    a, b = 1, 1
+    for symbol in range(30):
+        frequencies[symbol] = a
+        a, b = b, a + b
+
+    table = build_huffman_table(frequencies)
+    codes, lengths = huffman_codes(table)
+
+    assert table.bits.sum() == 30
+    assert lengths.max() <= 16
+    # Nenhum código pode ser só uns
+    assert all(codes[s] != (1 << lengths[s]) - 1 for s in table.values)
+
+def test_rle_and_huffman_roundtrip():
+    rng = np.random.default_rng(0)
+    channel = rng.integers(-300, 300, size=(32, 48)).astype(np.int32)
+    channel[rng.random(channel.shape) < 0.9] = 0
+    # Um bloco cheio (sem EOB) e um bloco vazio (só EOB)
+    channel[:8, :8] = rng.integers(1, 5, size=(8, 8))
+    channel[8:16, 8:16] = 0
+
+    encoded = rle_and_huffman_encode(channel)
+    decoded = rle_and_huffman_decode(encoded)
+
+    assert np.array_equal(channel, decoded), f'\n{channel}\n!=\n{decoded}'
+    assert len(encoded.data) < channel.nbytes
+
+def test_rle_and_huffman_restart_interval():
+    rng = np.random.default_rng(1)
+    channel = rng.integers(-300, 300, size=(32, 48)).astype(np.int32)
+    channel[rng.random(channel.shape) < 0.9] = 0
+
+    encoded = rle_and_huffman_encode(channel, restart_interval=5)
+    assert len(encoded.segment_offsets) == 5
+
+    assert np.array_equal(rle_and_huffman_decode(encoded), channel)
+    assert np.array_equal(np.concatenate(list(decode_block_rows(encoded))), channel)
+
+    # Os segmentos 1 e 2 são os blocos 5 a 14 (ordem raster)
+    blocks = channel.reshape(4, 8, 6, 8).swapaxes(1, 2).reshape(-1, 8, 8)
+    assert np.array_equal(decode_segments(encoded, 1, 2), blocks[5:15])
+    assert np.array_equal(decode_segments(encoded, 4, 1), blocks[20:])
+
+def test_decode_block_row_range():
+    rng = np.random.default_rng(2)
+    channel = rng.integers(-300, 300, size=(40, 48)).astype(np.int32)
+    channel[rng.random(channel.shape) < 0.9] = 0
+    # Um bloco cheio (sem EOB): o índice salta os AC até ao fim do bloco
+    channel[8:16, :8] = rng.integers(1, 5, size=(8, 8))
+
+    for restart_interval in (0, 4):
+        encoded = rle_and_huffman_encode(channel, restart_interval=restart_interval)
+        positions, dc_differences = index_block_rows(encoded)
+
+        assert positions[-1] <= 8 * len(encoded.data)
+        assert np.array_equal(dc_differences, channel[::8, ::8])
+        assert np.array_equal(decode_block_row_range(encoded, 1, 3, positions), channel[8:32])
+        assert np.array_equal(decode_block_row_range(encoded, 4, 1, positions), channel[32:])
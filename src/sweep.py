@@ -0,0 +1,106 @@
+from common import DEFAULT_DOWNSAMPLE, VALID_DOWNSAMPLES_TYPE, from_blocks, to_blocks
+from encoder import TransformedImage
+from typing import Iterable, Iterator, NamedTuple
+import cv2
+import decoder
+import encoder
+import numpy as np
+import step3_discrete_cosine_transform as dct
+import step4_quatization as quant
+import step5_dpcm as dpcm
+import step6_run_length_huffman_encoding as rlh
+
+# Bytes of dequantized coefficients kept at once (per channel) across the quality axis
+MAX_BATCH_BYTES = 256 << 20
+
+class QualityResult(NamedTuple):
+    quality_factor: int
+    # Decoded RGB image, the same as decoder(encoder(image, quality_factor=...))
+    image: np.ndarray
+    # Bytes of the entropy coded channels, when requested
+    size: int | None
+
+def _reconstruct(coefficients: np.ndarray, quality_factors: list[int], block_size: int) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Quantizes one channel at every quality factor, dequantizes it and applies
+    the IDCT. Returns the quantized (Q, H, W) and reconstructed channels.
+    """
+    indices = [quality_factor - 1 for quality_factor in quality_factors]
+    matrices = quant.QUANTIZATION_MATRICES[indices][:, None, None]
+
+    # The same operations as quant.quantization and quant.iquantization, broadcast over the qualities
+    quantized = np.divide(to_blocks(coefficients, block_size), matrices)
+    np.rint(quantized, out=quantized)
+    dequantized = from_blocks(np.multiply(quantized, matrices, dtype=np.float32))
+
+    # The blocks are independent, so the qualities are stacked into one tall channel
+    n, h, w = dequantized.shape
+    reconstructed = dct.idct_blocks(dequantized.reshape(n * h, w), block_size=block_size).reshape(n, h, w)
+
+    return from_blocks(quantized).astype(np.int32), reconstructed
+
+def quality_sweep(
+    image: np.ndarray | None,
+    quality_factors: Iterable[int],
+    *,
+    downsampling: VALID_DOWNSAMPLES_TYPE = DEFAULT_DOWNSAMPLE,
+    interpolation: int | None = cv2.INTER_LINEAR,
+    block_size: int = 8,
+    entropy_coding: bool = False,
+    transformed: TransformedImage | None = None,
+    max_batch_bytes: int = MAX_BATCH_BYTES,
+) -> Iterator[QualityResult]:
+    """
+    Encodes and decodes an image at many quality factors, computing the
+    transform only once.
+
+    Padding, color conversion, downsampling and the DCT run once
+    (encoder.transform). Quantization, dequantization and the IDCT are then
+    vectorized over batches of quality factors; only the upsampling and color
+    conversion run once per quality factor. The images are the same as a
+    decoder(encoder(...)) round trip.
+
+    Args:
+        image (np.ndarray): RGB image. Not needed if transformed is given.
+        quality_factors (Iterable[int]): Quality factors, in the order of the results.
+        downsampling (str): Chroma downsampling.
+        interpolation (int): Interpolation used for the down and upsampling.
+        block_size (int): DCT block size.
+        entropy_coding (bool): Whether to also entropy code each quality to
+            report its size (the slowest step).
+        transformed (TransformedImage): Output of encoder.transform, to reuse it.
+        max_batch_bytes (int): Memory budget of each batch of quality factors.
+
+    Yields:
+        QualityResult: Decoded image (and size) of each quality factor.
+    """
+    quality_factors = [int(quality_factor) for quality_factor in quality_factors]
+    assert all(1 <= quality_factor <= 100 for quality_factor in quality_factors), f'Invalid quality_factors: {quality_factors}'
+
+    if transformed is None:
+        transformed = encoder.transform(image, downsampling=downsampling, interpolation=interpolation, block_size=block_size)
+
+    channels = transformed[:3]
+    size = tuple(transformed.image_shape[:2])
+
+    # Quantized (float64) and reconstructed (float32) copies of the luma channel
+    batch_size = max(1, max_batch_bytes // (12 * channels[0].size))
+
+    for first in range(0, len(quality_factors), batch_size):
+        batch = quality_factors[first:first + batch_size]
+        quantized, reconstructed = zip(*(_reconstruct(channel, batch, transformed.block_size) for channel in channels))
+
+        for i, quality_factor in enumerate(batch):
+            encoded_size = None
+            if entropy_coding:
+                encoded_size = sum(
+                    len(rlh.rle_and_huffman_encode(dpcm.dpcm_encode(channel[i], block_size=transformed.block_size), transformed.block_size).data)
+                    for channel in quantized
+                )
+
+            Y, Cb, Cr = (channel[i] for channel in reconstructed)
+            yield QualityResult(
+                quality_factor,
+                decoder.reconstruct_rgb(Y, Cb, Cr, size, downsampling=transformed.downsampling, interpolation=interpolation),
+                encoded_size,
+            )
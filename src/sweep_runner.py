@@ -0,0 +1,306 @@
+from bmp import read_image
+from common import IMAGES, QUALITIES, VALID_DOWNSAMPLES
+from concurrent.futures import Future, ProcessPoolExecutor, as_completed
+from itertools import product
+from sweep import quality_sweep
+from typing import Iterable, Iterator, NamedTuple
+import argparse
+import csv
+import cv2
+import io
+import json
+import os
+import step10_error_analysis as error_analysis
+import time
+
+INTERPOLATIONS = {
+    'nearest': cv2.INTER_NEAREST,
+    'linear': cv2.INTER_LINEAR,
+    'cubic': cv2.INTER_CUBIC,
+    'area': cv2.INTER_AREA,
+}
+OUTPUT_EXTENSIONS = ('.csv', '.jsonl')
+METRICS = ('mse', 'rmse', 'snr', 'psnr', 'max_diff', 'min_diff', 'avg_diff')
+FIELDS = ('image', 'quality_factor', 'downsampling', 'interpolation', 'size', 'bits_per_pixel', *METRICS, 'ssim', 'ms_ssim', 'seconds', 'error')
+# Types of the CSV columns that are not strings
+_FIELD_TYPES = {'quality_factor': int, 'size': int, 'bits_per_pixel': float, 'ssim': float, 'ms_ssim': float, 'seconds': float} | {metric: float for metric in METRICS}
+
+class SweepTask(NamedTuple):
+    image_path: str
+    downsampling: str
+    # Key of INTERPOLATIONS
+    interpolation: str
+    # Encoded together, so the transform of the image is computed once
+    quality_factors: tuple[int, ...]
+
+def _row_key(row: dict) -> tuple:
+    return row['image'], row['quality_factor'], row['downsampling'], row['interpolation']
+
+def sweep_tasks(
+    image_paths: Iterable[str],
+    quality_factors: Iterable[int],
+    downsamplings: Iterable[str],
+    interpolations: Iterable[str],
+    *,
+    qualities_per_task: int = 10,
+    done: frozenset[tuple] | set[tuple] = frozenset(),
+) -> list[SweepTask]:
+    """
+    Splits the (image, quality, downsampling, interpolation) grid into tasks.
+
+    Args:
+        image_paths (Iterable[str]): Images.
+        quality_factors (Iterable[int]): Quality factors.
+        downsamplings (Iterable[str]): Chroma downsamplings.
+        interpolations (Iterable[str]): Interpolations (keys of INTERPOLATIONS).
+        qualities_per_task (int): Maximum number of quality factors of a task.
+        done (set[tuple]): (image, quality_factor, downsampling, interpolation)
+            combinations to skip.
+
+    Returns:
+        list[SweepTask]: Tasks.
+    """
+    quality_factors = list(quality_factors)
+
+    tasks = []
+    for image_path, downsampling, interpolation in product(image_paths, downsamplings, interpolations):
+        assert downsampling in VALID_DOWNSAMPLES, f'Invalid downsampling: {downsampling}. Needs to be one of the following: {VALID_DOWNSAMPLES}'
+        assert interpolation in INTERPOLATIONS, f'Invalid interpolation: {interpolation}. Needs to be one of the following: {tuple(INTERPOLATIONS)}'
+
+        pending = [quality_factor for quality_factor in quality_factors if (image_path, quality_factor, downsampling, interpolation) not in done]
+        for first in range(0, len(pending), qualities_per_task):
+            tasks.append(SweepTask(image_path, downsampling, interpolation, tuple(pending[first:first + qualities_per_task])))
+
+    return tasks
+
+def _row(task: SweepTask, quality_factor: int, **values) -> dict:
+    row = dict.fromkeys(FIELDS)
+    row.update(image=task.image_path, quality_factor=quality_factor, downsampling=task.downsampling, interpolation=task.interpolation)
+    row.update(values)
+
+    return row
+
+def run_task(task: SweepTask, entropy_coding: bool = False) -> list[dict]:
+    """
+    Encodes and decodes an image at the quality factors of a task and measures
+    the error of each one.
+
+    Args:
+        task (SweepTask): Task.
+        entropy_coding (bool): Whether to also entropy code each quality to
+            report its size.
+
+    Returns:
+        list[dict]: A row (see FIELDS) per quality factor. If the task fails,
+            every row has the error and no metrics.
+    """
+    try:
+        image = read_image(task.image_path)
+        height, width = image.shape[:2]
+
+        rows = []
+        start = time.perf_counter()
+        for result in quality_sweep(image, task.quality_factors, downsampling=task.downsampling, interpolation=INTERPOLATIONS[task.interpolation], entropy_coding=entropy_coding):
+            metrics = error_analysis.calculate_error_metrics(image, result.image)
+
+            rows.append(_row(
+                task,
+                result.quality_factor,
+                size=result.size,
+                bits_per_pixel=None if result.size is None else 8 * result.size / (height * width),
+                ssim=error_analysis.calculate_ssim(image, result.image),
+                # Not defined for images smaller than the coarsest scale
+                ms_ssim=error_analysis.calculate_ms_ssim(image, result.image) if min(height, width) >= error_analysis.MS_SSIM_MIN_SIZE else None,
+                seconds=time.perf_counter() - start,
+                **{metric: float(metrics[metric]) for metric in METRICS},
+            ))
+            start = time.perf_counter()
+    except Exception as error:
+        return [_row(task, quality_factor, error=f'{type(error).__name__}: {error}') for quality_factor in task.quality_factors]
+
+    return rows
+
+class ResultWriter:
+    """
+    Appends result rows to a CSV or JSON lines file (chosen by its extension).
+
+    Each write is flushed to disk, so the rows written before a crash are kept.
+    """
+    def __init__(self, path: str, append: bool = True) -> None:
+        self.format = os.path.splitext(path)[1].lower()
+        assert self.format in OUTPUT_EXTENSIONS, f'Invalid output file: {path}. Needs one of the following extensions: {OUTPUT_EXTENSIONS}'
+
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        if append:
+            _drop_partial_line(path)
+        self.file = open(path, 'a' if append else 'w', newline='')
+
+        if self.format == '.csv':
+            self.writer = csv.DictWriter(self.file, FIELDS)
+            if self.file.tell() == 0:
+                self.writer.writeheader()
+
+    def write(self, rows: Iterable[dict]) -> None:
+        for row in rows:
+            if self.format == '.csv':
+                self.writer.writerow(row)
+            else:
+                self.file.write(json.dumps(row) + '\n')
+
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __enter__(self) -> 'ResultWriter':
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+def _drop_partial_line(path: str) -> None:
+    # A crash while writing can leave the last line incomplete
+    if not os.path.exists(path):
+        return
+
+    with open(path, 'rb+') as file:
+        data = file.read()
+        file.truncate(data.rfind(b'\n') + 1)
+
+def _parse_csv_row(row: dict) -> dict | None:
+    if None in row or any(row.get(field) is None for field in FIELDS):
+        return None
+
+    parsed = {}
+    for field in FIELDS:
+        value = row[field]
+        if value == '':
+            parsed[field] = None
+        elif field in _FIELD_TYPES:
+            try:
+                parsed[field] = _FIELD_TYPES[field](value)
+            except ValueError:
+                return None
+        else:
+            parsed[field] = value
+
+    return parsed
+
+def load_results(path: str) -> list[dict]:
+    """
+    Reads the rows of a result file (see ResultWriter), skipping incomplete ones.
+
+    Args:
+        path (str): CSV or JSON lines file.
+
+    Returns:
+        list[dict]: Rows, in the order they were written.
+    """
+    if not os.path.exists(path):
+        return []
+
+    with open(path, newline='') as file:
+        text = file.read()
+    # Without the last line if it is incomplete
+    text = text[:text.rfind('\n') + 1]
+
+    rows = []
+    if path.lower().endswith('.csv'):
+        for row in csv.DictReader(io.StringIO(text, newline='')):
+            row = _parse_csv_row(row)
+            if row is not None:
+                rows.append(row)
+    else:
+        for line in text.splitlines():
+            try:
+                rows.append(json.loads(line))
+            except json.JSONDecodeError:
+                continue
+
+    return rows
+
+def run_sweep(
+    image_paths: Iterable[str],
+    output_path: str,
+    *,
+    quality_factors: Iterable[int] = QUALITIES,
+    downsamplings: Iterable[str] = VALID_DOWNSAMPLES,
+    interpolations: Iterable[str] = ('linear',),
+    entropy_coding: bool = False,
+    workers: int | None = None,
+    qualities_per_task: int = 10,
+    resume: bool = True,
+) -> Iterator[dict]:
+    """
+    Measures the error of every (image, quality, downsampling, interpolation)
+    combination on a process pool, writing the rows to output_path as they finish.
+
+    The combinations of an image, downsampling and interpolation are grouped in
+    tasks of up to qualities_per_task quality factors, which share the transform
+    of the image (sweep.quality_sweep). Workers read the images themselves and
+    only return metrics; no figures are rendered. With resume, the combinations
+    already in output_path (without errors) are skipped, so an interrupted sweep
+    continues where it stopped.
+
+    Args:
+        image_paths (Iterable[str]): Images.
+        output_path (str): CSV (.csv) or JSON lines (.jsonl) file.
+        quality_factors (Iterable[int]): Quality factors.
+        downsamplings (Iterable[str]): Chroma downsamplings.
+        interpolations (Iterable[str]): Interpolations (keys of INTERPOLATIONS).
+        entropy_coding (bool): Whether to also entropy code each quality to
+            report its size.
+        workers (int): Number of processes (default: os.cpu_count()).
+        qualities_per_task (int): Maximum number of quality factors of a task.
+        resume (bool): Whether to keep the rows of output_path and skip them.
+            Otherwise the file is overwritten.
+
+    Yields:
+        dict: Row (see FIELDS) of each combination, in completion order.
+    """
+    done = {_row_key(row) for row in load_results(output_path) if row['error'] is None} if resume else set()
+    tasks = sweep_tasks(image_paths, quality_factors, downsamplings, interpolations, qualities_per_task=qualities_per_task, done=done)
+
+    futures: list[Future] = []
+    with ResultWriter(output_path, append=resume) as writer, ProcessPoolExecutor(workers) as executor:
+        try:
+            futures = [executor.submit(run_task, task, entropy_coding) for task in tasks]
+
+            for future in as_completed(futures):
+                rows = future.result()
+                writer.write(rows)
+                yield from rows
+        finally:
+            for future in futures:
+                future.cancel()
+
+def main():
+    parser = argparse.ArgumentParser(description="Error of every combination of images and encoding parameters")
+    parser.add_argument('output', help='Result file (.csv or .jsonl), appended to as combinations finish')
+    parser.add_argument('--images', nargs='+', default=IMAGES, help='Images')
+    parser.add_argument('--qualities', nargs='+', type=int, default=QUALITIES, help='Quality factors')
+    parser.add_argument('--downsampling', nargs='+', choices=VALID_DOWNSAMPLES, default=VALID_DOWNSAMPLES, help='Chroma downsamplings')
+    parser.add_argument('--interpolation', nargs='+', choices=tuple(INTERPOLATIONS), default=['linear'], help='Interpolations')
+    parser.add_argument('--entropy-coding', action='store_true', help='Also measure the encoded size (slower)')
+    parser.add_argument('--workers', type=int, default=None, help='Number of processes (default: number of CPUs)')
+    parser.add_argument('--qualities-per-task', type=int, default=10, help='Quality factors encoded together per image')
+    parser.add_argument('--no-resume', action='store_true', help='Overwrite the output instead of skipping the combinations in it')
+
+    args = parser.parse_args()
+
+    for row in run_sweep(
+        args.images,
+        args.output,
+        quality_factors=args.qualities,
+        downsamplings=args.downsampling,
+        interpolations=args.interpolation,
+        entropy_coding=args.entropy_coding,
+        workers=args.workers,
+        qualities_per_task=args.qualities_per_task,
+        resume=not args.no_resume,
+    ):
+        print(json.dumps(row), flush=True)
+
+if __name__ == '__main__':
+    main()
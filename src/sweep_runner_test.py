@@ -0,0 +1,64 @@
+from bmp import read_image
+from common import TEST_PARAMETERS
+import pytest
+import step10_error_analysis as error_analysis
+import sweep
+import sweep_runner
+
+quality_factors = [90, 50, 10]
+
+@pytest.mark.parametrize('extension', ('.csv', '.jsonl'))
+def test_run_sweep(tmp_path, extension):
+    output_path = str(tmp_path / f'results{extension}')
+    invalid_path = str(tmp_path / 'invalid.bmp')
+    (tmp_path / 'invalid.bmp').write_bytes(b'not a bmp')
+
+    rows = list(sweep_runner.run_sweep(
+        [TEST_PARAMETERS.image_path, invalid_path],
+        output_path,
+        quality_factors=quality_factors,
+        downsamplings=['4:2:2'],
+        entropy_coding=True,
+        workers=2,
+        qualities_per_task=2,
+    ))
+    assert len(rows) == 6
+
+    loaded = sweep_runner.load_results(output_path)
+    key = lambda row: (row['image'], row['quality_factor'])
+    assert sorted(loaded, key=key) == sorted(rows, key=key)
+
+    errors = [row for row in loaded if row['error'] is not None]
+    assert [row['image'] for row in errors] == [invalid_path] * 3
+
+    image = read_image(TEST_PARAMETERS.image_path)
+    results = sweep.quality_sweep(image, quality_factors, downsampling='4:2:2', entropy_coding=True)
+    for result in results:
+        row = next(row for row in loaded if key(row) == (TEST_PARAMETERS.image_path, result.quality_factor))
+        metrics = error_analysis.calculate_error_metrics(image, result.image)
+
+        assert row['size'] == result.size
+        assert row['psnr'] == pytest.approx(metrics['psnr'])
+        assert row['mse'] == pytest.approx(metrics['mse'])
+        assert row['ssim'] == pytest.approx(error_analysis.calculate_ssim(image, result.image))
+        assert 0 < row['ms_ssim'] <= 1
+
+def test_run_sweep_resume(tmp_path):
+    output_path = tmp_path / 'results.csv'
+    parameters = dict(quality_factors=quality_factors, downsamplings=['4:2:0'], workers=1, qualities_per_task=1)
+
+    rows = list(sweep_runner.run_sweep([TEST_PARAMETERS.image_path], str(output_path), **parameters))
+    assert len(rows) == 3
+
+    # Interrupted while writing the last row
+    text = output_path.read_text()
+    output_path.write_text(text[:text.rstrip().rfind('\n') + 10])
+    assert len(sweep_runner.load_results(str(output_path))) == 2
+
+    rows = list(sweep_runner.run_sweep([TEST_PARAMETERS.image_path], str(output_path), **parameters))
+    assert len(rows) == 1
+
+    loaded = sweep_runner.load_results(str(output_path))
+    assert sorted(row['quality_factor'] for row in loaded) == sorted(quality_factors)
+
+    assert list(sweep_runner.run_sweep([TEST_PARAMETERS.image_path], str(output_path), **parameters)) == []
@@ -0,0 +1,24 @@
+from common import TEST_PARAMETERS
+from matplotlib import pyplot as plt
+import decoder
+import encoder
+import numpy as np
+import pytest
+import sweep
+
+image = plt.imread(TEST_PARAMETERS.image_path)[:301, :257]
+
+@pytest.mark.parametrize('downsampling', ('4:2:0', '4:2:2'))
+def test_quality_sweep(downsampling):
+    quality_factors = [90, 1, 50, 75, 100]
+
+    # A small budget, so the qualities are split into batches
+    results = list(sweep.quality_sweep(image, quality_factors, downsampling=downsampling, entropy_coding=True, max_batch_bytes=1 << 20))
+    assert [result.quality_factor for result in results] == quality_factors
+
+    for result in results:
+        encoded_data, _ = encoder.encoder(image, downsampling=downsampling, quality_factor=result.quality_factor)
+        expected, _ = decoder.decoder(encoded_data)
+
+        assert np.array_equal(result.image, expected), result.quality_factor
+        assert result.size == sum(len(channel.data) for channel in (encoded_data.Y_huffman, encoded_data.Cb_huffman, encoded_data.Cr_huffman))
@@ -0,0 +1,82 @@
+from common import from_blocks, to_blocks
+from encoder import JpegEncodedData
+import numpy as np
+import step4_quatization as quant
+import step5_dpcm as dpcm
+import step6_run_length_huffman_encoding as rlh
+
+def requantize(
+    quantized: np.ndarray,
+    source_matrix: np.ndarray,
+    target_matrix: np.ndarray,
+    block_size: int = 8,
+) -> np.ndarray:
+    """
+    Requantizes the coefficients of one channel from one quantization matrix to another.
+
+    Equivalent to quant.iquantization followed by quant.quantization, in one pass.
+
+    Args:
+        quantized (np.ndarray): Quantized channel (after inverse DPCM).
+        source_matrix (np.ndarray): Quantization matrix the channel was quantized with.
+        target_matrix (np.ndarray): Quantization matrix to quantize with.
+        block_size (int): Block size.
+
+    Returns:
+        np.ndarray: Requantized channel (int32).
+    """
+    ratio = np.asarray(source_matrix, dtype=np.float64) / np.asarray(target_matrix, dtype=np.float64)
+
+    return from_blocks(np.rint(to_blocks(quantized, block_size) * ratio).astype(np.int32))
+
+def transcode(
+    encoded_data: JpegEncodedData,
+    quality_factor: int,
+    *,
+    rle_and_huffman: bool | None = None,
+) -> JpegEncodedData:
+    """
+    Changes the quality factor of an encoded image without decoding it.
+
+    The coefficients are dequantized and quantized again with the tables of
+    quality_factor, which skips the IDCT, upsampling, color conversion,
+    downsampling and DCT of a decoder/encoder round trip and the rounding
+    errors they add. Transcoding to a higher quality does not recover detail.
+
+    Args:
+        encoded_data (JpegEncodedData): Encoded image.
+        quality_factor (int): Quality factor of the result.
+        rle_and_huffman (bool): Whether to entropy code the result. Defaults to
+            the representation of encoded_data.
+
+    Returns:
+        JpegEncodedData: Encoded image at quality_factor.
+    """
+    assert 1 <= quality_factor <= 100, f'Invalid quality_factor: {quality_factor}'
+
+    if rle_and_huffman is None:
+        rle_and_huffman = encoded_data.Y_huffman is not None
+
+    block_size = encoded_data.block_size
+    restart_interval = encoded_data.restart_interval
+    target_matrix = quant.get_quantization_matrix(quality_factor)
+
+    channels = {}
+    for name, channel, source_matrix in zip(('Y', 'Cb', 'Cr'), encoded_data.dpcm_channels(), encoded_data.get_quantization_matrices()):
+        quantized = requantize(dpcm.dpcm_decode(channel, block_size=block_size, restart_interval=restart_interval), source_matrix, target_matrix, block_size)
+        dpcm_channel = dpcm.dpcm_encode(quantized, block_size=block_size, restart_interval=restart_interval)
+
+        if rle_and_huffman:
+            channels[f'{name}_huffman'] = rlh.rle_and_huffman_encode(dpcm_channel, block_size=block_size, restart_interval=restart_interval)
+        else:
+            channels[f'{name}_dpcm'] = dpcm_channel
+
+    return JpegEncodedData(
+        **channels,
+        quality_factor=quality_factor,
+        downsampling=encoded_data.downsampling,
+        block_size=block_size,
+        image_shape=encoded_data.original_image_shape,
+        level_shift=encoded_data.level_shift,
+        restart_interval=restart_interval,
+    )
@@ -0,0 +1,30 @@
+from common import TEST_PARAMETERS
+from matplotlib import pyplot as plt
+import decoder
+import encoder
+import numpy as np
+import pytest
+import transcoder
+
+image = plt.imread(TEST_PARAMETERS.image_path)
+
+@pytest.mark.parametrize('rle_and_huffman', (True, False))
+def test_transcode(rle_and_huffman):
+    encoded_data, _ = encoder.encoder(image, quality_factor=90, rle_and_huffman=rle_and_huffman)
+    transcoded = transcoder.transcode(encoded_data, 50)
+
+    assert transcoded.quality_factor == 50
+    assert (transcoded.Y_huffman is not None) == rle_and_huffman
+
+    # Close to encoding the original image at the target quality directly
+    direct, _ = decoder.decoder(encoder.encoder(image, quality_factor=50)[0])
+    decoded, _ = decoder.decoder(transcoded)
+
+    assert decoded.shape == image.shape
+    assert np.abs(decoded.astype(int) - direct).mean() < 2
+
+def test_requantize_same_matrix_is_identity():
+    quant_matrix = transcoder.quant.get_quantization_matrix(TEST_PARAMETERS.quality_factor)
+    quantized = np.random.default_rng(0).integers(-100, 100, size=(32, 48))
+
+    assert np.array_equal(transcoder.requantize(quantized, quant_matrix, quant_matrix), quantized)